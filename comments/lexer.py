@@ -73,6 +73,23 @@ class Lex:
             self.text[self.pos.index - 1] if self.pos.index <= len(self.text) else None
         )
 
+    def skip_to(self, index):
+        # Jump straight to text[index] instead of iterating over every character
+        self.pos.col += index - (self.pos.index - 1)
+        self.pos.index = index
+        self.iterate()
+
+    def skip_comment(self):
+        start = self.pos.index - 1
+        if self.text.startswith("//", start):
+            # Line comment: stop at the newline so it still ends the statement
+            end = self.text.find("\n", start + 2)
+            self.skip_to(len(self.text) if end == -1 else end)
+        else:
+            # Block comment: an unterminated one runs to the end of the file
+            end = self.text.find("*/", start + 2)
+            self.skip_to(len(self.text) if end == -1 else end + 2)
+
     def create_token(self):
         while self.current is not None:
             if self.current in " \t":
@@ -99,8 +116,11 @@ class Lex:
                 self.tokens.append(Token(TT_MUL, "*", start=self.pos))
                 self.iterate()
             elif self.current == "/":
-                self.tokens.append(Token(TT_DIV, "/", start=self.pos))
-                self.iterate()
+                if self.text.startswith(("//", "/*"), self.pos.index - 1):
+                    self.skip_comment()
+                else:
+                    self.tokens.append(Token(TT_DIV, "/", start=self.pos))
+                    self.iterate()
             elif self.current in DIGITS:
                 self.tokens.append(self.create_number())
             elif self.current == '"':
@@ -0,0 +1,974 @@
+"""
+Benchmarks for the SimplyLang toolchain.
+
+Usage:
+    python benchmark.py tokens [FILE]
+    python benchmark.py lex [--stage DIR] [--engine NAME] [--mix MIX]
+                            [--size BYTES] [--output JSON] [--baseline JSON]
+    python benchmark.py comments [--stage DIR] [--lines N]
+    python benchmark.py parse [--statements N] [--sample N] [--output JSON]
+                              [--baseline JSON]
+    python benchmark.py nodes [--statements N] [--output JSON] [--baseline JSON]
+    python benchmark.py functions [--functions N]
+    python benchmark.py nesting [--depth N]
+    python benchmark.py constants [--iterations N]
+    python benchmark.py deadcode [--functions N] [--called N]
+    python benchmark.py dispatch [--iterations N]
+    python benchmark.py engines [--iterations N]
+    python benchmark.py tiers [--iterations N] [--functions N] [--threshold N]
+
+`lex` runs a stage's lexer over synthetic corpora and reports tokens/sec,
+MB/sec, the peak memory allocated during one run and retained allocations
+per token. Results can be saved
+as JSON and compared against a stored baseline.
+
+`comments` lexes the same program padded with more and more comment text;
+comment bodies are skipped in bulk, so the time should barely move.
+
+`parse` times this stage's parser on a generated program (one million
+statements by default) and counts the objects it constructs per statement
+on a smaller sample.
+
+`nodes` reports the memory a parsed AST retains per node, counting the
+tokens the nodes keep alive, and the time the tree walker takes per node to
+run it, which is where deriving positions from tokens costs time.
+
+`functions` times parsing and resolving a script made of many helper
+functions, only one of which is called, with eager and pre-parsed bodies.
+
+`nesting` parses, resolves and runs loops and functions nested thousands
+of levels deep.
+
+`constants` runs a loop full of literal arithmetic and show(...) calls with
+and without the optimizer, reporting time and objects built per iteration.
+
+`deadcode` prunes a generated program where most functions are never called
+and every body has code after its return, reporting nodes removed, cached
+AST size and run time.
+
+`dispatch` runs a tight till loop with the interpreter's per-class handler
+table and with the old name-based lookup, reporting the cost per node.
+
+`engines` runs loop-heavy scripts on each execution engine: the tree
+walker, the closure compiler, the bytecode VM and the generated Python
+code, whose time includes generating and compiling it.
+
+`tiers` runs a hot call loop and a script of functions called once each on
+the tree walker, with and without tiered compilation, and reports what was
+compiled and how long compiling took.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import pickle
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from types import GeneratorType
+
+import closure
+import codegen
+import interpreter
+import lexer
+import optimizer
+import parser
+import resolver
+import tiering
+import vm
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(build):
+    """Return (result, bytes still allocated by build() once it returns)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def bench_tokens(filename):
+    with open(filename) as f:
+        text = f.read()
+
+    tokens, token_bytes = measure(
+        lambda: lexer.TableLex(text, filename).create_token()[0]
+    )
+    buffer, buffer_bytes = measure(
+        lambda: lexer.TokenBuffer.from_tokens(lexer.TableLex(text, filename).tokenize())
+    )
+    count = len(tokens)
+    print(f"{filename}: {count} tokens")
+    print(f"  Token objects: {token_bytes / count:8.1f} bytes/token")
+    print(f"  TokenBuffer:   {buffer_bytes / len(buffer):8.1f} bytes/token")
+
+
+# Synthetic corpora
+
+
+def name(rng):
+    return rng.choice("abcdefghijklmnopqrstuvwxyz") + f"{rng.randrange(1000)}"
+
+
+def identifier_lines(rng):
+    yield f"{name(rng)} is {name(rng)} .\n"
+    yield f"show({name(rng)}, {name(rng)}, {name(rng)}) .\n"
+
+
+def string_lines(rng):
+    words = " ".join(
+        rng.choice(("lorem", "ipsum", "dolor", "sit", "amet")) for _ in range(12)
+    )
+    yield f'{name(rng)} is "{words}" .\n'
+    yield f'show("{words}", "{words}") .\n'
+
+
+def number_lines(rng):
+    yield f"{name(rng)} is {rng.randrange(10**6)} + {rng.random() * 1000:.4f} .\n"
+    yield f"{name(rng)} is {rng.randrange(100)} < {rng.randrange(100)} .\n"
+
+
+def block_lines(rng, depth=8):
+    yield f"{name(rng)} takes {name(rng)}, {name(rng)} does\n"
+    for level in range(1, depth):
+        yield "    " * level + f"till {name(rng)} < {rng.randrange(100)} do\n"
+    yield "    " * depth + f"show({name(rng)})\n"
+    for level in range(depth - 1, 0, -1):
+        yield "    " * level + ".\n"
+    yield ".\n"
+
+
+MIXES = {
+    "identifiers": [identifier_lines],
+    "strings": [string_lines],
+    "numbers": [number_lines],
+    "blocks": [block_lines],
+    "mixed": [identifier_lines, string_lines, number_lines, block_lines],
+}
+
+
+def generate_corpus(mix, size, seed=0):
+    """Return roughly `size` characters of SimplyLang drawn from `mix`."""
+    rng = random.Random(seed)
+    producers = MIXES[mix]
+    parts = []
+    length = 0
+    while length < size:
+        for line in rng.choice(producers)(rng):
+            parts.append(line)
+            length += len(line)
+    return "".join(parts)
+
+
+# Lexer throughput
+
+
+def load_lexer(stage):
+    """Import `lexer.py` from a stage directory under a unique module name."""
+    path = os.path.join(stage, "lexer.py")
+    stage_name = os.path.basename(os.path.abspath(stage)).replace("-", "_")
+    spec = importlib.util.spec_from_file_location("bench_lexer_" + stage_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def lex_once(module, engine, text):
+    engines = getattr(module, "ENGINES", {"classic": module.Lex})
+    tokens, _ = engines[engine](text, "<bench>").create_token()
+    return tokens
+
+
+def bench_lexer(module, engine, mix, size, repeat=3):
+    text = generate_corpus(mix, size)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = lex_once(module, engine, text)
+        best = min(best, time.perf_counter() - start)
+        count = len(tokens)
+        del tokens
+
+    # Blocks still allocated while the tokens are alive, per token
+    blocks_before = sys.getallocatedblocks()
+    tokens = lex_once(module, engine, text)
+    blocks = sys.getallocatedblocks() - blocks_before
+    del tokens
+
+    # Peak of this run alone, untimed as tracing slows allocation down
+    tracemalloc.start()
+    try:
+        lex_once(module, engine, text)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "engine": engine,
+        "mix": mix,
+        "size": len(text),
+        "tokens": count,
+        "seconds": best,
+        "tokens_per_sec": count / best,
+        "mb_per_sec": len(text) / best / 1e6,
+        "peak_mb": peak / 1e6,
+        "allocations_per_token": blocks / count,
+    }
+
+
+def compare(results, baseline):
+    by_key = {(r["stage"], r["engine"], r["mix"], r["size"]): r for r in baseline}
+    for result in results:
+        key = (result["stage"], result["engine"], result["mix"], result["size"])
+        old = by_key.get(key)
+        if old is None:
+            continue
+        speedup = result["tokens_per_sec"] / old["tokens_per_sec"]
+        print(
+            f"  {result['mix']:<12} {result['engine']:<8} {speedup:6.2f}x vs baseline"
+        )
+
+
+def commented_corpus(lines, ratio, seed=0):
+    """Return `lines` statements carrying `ratio` times their size in comments."""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(lines):
+        for line in identifier_lines(rng):
+            padding = "x" * (len(line) * ratio)
+            if rng.random() < 0.5:
+                parts.append(f"{line[:-1]} // {padding}\n")
+            else:
+                parts.append(f"/* {padding}\n{padding} */ {line}")
+    return "".join(parts)
+
+
+def bench_comments(args):
+    module = load_lexer(args.stage or os.path.join(HERE, "..", "comments"))
+
+    print(f"{'ratio':>6} {'MB':>8} {'seconds':>9} {'tokens':>9}")
+    for ratio in (0, 1, 4, 16, 64):
+        text = commented_corpus(args.lines, ratio)
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            tokens = lex_once(module, "classic", text)
+            best = min(best, time.perf_counter() - start)
+        print(f"{ratio:>5}x {len(text) / 1e6:8.2f} {best:9.3f} {len(tokens):9}")
+
+
+def bench_lex(args):
+    stage = args.stage or HERE
+    module = load_lexer(stage)
+    engines = args.engine or list(getattr(module, "ENGINES", {"classic": None}))
+    mixes = args.mix or list(MIXES)
+
+    results = []
+    print(
+        f"{'mix':<12} {'engine':<8} {'tokens/s':>12} "
+        f"{'MB/s':>8} {'peak MB':>8} {'allocs/tok':>10}"
+    )
+    for mix in mixes:
+        for engine in engines:
+            result = bench_lexer(module, engine, mix, args.size)
+            result["stage"] = os.path.basename(os.path.abspath(stage))
+            results.append(result)
+            print(
+                f"{mix:<12} {engine:<8} {result['tokens_per_sec']:12.0f} "
+                f"{result['mb_per_sec']:8.2f} {result['peak_mb']:8.1f} "
+                f"{result['allocations_per_token']:10.2f}"
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+# Parser throughput
+
+
+def statement_lines(count, seed=0):
+    """Yield `count` valid statements over a growing set of variables."""
+    rng = random.Random(seed)
+    defined = ["v0"]
+    yield "v0 is 1 .\n"
+    for index in range(1, count):
+        a, b, c = (rng.choice(defined) for _ in range(3))
+        kind = rng.randrange(4)
+        if kind == 2:
+            yield f'show("{a}", {a}, -{b}) .\n'
+            continue
+        if kind == 0:
+            yield f"v{index} is {a} + {b} * ({c} - {rng.randrange(100)}) .\n"
+        elif kind == 1:
+            yield f"v{index} is {a} < {b} equals {c} > 2 .\n"
+        else:
+            yield f"v{index} is {rng.randrange(1000)} .\n"
+        defined.append(f"v{index}")
+
+
+def parse_buffer(buffer):
+    return parser.Parser(buffer).parse()
+
+
+def count_constructions(run):
+    """Run `run()` and return how many __init__ calls it made."""
+    count = 0
+
+    def profile(frame, event, arg):
+        nonlocal count
+        if event == "call" and frame.f_code.co_name == "__init__":
+            count += 1
+
+    sys.setprofile(profile)
+    try:
+        run()
+    finally:
+        sys.setprofile(None)
+    return count
+
+
+def bench_parse(args):
+    text = "".join(statement_lines(args.statements))
+    # Compact tokens keep a million-statement program within memory
+    buffer = lexer.TokenBuffer.from_tokens(lexer.TableLex(text, "<bench>").tokenize())
+
+    start = time.perf_counter()
+    result = parse_buffer(buffer)
+    seconds = time.perf_counter() - start
+    if result.error:
+        raise SystemExit(f"parse failed: {result.error.msg}")
+    del result
+
+    sample = "".join(statement_lines(args.sample))
+    sample_buffer = lexer.TokenBuffer.from_tokens(
+        lexer.TableLex(sample, "<bench>").tokenize()
+    )
+    objects = count_constructions(lambda: parse_buffer(sample_buffer))
+
+    result = {
+        "statements": args.statements,
+        "seconds": seconds,
+        "statements_per_sec": args.statements / seconds,
+        "objects_per_statement": objects / args.sample,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(
+        f"{args.statements} statements in {seconds:.2f}s "
+        f"({result['statements_per_sec']:.0f}/s), "
+        f"{result['objects_per_statement']:.2f} objects/statement, "
+        f"peak RSS {result['peak_rss_mb']:.0f} MB"
+    )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            old = json.load(f)
+        print(
+            f"  {old['seconds'] / seconds:.2f}x faster, "
+            f"{old['objects_per_statement'] / result['objects_per_statement']:.2f}x "
+            "fewer objects than baseline"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+# AST memory
+
+CHILD_FIELDS = (
+    "statements",
+    "body",
+    "value_node",
+    "condition_expr",
+    "left",
+    "right",
+    "node",
+)
+
+
+def count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if type(node).__module__ != parser.__name__:
+            continue  # tokens and raw strings
+        count += 1
+        for field in CHILD_FIELDS:
+            child = getattr(node, field, None)
+            if isinstance(child, list):
+                stack.extend(child)
+            elif child is not None:
+                stack.append(child)
+    return count
+
+
+def parse_objects(text):
+    return parser.Parser(lexer.TableLex(text, "<bench>").tokenize()).parse().node
+
+
+def parse_compact(text):
+    tokens = lexer.TokenBuffer.from_tokens(lexer.TableLex(text, "<bench>").tokenize())
+    return parser.Parser(tokens).parse().node, tokens
+
+
+def parse_arena(text):
+    return parser.NodeArena.from_tree(*parse_compact(text))
+
+
+# How bench_nodes stores the tree: node objects over Token objects, node
+# objects over a TokenBuffer, or a NodeArena over a TokenBuffer
+NODE_MODES = {"objects": parse_objects, "compact": parse_compact, "arena": parse_arena}
+
+
+def bench_nodes(args):
+    text = "".join(statement_lines(args.statements))
+    result = {"statements": args.statements}
+    for mode, build in NODE_MODES.items():
+        stored, stored_bytes = measure(lambda: build(text))
+        if mode == "objects":
+            tree = stored
+            count = count_nodes(tree)
+            result["nodes"] = count
+        result[f"{mode}_bytes_per_node"] = stored_bytes / count
+        del stored
+    result["bytes_per_node"] = result["objects_bytes_per_node"]
+    start = time.perf_counter()
+    run_quietly(interpreter.Interpreter(), tree)
+    seconds = time.perf_counter() - start
+    result["run_us_per_node"] = seconds / count * 1e6
+    print(f"{args.statements} statements, {count} nodes:")
+    for mode in NODE_MODES:
+        print(f"  {mode:8} {result[f'{mode}_bytes_per_node']:.1f} bytes/node")
+    print(f"  {result['run_us_per_node']:.2f} us/node to run")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            old = json.load(f)
+        saved = 1 - result["bytes_per_node"] / old["bytes_per_node"]
+        print(f"  {saved:.0%} smaller than baseline")
+        if "run_us_per_node" in old:
+            slower = result["run_us_per_node"] / old["run_us_per_node"]
+            print(f"  {slower:.2f}x the baseline's run time")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+# Lazy function bodies
+
+
+def helper_lines(count):
+    """Yield `count` helper functions, then a single call to the first."""
+    yield "g is 1 .\n"
+    for index in range(count):
+        yield f"helper{index} takes a, b does\n"
+        yield "    x is a + b * g\n"
+        yield "    till x < 100 do\n"
+        yield "        x is x + (a - b) * 2\n"
+        yield '        show("step", x, -a)\n'
+        yield "    .\n"
+        yield "    y is x equals 100\n"
+        yield '    show("done", x, y)\n'
+        yield "    return x\n"
+        yield ".\n"
+    yield "r is helper0(g, 2) .\n"
+
+
+def startup(tokens, lazy):
+    start = time.perf_counter()
+    tree = parser.Parser(tokens, lazy).parse().node
+    error = resolver.resolve(tree)
+    if error is not None:
+        raise SystemExit(f"resolve failed: {error.msg}")
+    return time.perf_counter() - start
+
+
+def bench_functions(args):
+    text = "".join(helper_lines(args.functions))
+    tokens, _ = lexer.TableLex(text, "<bench>").create_token()
+    eager = min(startup(tokens, False) for _ in range(3))
+    lazy = min(startup(tokens, True) for _ in range(3))
+    print(f"{args.functions} helper functions, parse and resolve only")
+    print(f"  eager bodies:      {eager:.3f}s")
+    print(f"  pre-parsed bodies: {lazy:.3f}s ({eager / lazy:.2f}x faster)")
+
+
+# Deep nesting
+
+
+# Lines are left unindented: indenting each level would make the source
+# grow with the square of the depth
+
+
+def nested_loops(depth):
+    """Return `depth` nested till loops; the innermost ends all of them."""
+    lines = ["c is 0 .\n"]
+    lines += ["till c < 1 do\n"] * depth
+    lines.append("c is c + 1\n")
+    lines += [".\n"] * depth
+    lines.append("show(c) .\n")
+    return "".join(lines)
+
+
+def nested_functions(depth):
+    """Return `depth` nested functions, each defining and calling the next."""
+    lines = [f"f{level} takes a does\n" for level in range(depth)]
+    lines.append("show(a)\n")
+    for level in reversed(range(depth)):
+        if level + 1 < depth:
+            lines.append(f"f{level + 1}(a)\n")
+        lines.append(".\n")
+    lines.append("f0(1)\n")
+    return "".join(lines)
+
+
+def run_program(text):
+    """Parse, resolve and evaluate `text`, returning the time of each phase."""
+    tokens, _ = lexer.TableLex(text, "<bench>").create_token()
+    start = time.perf_counter()
+    result = parser.Parser(tokens).parse()
+    if result.error:
+        raise SystemExit(f"parse failed: {result.error.msg}")
+    parsed = time.perf_counter()
+    error = resolver.resolve(result.node)
+    if error is not None:
+        raise SystemExit(f"resolve failed: {error.msg}")
+    resolved = time.perf_counter()
+    outcome = interpreter.Interpreter().visit(result.node)
+    if outcome.error:
+        raise SystemExit(f"run failed: {outcome.error.msg}")
+    return parsed - start, resolved - parsed, time.perf_counter() - resolved
+
+
+def bench_nesting(args):
+    print(f"depth {args.depth} (recursion limit {sys.getrecursionlimit()})")
+    for kind, build in (("till", nested_loops), ("does", nested_functions)):
+        parse, resolve, run = run_program(build(args.depth))
+        print(
+            f"  {kind:<5} parse {parse:.3f}s  resolve {resolve:.3f}s  "
+            f"run {run:.3f}s"
+        )
+
+
+# Constant folding
+
+
+def literal_loop(iterations):
+    """Return a loop whose body is mostly constant expressions."""
+    return (
+        "t is 0 .\n"
+        f"repeat {iterations} times\n"
+        "x is 2 + 3 * 4\n"
+        "y is -(10 - 4) / 2\n"
+        "t is t + 1\n"
+        'show("tick", 1 + 2, "of", 7 > 3)\n'
+        ".\n"
+    )
+
+
+def prepare(tokens, optimize, tiers=None):
+    """Parse and resolve `tokens`, then fold them if asked to."""
+    # The repeat parser traces each statement it adds
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        tree = parser.Parser(tokens).parse().node
+    resolver.resolve(tree)
+    evaluator = interpreter.Interpreter(tiers)
+    if optimize:
+        tree = optimizer.optimize(tree, evaluator)
+    return evaluator, tree
+
+
+def run_quietly(evaluator, tree):
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        outcome = evaluator.visit(tree)
+    if outcome.error:
+        raise SystemExit(f"run failed: {outcome.error.msg}")
+
+
+def bench_constants(args):
+    tokens, _ = lexer.TableLex(literal_loop(args.iterations), "<bench>").create_token()
+    sample, _ = lexer.TableLex(literal_loop(100), "<bench>").create_token()
+    print(f"{args.iterations} iterations of a literal-heavy loop body")
+    for label, optimize in (("plain", False), ("folded", True)):
+        evaluator, tree = prepare(tokens, optimize)
+        start = time.perf_counter()
+        run_quietly(evaluator, tree)
+        elapsed = time.perf_counter() - start
+        # Objects built by the loop itself, after any folding
+        evaluator, tree = prepare(sample, optimize)
+        built = count_constructions(lambda: run_quietly(evaluator, tree))
+        print(
+            f"  {label:<6} {elapsed:.3f}s  {built / 100:.1f} objects/iteration"
+            f"  {len(evaluator.constants)} pooled constants"
+        )
+
+
+# Dead code elimination
+
+
+def dead_code_program(functions, called):
+    """Return `functions` helpers, the first `called` of them called."""
+    lines = ["g is 1 .\n"]
+    for index in range(functions):
+        lines.append(f"helper{index} takes a, b does\n")
+        lines.append("    x is a + b * g\n")
+        lines.append("    till 1 > 2 do\n")
+        lines.append('        show("never", x)\n')
+        lines.append("    .\n")
+        lines.append('    show("step", x)\n')
+        lines.append("    return x\n")
+        lines.append('    show("unreachable", x)\n')
+        lines.append("    y is x + 1\n")
+        lines.append(".\n")
+    lines += [f"r{index} is helper{index}(g, 2) .\n" for index in range(called)]
+    return "".join(lines)
+
+
+def bench_deadcode(args):
+    tokens, _ = lexer.TableLex(
+        dead_code_program(args.functions, args.called), "<bench>"
+    ).create_token()
+    print(f"{args.functions} helper functions, {args.called} called")
+    for label, prune in (("plain", False), ("pruned", True)):
+        tree = parser.Parser(tokens).parse().node
+        resolver.resolve(tree)
+        removed = optimizer.eliminate_dead_code(tree) if prune else 0
+        nodes = optimizer.count_nodes(tree)
+        size = len(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+        evaluator = interpreter.Interpreter()
+        folding = optimizer.Optimizer(evaluator)
+        tree = folding.optimize(tree)
+        start = time.perf_counter()
+        run_quietly(evaluator, tree)
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {label:<6} {nodes} nodes ({removed} pruned)  "
+            f"cached AST {size / 1e6:.2f} MB  run {elapsed:.3f}s"
+        )
+
+
+# Visitor dispatch
+
+
+class NameDispatch(interpreter.Interpreter):
+    """The interpreter as it used to dispatch: a method name per node."""
+
+    def visit(self, node):
+        result = self.dispatch(node)
+        if not isinstance(result, GeneratorType):
+            return result
+        stack = [result]
+        value = None
+        while True:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                if not stack:
+                    return value
+                continue
+            result = self.dispatch(child)
+            if isinstance(result, GeneratorType):
+                stack.append(result)
+                value = None
+            else:
+                value = result
+
+    def dispatch(self, node):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+
+class RecordingDispatch(NameDispatch):
+    def __init__(self):
+        super().__init__()
+        self.dispatched = []
+
+    def dispatch(self, node):
+        self.dispatched.append(node)
+        return super().dispatch(node)
+
+
+def lookup_cost(evaluator, nodes):
+    """Time finding (not calling) the visit method for each of `nodes`."""
+    start = time.perf_counter()
+    for node in nodes:
+        getattr(evaluator, f"visit_{type(node).__name__}", evaluator.no_visit_method)
+    by_name = time.perf_counter() - start
+    handlers = evaluator.handlers
+    start = time.perf_counter()
+    for node in nodes:
+        handlers.get(type(node)) or evaluator.handler(type(node))
+    return by_name, time.perf_counter() - start
+
+
+def tight_loop(iterations):
+    return f"i is 0 .\ntill i < {iterations} do\ni is i + 1\n.\n"
+
+
+def bench_dispatch(args):
+    tokens, _ = lexer.TableLex(tight_loop(args.iterations), "<bench>").create_token()
+    tree = parser.Parser(tokens).parse().node
+    resolver.resolve(tree)
+    recorder = RecordingDispatch()
+    recorder.visit(tree)
+    nodes = len(recorder.dispatched)
+    print(f"till loop, {args.iterations} iterations, {nodes} nodes")
+    timings = {}
+    for label, engine in (
+        ("by name", NameDispatch),
+        ("by class", interpreter.Interpreter),
+    ):
+        runs = []
+        for _ in range(3):
+            evaluator = engine()
+            start = time.perf_counter()
+            evaluator.visit(tree)
+            runs.append(time.perf_counter() - start)
+        timings[label] = min(runs)
+        per_node = timings[label] / nodes * 1e9
+        print(f"  {label:<8} {timings[label]:.3f}s  {per_node:.0f} ns/node")
+    print(f"  {timings['by name'] / timings['by class']:.2f}x faster")
+    by_name, by_class = lookup_cost(interpreter.Interpreter(), recorder.dispatched)
+    print(
+        f"  lookup alone: {by_name / nodes * 1e9:.0f} ns/node by name, "
+        f"{by_class / nodes * 1e9:.0f} ns/node by class"
+    )
+
+
+# Execution engines
+
+
+def call_loop(iterations):
+    """Return a loop that calls a small function on every iteration."""
+    return (
+        "step takes n does\n"
+        "    m is n * 2 - n\n"
+        "    return m\n"
+        ".\n"
+        "i is 0 .\n"
+        f"till i < {iterations} do\n"
+        "i is i + 1\n"
+        "j is step(i)\n"
+        ".\n"
+    )
+
+
+def run_engine(tokens, engine):
+    """Fold `tokens`' program and time running it on `engine`."""
+    evaluator, tree = prepare(tokens, True)
+    evaluator.optimizer = optimizer.Optimizer(evaluator)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        if engine == "closure":
+            compiler = closure.Compiler(evaluator.constants, evaluator.optimizer)
+            outcome = compiler.run(tree)
+        elif engine == "vm":
+            outcome = vm.VM(evaluator.constants, evaluator.optimizer).run(tree)
+        elif engine == "python":
+            program = codegen.Transpiler(evaluator.constants).transpile(tree, "<bench>")
+            outcome = program.run()
+        else:
+            outcome = evaluator.visit(tree)
+    if outcome.error:
+        raise SystemExit(f"run failed: {outcome.error.msg}")
+    return time.perf_counter() - start
+
+
+def bench_engines(args):
+    programs = (
+        ("till loop", tight_loop(args.iterations)),
+        ("literal loop", literal_loop(args.iterations)),
+        ("call loop", call_loop(args.iterations)),
+        ("nested loops", nested_loops(200).replace("c < 1", f"c < {args.iterations}")),
+    )
+    print(f"{args.iterations} iterations per script, best of 3")
+    for label, text in programs:
+        tokens, _ = lexer.TableLex(text, "<bench>").create_token()
+        timings = [
+            min(run_engine(tokens, engine) for _ in range(3))
+            for engine in interpreter.ENGINES
+        ]
+        tree = timings[0]
+        print(
+            f"  {label:<12} "
+            + "  ".join(
+                f"{engine} {elapsed:.3f}s ({tree / elapsed:.2f}x)"
+                for engine, elapsed in zip(interpreter.ENGINES, timings)
+            )
+        )
+
+
+def cold_calls(functions):
+    """Return a script that defines `functions` functions and calls each once."""
+    return "".join(
+        f"f{i} takes a does\n    b is a + 1\n    return b\n.\nx is f{i}(1) .\n"
+        for i in range(functions)
+    )
+
+
+def run_tiered(tokens, tiers):
+    """Time running `tokens`' folded program on the tree walker with `tiers`."""
+    evaluator, tree = prepare(tokens, True, tiers)
+    evaluator.optimizer = optimizer.Optimizer(evaluator)
+    start = time.perf_counter()
+    run_quietly(evaluator, tree)
+    return time.perf_counter() - start
+
+
+def bench_tiers(args):
+    programs = (
+        ("call loop", call_loop(args.iterations)),
+        ("cold calls", cold_calls(args.functions)),
+    )
+    print(f"threshold {args.threshold}, best of 3")
+    for label, text in programs:
+        tokens, _ = lexer.TableLex(text, "<bench>").create_token()
+        untiered = min(run_tiered(tokens, None) for _ in range(3))
+        runs = []
+        for _ in range(3):
+            tiers = tiering.Tiering(args.threshold)
+            runs.append((run_tiered(tokens, tiers), tiers.stats()))
+        tiered, stats = min(runs, key=lambda run: run[0])
+        compiled = stats["transitions"]
+        seconds = sum(counter["compile_seconds"] for counter in compiled)
+        print(
+            f"  {label:<10} interpreted {untiered:.3f}s  tiered {tiered:.3f}s "
+            f"({untiered / tiered:.2f}x), {len(stats['counters'])} counted, "
+            f"{len(compiled)} compiled in {seconds * 1000:.2f}ms"
+        )
+        for counter in compiled:
+            print(
+                f"    {counter['kind']} {counter['name']!r} at line {counter['line']}"
+                f" after {counter['count']} runs"
+            )
+
+
+def main(argv):
+    arguments = argparse.ArgumentParser(description="SimplyLang benchmarks")
+    commands = arguments.add_subparsers(dest="command", required=True)
+
+    tokens = commands.add_parser("tokens", help="bytes per token, Token vs TokenBuffer")
+    tokens.add_argument("file", nargs="?", default="simply.txt")
+    tokens.set_defaults(run=lambda args: bench_tokens(args.file))
+
+    lex = commands.add_parser("lex", help="lexer throughput on synthetic corpora")
+    lex.add_argument("--stage", help="stage directory (default: this one)")
+    lex.add_argument("--engine", action="append", help="lexer engine (repeatable)")
+    lex.add_argument(
+        "--mix", action="append", choices=list(MIXES), help="corpus mix (repeatable)"
+    )
+    lex.add_argument(
+        "--size", type=int, default=1_000_000, help="corpus size in characters"
+    )
+    lex.add_argument("--output", help="write results to this JSON file")
+    lex.add_argument("--baseline", help="compare against results in this JSON file")
+    lex.set_defaults(run=bench_lex)
+
+    comments = commands.add_parser(
+        "comments", help="lexing time as comment volume grows"
+    )
+    comments.add_argument("--stage", help="stage directory (default: ../comments)")
+    comments.add_argument(
+        "--lines", type=int, default=5_000, help="statements in each corpus"
+    )
+    comments.set_defaults(run=bench_comments)
+
+    parse = commands.add_parser("parse", help="parser throughput and allocations")
+    parse.add_argument(
+        "--statements", type=int, default=1_000_000, help="statements to parse"
+    )
+    parse.add_argument(
+        "--sample", type=int, default=20_000, help="statements to count objects on"
+    )
+    parse.add_argument("--output", help="write results to this JSON file")
+    parse.add_argument("--baseline", help="compare against results in this JSON file")
+    parse.set_defaults(run=bench_parse)
+
+    nodes = commands.add_parser("nodes", help="AST memory per node")
+    nodes.add_argument(
+        "--statements", type=int, default=100_000, help="statements to parse"
+    )
+    nodes.add_argument("--output", help="write results to this JSON file")
+    nodes.add_argument("--baseline", help="compare against results in this JSON file")
+    nodes.set_defaults(run=bench_nodes)
+
+    functions = commands.add_parser(
+        "functions", help="startup with many uncalled functions"
+    )
+    functions.add_argument(
+        "--functions", type=int, default=5_000, help="helper functions to define"
+    )
+    functions.set_defaults(run=bench_functions)
+
+    nesting = commands.add_parser("nesting", help="deeply nested blocks")
+    nesting.add_argument("--depth", type=int, default=10_000, help="nesting depth")
+    nesting.set_defaults(run=bench_nesting)
+
+    constants = commands.add_parser(
+        "constants", help="constant folding on a literal-heavy loop"
+    )
+    constants.add_argument(
+        "--iterations", type=int, default=100_000, help="loop iterations"
+    )
+    constants.set_defaults(run=bench_constants)
+
+    deadcode = commands.add_parser("deadcode", help="dead code elimination")
+    deadcode.add_argument(
+        "--functions", type=int, default=20_000, help="helper functions to define"
+    )
+    deadcode.add_argument(
+        "--called", type=int, default=2_000, help="helper functions to call"
+    )
+    deadcode.set_defaults(run=bench_deadcode)
+
+    dispatch = commands.add_parser("dispatch", help="visitor dispatch cost per node")
+    dispatch.add_argument(
+        "--iterations", type=int, default=200_000, help="loop iterations"
+    )
+    dispatch.set_defaults(run=bench_dispatch)
+
+    engines = commands.add_parser("engines", help="execution engines compared")
+    engines.add_argument(
+        "--iterations", type=int, default=100_000, help="loop iterations"
+    )
+    engines.set_defaults(run=bench_engines)
+
+    tiers = commands.add_parser("tiers", help="tiered compilation of hot code")
+    tiers.add_argument(
+        "--iterations", type=int, default=100_000, help="loop iterations"
+    )
+    tiers.add_argument(
+        "--functions", type=int, default=2_000, help="functions called once each"
+    )
+    tiers.add_argument(
+        "--threshold",
+        type=int,
+        default=tiering.DEFAULT_THRESHOLD,
+        help="calls or iterations before compiling",
+    )
+    tiers.set_defaults(run=bench_tiers)
+
+    args = arguments.parse_args(argv)
+    args.run(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
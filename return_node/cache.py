@@ -0,0 +1,78 @@
+"""
+On-disk cache for compiled SimplyLang artifacts.
+
+Entries live in a __simplycache__ directory next to the source file, one
+file per source and artifact kind. Each entry records the key it was built
+for (a hash of the source plus the toolchain version), so an edited source
+or a changed lexer/parser simply misses and is overwritten.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+CACHE_DIR = "__simplycache__"
+
+
+def toolchain_version(*paths):
+    """Hash the given module files, so editing any of them invalidates entries."""
+    digest = hashlib.sha256(sys.version.encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def source_key(filename, version):
+    with open(filename, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256")
+    digest.update(version.encode())
+    return digest.hexdigest()
+
+
+def entry_path(filename, kind):
+    directory = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR)
+    return os.path.join(directory, f"{os.path.basename(filename)}.{kind}")
+
+
+def load(path, key):
+    try:
+        with open(path, "rb") as f:
+            stored_key, value = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError, RecursionError):
+        return None
+    except (AttributeError, ImportError, IndexError, TypeError):
+        # Written by an incompatible toolchain
+        return None
+    return value if stored_key == key else None
+
+
+def store(path, key, value):
+    """
+    Write an entry atomically: the pickle goes to a temporary file in the
+    cache directory that is then renamed over the entry, so concurrent
+    readers see either the old entry or the new one, never a partial file.
+    """
+    try:
+        data = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        return False
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
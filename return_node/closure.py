@@ -0,0 +1,334 @@
+"""
+Closure-compiling execution engine for SimplyLang.
+
+Rather than walking the AST each time a node is evaluated, every node is
+compiled once into a Python closure that takes the environment (the
+program's symbol dict) and returns the node's value; a BinaryOperationNode
+for `+` becomes, in effect, `lambda env: left(env) + right(env)`. Running
+the program is then a single call to the root closure.
+
+Node types, operators and positions are settled at compile time, and
+runtime errors are raised as Failure and only turned into an
+InterpreterResult at the top, so the common path neither inspects nodes
+nor allocates results. Behaviour, output and error messages match the
+tree walker in interpreter.py. Compiled closures call each other, so
+unlike the tree walker, nesting depth is bounded by Python's recursion
+limit; a program nested deeper than that fails with an error instead of
+running.
+"""
+
+import lexer as Lexer
+import parser as Pr
+from values import (
+    NUMBER_OPERATIONS,
+    Bool,
+    Dispatch,
+    Failure,
+    InterpreterResult,
+    Number,
+    SymbolTable,
+    binary,
+    bind_arguments,
+    call_targets,
+    too_deep,
+)
+
+
+class Compiler(Dispatch):
+    prefix = "compile_"
+    fallback = "compile_unknown"
+
+    def __init__(self, constants, optimizer=None):
+        self.symbol_table = SymbolTable()
+        self.function_list = []
+        # Pool the optimizer folded constants into
+        self.constants = constants
+        # Folds pre-parsed function bodies once they are parsed
+        self.optimizer = optimizer
+        # Compiled bodies of the functions called so far
+        self.bodies = {}
+
+    def run(self, tree):
+        """Compile and run `tree`, returning an InterpreterResult."""
+        try:
+            code = self.compile(tree)
+            return InterpreterResult().success(code(self.symbol_table.symbols))
+        except Failure as failure:
+            return InterpreterResult().failure(failure.error)
+        except RecursionError:
+            return InterpreterResult().failure(too_deep(tree))
+
+    def compile(self, node):
+        node_type = type(node)
+        handler = self.handlers.get(node_type) or self.handler(node_type)
+        return handler(self, node)
+
+    def compile_unknown(self, node):
+        # Compiles, so only a program that runs the node fails
+        message = f"No visit_{type(node).__name__} method defined"
+
+        def unknown(env):
+            raise Exception(message)
+
+        return unknown
+
+    def compile_block(self, statements):
+        return [self.compile(statement) for statement in statements]
+
+    def compile_body(self, statements):
+        """Compile a function body, up to and including its first return."""
+        body = []
+        for statement in statements:
+            body.append(self.compile(statement))
+            if isinstance(statement, (Pr.ReturnNode, Pr.ReturnExprNode)):
+                break
+        return body
+
+    def compile_StatementsNode(self, node):
+        statements = self.compile_block(node.statements)
+
+        def run(env):
+            value = None
+            for statement in statements:
+                value = statement(env)
+            return value
+
+        return run
+
+    def compile_ConstantNode(self, node):
+        # Shared and unplaced, as in the tree walker
+        value = self.constants.values[node.index]
+        return lambda env: value
+
+    def compile_NumberNode(self, node):
+        value = node.token.value
+        start, end = node.pos_start, node.pos_end
+        return lambda env: Number(value).set_pos(start, end)
+
+    def compile_BoolNode(self, node):
+        value = node.token.value
+        start, end = node.pos_start, node.pos_end
+        return lambda env: Bool(value).set_pos(start, end)
+
+    def compile_VariableNode(self, node):
+        name = node.variable_name.value
+        value_of = self.compile(node.value_node)
+
+        def assign(env):
+            value = env[name] = value_of(env)
+            return value
+
+        return assign
+
+    # The parser only builds these around a FunctionCallNode
+    compile_VariableFunctionNode = compile_VariableNode
+
+    def compile_VariableAccessNode(self, node):
+        name = node.variable_name.value
+        start, end = node.pos_start, node.pos_end
+
+        def load(env):
+            value = env.get(name)
+            if not value:
+                raise Failure(
+                    Lexer.InvalidSyntaxError(f"'{name}' is not defined", start, end)
+                )
+            try:
+                return value.copy().set_pos(start, end)
+            except:
+                return value
+
+        return load
+
+    def compile_FunctionNode(self, node):
+        def define(env):
+            self.function_list.append(node)
+
+        return define
+
+    def function_body(self, function):
+        """Compile `function`'s body on its first call, parsing it if needed."""
+        body = self.bodies.get(function)
+        if body is None:
+            if function.body is None:
+                error = function.parse_body()
+                if error is not None:
+                    raise Failure(error)
+                if self.optimizer is not None:
+                    self.optimizer.optimize_block(function.body)
+            body = self.bodies[function] = self.compile_body(function.body)
+        return body
+
+    def compile_FunctionCallNode(self, node):
+        start, end = node.pos_start, node.pos_end
+
+        def call(env):
+            body = ()
+            for function in call_targets(node, self.function_list):
+                body = self.function_body(function)
+                error = bind_arguments(node, function, env)
+                if error is not None:
+                    error.start, error.end = start, end
+                    raise Failure(error)
+            value = None
+            for statement in body:
+                value = statement(env)
+            return value
+
+        return call
+
+    def compile_ReturnNode(self, node):
+        token = node.token
+        if token.type != Lexer.TT_IDENTIFIER:
+            return lambda env: token
+        name = token.value
+        start, end = node.pos_start, node.pos_end
+
+        def load(env):
+            value = env.get(name)
+            if value is None:
+                raise Failure(
+                    Lexer.InvalidSyntaxError(f"'{name}' is not defined", start, end)
+                )
+            return value
+
+        return load
+
+    def compile_ReturnExprNode(self, node):
+        value_of = self.compile(node.token)
+
+        def result(env):
+            value = value_of(env)
+            if value is None:
+                raise Failure(
+                    Lexer.InvalidSyntaxError(
+                        f"'{node.token.value}' is not defined",
+                        node.pos_start,
+                        node.pos_end,
+                    )
+                )
+            return value
+
+        return result
+
+    def compile_ShowNode(self, node):
+        items = [self.show_item(item, node) for item in node.body]
+
+        def show(env):
+            for item in items:
+                item(env)
+            print()
+            return "success"
+
+        return show
+
+    def show_item(self, item, node):
+        """Compile one show(...) argument into a closure that prints it."""
+        if isinstance(item, (int, str, bool, float)):
+            text = str(item).strip()
+            return lambda env: print(text, end=" ")
+        if isinstance(item, Pr.ConstantNode):
+            value = self.constants.values[item.index]
+            return lambda env: print(value, end=" ")
+        if isinstance(item, Pr.VariableAccessNode):
+            name = item.variable_name.value
+            start, end = node.pos_start, node.pos_end
+
+            def show_variable(env):
+                value = env.get(name)
+                if value is None:
+                    raise Failure(
+                        Lexer.InvalidSyntaxError(f"'{name}' is not defined", start, end)
+                    )
+                if isinstance(value, list):
+                    print(" ".join(map(str, value)), end=" ")
+                else:
+                    print(value, end=" ")
+
+            return show_variable
+
+        value_of = self.compile(item)
+
+        def show_value(env):
+            # Like the tree walker, an argument that fails prints nothing
+            try:
+                value = value_of(env)
+            except Failure:
+                return
+            if value is not None:
+                if isinstance(value, Bool):
+                    print(str(value.value).strip(), end=" ")
+                else:
+                    print(value, end=" ")
+
+        return show_value
+
+    def compile_UniaryOperatorNode(self, node):
+        operand = self.compile(node.node)
+        token = node.token
+        negate = token.type == Lexer.TT_MINUS
+        start, end = node.pos_start, node.pos_end
+
+        def unary(env):
+            value = operand(env)
+            if not isinstance(value, Number):
+                raise Failure(
+                    Lexer.IllegalOperationError(
+                        f"Can't apply '{token.value}' to {type(value).__name__}",
+                        start,
+                        end,
+                    )
+                )
+            if negate:
+                value = Number(-value.value).set_context(value.context)
+            else:
+                value = value.copy()
+            return value.set_pos(start, end)
+
+        return unary
+
+    def compile_TillNode(self, node):
+        condition = self.compile(node.condition_expr)
+        body = self.compile_block(node.body)
+
+        def loop(env):
+            while condition(env).value is True:
+                for statement in body:
+                    statement(env)
+            return None
+
+        return loop
+
+    def compile_RepeatNode(self, node):
+        count = node.range
+        body = self.compile_block(node.body)
+
+        def repeat(env):
+            for _ in range(count):
+                for statement in body:
+                    value = statement(env)
+            return value  # type: ignore
+
+        return repeat
+
+    def compile_BinaryOperationNode(self, node):
+        left_of = self.compile(node.left)
+        right_of = self.compile(node.right)
+        token = node.token
+        start, end = node.pos_start, node.pos_end
+        operate = NUMBER_OPERATIONS.get(token.type)
+
+        if operate is None:
+            return lambda env: binary(token, left_of(env), right_of(env), start, end)
+
+        def number_operation(env):
+            left = left_of(env)
+            right = right_of(env)
+            # Two plain Numbers never fail; anything else takes the slow path
+            if type(left) is Number and type(right) is Number:
+                result = Number(operate(left.value, right.value))
+                result.context = left.context
+                return result.set_pos(start, end)
+            return binary(token, left, right, start, end)
+
+        return number_operation
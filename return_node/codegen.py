@@ -0,0 +1,682 @@
+"""
+Python code generator for SimplyLang.
+
+Lowers the AST to Python source and runs it with compile() and exec(), so
+a program is executed by CPython's own bytecode interpreter. Variables
+become globals of the generated module (prefixed `v_`, so no SimplyLang
+name can clash with a Python keyword or a helper), every function becomes
+a module level `def`, `till` becomes `while ... is True:`, `repeat N
+times` becomes `for _ in range(N):` and show() appends to an output
+buffer that is written out in large chunks.
+
+Each generated line records the SimplyLang positions it came from, and
+runtime errors are mapped back through this source map, so they report
+the original file, line and column. Compiled programs are cached on disk
+next to the source, marshalled, like the parsed AST.
+
+Values are plain Python numbers rather than Number objects, so a few
+programs that only fail in the tree walker run here, and their errors do
+not always match:
+
+- a variable holding no value is only caught where Python would reject it;
+- applying unary minus to a string fails as a Python TypeError;
+- a literal passed as a call argument is an ordinary number here, while
+  the tree walker binds it unwrapped and will not apply unary minus to
+  it, so `--n` fails there and `show(-n)` prints nothing.
+
+Function calls and outlined loops are Python calls, so nesting and
+recursion depth are bounded by Python's recursion limit; a program that
+goes deeper fails with an error.
+"""
+
+import marshal
+import operator
+import sys
+
+import cache
+import lexer as Lexer
+import optimizer
+import parser as Pr
+import resolver
+from values import (
+    NUMBER_OPERATIONS,
+    Bool,
+    Dispatch,
+    Failure,
+    InterpreterResult,
+    Number,
+    arity_error,
+    binary,
+    too_deep,
+)
+
+CACHE_VERSION = cache.toolchain_version(
+    Lexer.__file__, Pr.__file__, resolver.__file__, optimizer.__file__, __file__
+)
+
+# Loops nested deeper than this are moved into a function of their own;
+# CPython refuses more than 20 nested blocks in one code object
+MAX_DEPTH = 10
+# Buffered output is written out once it holds this many pieces
+FLUSH_SIZE = 4096
+
+# Python precedence levels of the generated expressions
+COMPARISON, SUM, PRODUCT, UNARY, ATOM = range(5)
+
+OPERATORS = {
+    Lexer.TT_ADD: ("+", SUM),
+    Lexer.TT_PLUS: ("+", SUM),
+    Lexer.TT_MINUS: ("-", SUM),
+    Lexer.TT_MUL: ("*", PRODUCT),
+    Lexer.TT_DIV: ("/", PRODUCT),
+    Lexer.TT_LT: ("<", COMPARISON),
+    Lexer.TT_GT: (">", COMPARISON),
+    Lexer.TT_EQUAL: ("==", COMPARISON),
+    Lexer.TT_NOT_EQUAL: ("!=", COMPARISON),
+}
+
+OPERATIONS = {**NUMBER_OPERATIONS, Lexer.TT_DIV: operator.truediv}
+
+# Errors that make a show(...) argument print nothing, as in the tree walker
+SHOW_ERRORS = (Failure, NameError, ZeroDivisionError)
+
+
+def argument(env, key, name):
+    """Value passed for a call argument: the variable `name`, or the name itself."""
+    value = env.get(key)
+    return name if value is None else value
+
+
+def fail(error, *operands):
+    raise Failure(error)
+
+
+def undefined(node):
+    raise Failure(
+        Lexer.InvalidSyntaxError(
+            f"'{node.token.value}' is not defined", node.pos_start, node.pos_end
+        )
+    )
+
+
+def unknown(node):
+    # Generated in place of the node, so it fails only if reached
+    raise Exception(f"No visit_{type(node).__name__} method defined")
+
+
+def operate(token, left, right):
+    """Apply a binary operator in a program that has boolean values."""
+    if isinstance(left, Bool) or isinstance(right, Bool):
+        return binary(token, left, right, token.start, token.end)
+    return OPERATIONS[token.type](left, right)
+
+
+def unary(node, value):
+    if isinstance(value, Bool):
+        raise Failure(
+            Lexer.IllegalOperationError(
+                f"Can't apply '{node.token.value}' to Bool",
+                node.pos_start,
+                node.pos_end,
+            )
+        )
+    return -value if node.token.type == Lexer.TT_MINUS else +value
+
+
+def holds(value):
+    """Whether a till condition is true, for a program with boolean values."""
+    return getattr(value, "value", value) is True
+
+
+def show_value(value):
+    if isinstance(value, Bool):
+        return f"{value.value} "
+    return f"{value} "
+
+
+def show_name(value, key):
+    if value is None:
+        raise NameError(f"name {key!r} is not defined", name=key)
+    if isinstance(value, list):
+        return " ".join(map(str, value)) + " "
+    return f"{value} "
+
+
+class Unit:
+    """One generated code block: the module body or a function."""
+
+    def __init__(self, header=None):
+        self.header = header
+        # (indent, text, location) of each line
+        self.lines = []
+        # Variables the block assigns, declared global in functions
+        self.assigned = set()
+        self.depth = 0
+
+
+class Transpiler(Dispatch):
+    prefix = "transpile_"
+    # Any other node is an expression
+    fallback = "transpile_expression"
+
+    def __init__(self, constants=None):
+        # Values the optimizer folded ConstantNodes into
+        self.pool = constants
+        self.constants = []
+        # Constant indexes by identity, so each object is stored once
+        self.indexes = {}
+        self.module = self.unit = Unit()
+        self.units = []
+        # Generated names of the functions called so far, by node id
+        self.functions = {}
+        self.pending = []
+        # Whether the program has boolean values
+        self.booleans = False
+
+    def transpile(self, tree, filename):
+        """Generate and compile the Python code for `tree`."""
+        # Boolean values are objects that Python operators cannot apply to,
+        # so a program that has any goes through the slower helpers
+        self.booleans = uses_booleans(tree)
+        self.drive(self.block(tree.statements, "_result"))
+        while self.pending:
+            self.unit, function = self.pending.pop()
+            self.drive(self.function_body(function))
+        text, locations = self.finish()
+        code = compile(text, f"<simply {filename}>", "exec")
+        return Program(code, self.constants, locations)
+
+    def finish(self):
+        """Join the generated blocks into one module and its source map."""
+        lines = []
+        locations = []
+        for unit in self.units + [self.module]:
+            indent = 0
+            if unit.header is not None:
+                text, location = unit.header
+                lines.append(text)
+                locations.append(location)
+                indent = 1
+                if unit.assigned:
+                    lines.append("    global " + ", ".join(sorted(unit.assigned)))
+                    locations.append(location)
+            for depth, text, location in unit.lines:
+                lines.append("    " * (indent + depth) + text)
+                locations.append(location)
+        return "\n".join(lines) + "\n", locations
+
+    def constant(self, value):
+        index = self.indexes.get(id(value))
+        if index is None:
+            index = self.indexes[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return f"K[{index}]"
+
+    def emit(self, text, node=None):
+        self.unit.lines.append((self.unit.depth, text, self.locate(node)))
+
+    def locate(self, node):
+        """
+        Positions reported for an error on a line generated from `node`:
+        its span, the span of each variable it reads, and that of its first
+        division.
+        """
+        if node is None:
+            return None
+        start, end = Pr.start_of(node), Pr.end_of(node)
+        names = {}
+        division = None
+        if isinstance(node, Pr.ReturnNode):
+            names[f"v_{node.token.value}"] = (start, end)
+            return start, end, names, division
+        if isinstance(node, (Pr.ShowNode, Pr.TillNode, Pr.RepeatNode)):
+            # show() reports its own span, and loop headers only evaluate
+            # what their own line maps
+            return start, end, names, division
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Pr.VariableAccessNode):
+                name = f"v_{node.variable_name.value}"
+                names.setdefault(name, (node.pos_start, node.pos_end))
+            elif isinstance(node, Pr.BinaryOperationNode):
+                if division is None and node.token.type == Lexer.TT_DIV:
+                    division = (Pr.start_of(node.left), Pr.end_of(node.right))
+            stack.extend(reversed(optimizer.children(node)))
+        return start, end, names, division
+
+    def assign(self, sink, value, node):
+        self.emit(value if sink is None else f"{sink} = {value}", node)
+
+    def variable(self, name):
+        name = f"v_{name}"
+        self.unit.assigned.add(name)
+        return name
+
+    def drive(self, steps):
+        """
+        Run a handler. Handlers for blocks are generators that yield each
+        statement to be generated with the name its value goes to, and
+        nested blocks wait on an explicit stack, so nesting depth is not
+        limited by the recursion limit.
+        """
+        if steps is None:
+            return
+        stack = [steps]
+        while stack:
+            try:
+                statement, sink = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            steps = self.dispatch(statement, sink)
+            if steps is not None:
+                stack.append(steps)
+
+    def dispatch(self, node, sink):
+        node_type = type(node)
+        handler = self.handlers.get(node_type) or self.handler(node_type)
+        return handler(self, node, sink)
+
+    def block(self, statements, sink=None):
+        """Generate statements, giving the last one's value to `sink`."""
+        if not statements:
+            self.emit("pass" if sink is None else f"{sink} = None")
+            return
+        for statement in statements[:-1]:
+            yield statement, None
+        yield statements[-1], sink
+
+    def function_body(self, function):
+        """Generate a function body, up to and including its first return."""
+        body = []
+        for statement in function.body:
+            body.append(statement)
+            if isinstance(statement, (Pr.ReturnNode, Pr.ReturnExprNode)):
+                break
+        yield from self.block(body, "_r")
+        self.emit("return _r")
+
+    def function(self, function):
+        """Name of the def generated for `function`, queueing it if new."""
+        name = self.functions.get(id(function))
+        if name is None:
+            name = f"f_{function.function_name.value}_{len(self.functions)}"
+            self.functions[id(function)] = name
+            unit = Unit((f"def {name}():", self.locate(function.function_name)))
+            self.units.append(unit)
+            self.pending.append((unit, function))
+        return name
+
+    def call(self, node):
+        """
+        Return the statements that bind a call's arguments and the
+        expression that makes it.
+        """
+        binding = node.binding
+        if binding is None:
+            return [], "None"
+        function = binding.node
+        error = function.parse_body()
+        if error is not None:
+            return [], f"fail({self.constant(error)})"
+        if function.variables is None:
+            return [], f"{self.function(function)}()"
+        error = arity_error(node, function)
+        if error is not None:
+            error.start, error.end = node.pos_start, node.pos_end
+            return [], f"fail({self.constant(error)})"
+        bindings = []
+        for token, variable in zip(node.parameters, function.variables):
+            value = token.value
+            if isinstance(value, str):
+                value = f"argument(G, {'v_' + value!r}, {value!r})"
+            else:
+                value = repr(value)
+            bindings.append((self.variable(variable), value))
+        return bindings, f"{self.function(function)}()"
+
+    def expression(self, node, minimum=COMPARISON):
+        """Python source for the expression `node`, parenthesized if needed."""
+        results = []
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            if isinstance(node, Pr.BinaryOperationNode):
+                if not ready:
+                    stack += [(node, True), (node.right, False), (node.left, False)]
+                    continue
+                right = results.pop()
+                left = results.pop()
+                results.append(self.binary(node, left, right))
+            elif isinstance(node, Pr.UniaryOperatorNode):
+                if not ready:
+                    stack += [(node, True), (node.node, False)]
+                    continue
+                operand = results.pop()
+                if self.booleans:
+                    text = f"unary({self.constant(node)}, {operand[0]})"
+                    results.append((text, ATOM))
+                    continue
+                sign = "-" if node.token.type == Lexer.TT_MINUS else "+"
+                results.append((sign + wrap(operand, UNARY), UNARY))
+            else:
+                results.append(self.atom(node))
+        return wrap(results[0], minimum)
+
+    def binary(self, node, left, right):
+        operator = OPERATORS.get(node.token.type)
+        if operator is None:
+            token = node.token
+            error = Lexer.InvalidSyntaxError(
+                f"Invalid operator '{token.value}'", token.start, token.end
+            )
+            # Both operands are still evaluated first
+            operands = f"{left[0]}, {right[0]}"
+            return f"fail({self.constant(error)}, {operands})", ATOM
+        if self.booleans:
+            return f"operate({self.constant(node.token)}, {left[0]}, {right[0]})", ATOM
+        symbol, precedence = operator
+        # Python chains comparisons, SimplyLang applies them one at a time
+        left_minimum = precedence + 1 if precedence == COMPARISON else precedence
+        text = f"{wrap(left, left_minimum)} {symbol} {wrap(right, precedence + 1)}"
+        return text, precedence
+
+    def atom(self, node):
+        if isinstance(node, Pr.NumberNode):
+            return self.literal(node.token.value)
+        if isinstance(node, Pr.BoolNode):
+            return self.constant(Bool(node.token.value)), ATOM
+        if isinstance(node, Pr.ConstantNode):
+            value = self.pool.values[node.index]
+            if type(value) is Number:
+                return self.literal(value.value)
+            return self.constant(value), ATOM
+        if isinstance(node, Pr.VariableAccessNode):
+            return f"v_{node.variable_name.value}", ATOM
+        if isinstance(node, (Pr.VariableNode, Pr.VariableFunctionNode)):
+            # An assignment used as a value, as in `x is f()`
+            name = self.variable(node.variable_name.value)
+            return f"({name} := {self.expression(node.value_node)})", ATOM
+        if isinstance(node, Pr.FunctionCallNode):
+            bindings, call = self.call(node)
+            if not bindings:
+                return call, ATOM
+            # Arguments are bound in order, before the call
+            walrus = "".join(f"({name} := {value}), " for name, value in bindings)
+            return f"({walrus}{call})[-1]", ATOM
+        if isinstance(node, Pr.ReturnNode):
+            token = node.token
+            if token.type != Lexer.TT_IDENTIFIER:
+                return self.constant(token), ATOM
+            name = f"v_{token.value}"
+            error = Lexer.InvalidSyntaxError(
+                f"'{token.value}' is not defined", node.pos_start, node.pos_end
+            )
+            return (
+                f"({name} if {name} is not None else fail({self.constant(error)}))",
+                ATOM,
+            )
+        if isinstance(node, Pr.ReturnExprNode):
+            value = self.expression(node.token, UNARY)
+            check = f"undefined({self.constant(node)})"
+            return f"(_t if (_t := {value}) is not None else {check})", ATOM
+        return f"unknown({self.constant(node)})", ATOM
+
+    def literal(self, value):
+        if (
+            type(value) not in (int, float, bool)
+            or value != value
+            or value
+            in (
+                float("inf"),
+                float("-inf"),
+            )
+        ):
+            return self.constant(value), ATOM
+        if value < 0:
+            return f"({value!r})", ATOM
+        return repr(value), ATOM
+
+    def transpile_expression(self, node, sink):
+        self.assign(sink, self.expression(node), node)
+
+    def transpile_StatementsNode(self, node, sink):
+        return self.block(node.statements, sink)
+
+    def transpile_VariableNode(self, node, sink):
+        value = node.value_node
+        if isinstance(value, Pr.FunctionCallNode):
+            bindings, value = self.call(value)
+            for name, argument in bindings:
+                self.emit(f"{name} = {argument}", node)
+        else:
+            value = self.expression(value)
+        name = self.variable(node.variable_name.value)
+        self.assign(sink, f"{name} = {value}", node)
+
+    # The parser only builds these around a FunctionCallNode
+    transpile_VariableFunctionNode = transpile_VariableNode
+
+    def transpile_FunctionNode(self, node, sink):
+        # Calls are bound to their definition, which is generated when first
+        # called, so defining a function does nothing at runtime
+        self.emit("pass" if sink is None else f"{sink} = None", node)
+
+    def transpile_FunctionCallNode(self, node, sink):
+        bindings, call = self.call(node)
+        for name, value in bindings:
+            self.emit(f"{name} = {value}", node)
+        self.assign(sink, call, node)
+
+    def transpile_ShowNode(self, node, sink):
+        text = []
+        for item in node.body:
+            if isinstance(item, (int, str, bool, float)):
+                text.append(str(item).strip() + " ")
+                continue
+            if isinstance(item, Pr.ConstantNode):
+                text.append(f"{self.pool.values[item.index]} ")
+                continue
+            if text:
+                self.emit(f"W({''.join(text)!r})", node)
+                text = []
+            if isinstance(item, Pr.VariableAccessNode):
+                name = f"v_{item.variable_name.value}"
+                self.emit(f"W(show_name({name}, {name!r}))", node)
+                continue
+            # Like the tree walker, an argument that fails prints nothing
+            self.emit("try:", node)
+            self.unit.depth += 1
+            self.emit(f"_v = {self.expression(item)}", node)
+            self.emit("if _v is not None:", node)
+            if self.booleans:
+                self.emit("    W(show_value(_v))", node)
+            else:
+                self.emit('    W(f"{_v} ")', node)
+            self.unit.depth -= 1
+            self.emit("except SHOW_ERRORS:", node)
+            self.emit("    pass", node)
+        text.append("\n")
+        self.emit(f"W({''.join(text)!r})", node)
+        self.emit(f"if len(B) > {FLUSH_SIZE}:", node)
+        self.emit("    flush()", node)
+        if sink is not None:
+            self.emit(f"{sink} = 'success'", node)
+
+    def transpile_TillNode(self, node, sink):
+        if self.unit.depth >= MAX_DEPTH:
+            return self.outline(node, sink)
+        return self.till(node, sink)
+
+    def till(self, node, sink):
+        if self.booleans:
+            condition = f"holds({self.expression(node.condition_expr)})"
+        else:
+            condition = f"{self.expression(node.condition_expr, SUM)} is True"
+        self.emit(f"while {condition}:", node.condition_expr)
+        self.unit.depth += 1
+        yield from self.block(node.body)
+        self.unit.depth -= 1
+        if sink is not None:
+            self.emit(f"{sink} = None", node)
+
+    def transpile_RepeatNode(self, node, sink):
+        if self.unit.depth >= MAX_DEPTH:
+            return self.outline(node, sink)
+        return self.repeat(node, sink)
+
+    def repeat(self, node, sink):
+        self.emit(f"for _ in range({node.range!r}):", node)
+        self.unit.depth += 1
+        yield from self.block(node.body, sink)
+        self.unit.depth -= 1
+
+    def outline(self, node, sink):
+        """Generate a deeply nested loop as a function of its own."""
+        name = f"_block_{len(self.units)}"
+        unit = Unit((f"def {name}():", self.locate(node)))
+        self.units.append(unit)
+        self.assign(sink, f"{name}()", node)
+        outer, self.unit = self.unit, unit
+        self.emit("_r = None", node)
+        if isinstance(node, Pr.TillNode):
+            yield from self.till(node, "_r")
+        else:
+            yield from self.repeat(node, "_r")
+        self.emit("return _r", node)
+        self.unit = outer
+
+
+def uses_booleans(tree):
+    """Whether `tree` has a boolean literal, parsed or in a pre-parsed body."""
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Pr.BoolNode):
+            return True
+        if isinstance(node, Pr.FunctionNode) and node.body is None:
+            if any(token.type == Lexer.TT_BOOL for token in node.tokens):
+                return True
+        stack.extend(optimizer.children(node))
+    return False
+
+
+def wrap(expression, minimum):
+    text, precedence = expression
+    return text if precedence >= minimum else f"({text})"
+
+
+class Program:
+    """A compiled program, with the source map its errors are reported through."""
+
+    def __init__(self, code, constants, locations):
+        self.code = code
+        self.constants = constants
+        # SimplyLang positions of each generated line
+        self.locations = locations
+
+    def __getstate__(self):
+        # Code objects cannot be pickled, only marshalled
+        return marshal.dumps(self.code), self.constants, self.locations
+
+    def __setstate__(self, state):
+        code, self.constants, self.locations = state
+        self.code = marshal.loads(code)
+
+    def run(self):
+        """Execute the program, returning an InterpreterResult."""
+        buffer = []
+
+        def flush():
+            sys.stdout.write("".join(buffer))
+            buffer.clear()
+
+        namespace = {
+            "K": self.constants,
+            "B": buffer,
+            "W": buffer.append,
+            "flush": flush,
+            "argument": argument,
+            "fail": fail,
+            "undefined": undefined,
+            "unknown": unknown,
+            "show_name": show_name,
+            "operate": operate,
+            "unary": unary,
+            "holds": holds,
+            "show_value": show_value,
+            "SHOW_ERRORS": SHOW_ERRORS,
+        }
+        namespace["G"] = namespace
+        try:
+            exec(self.code, namespace)
+        except Failure as failure:
+            return InterpreterResult().failure(failure.error)
+        except (NameError, ZeroDivisionError) as exception:
+            error = self.error(exception)
+            if error is None:
+                raise
+            return InterpreterResult().failure(error)
+        finally:
+            flush()
+        value = namespace.get("_result")
+        if type(value) in (int, float, bool):
+            value = Number(value)
+        return InterpreterResult().success(value)
+
+    def error(self, exception):
+        """Map a Python exception raised by the generated code to a SimplyLang error."""
+        line = None
+        traceback = exception.__traceback__
+        while traceback is not None:
+            if traceback.tb_frame.f_code.co_filename == self.code.co_filename:
+                line = traceback.tb_lineno
+            traceback = traceback.tb_next
+        if line is None or self.locations[line - 1] is None:
+            return None
+        start, end, names, division = self.locations[line - 1]
+        if isinstance(exception, NameError):
+            name = exception.name or ""
+            if not name.startswith("v_"):
+                return None
+            start, end = names.get(name, (start, end))
+            return Lexer.InvalidSyntaxError(f"'{name[2:]}' is not defined", start, end)
+        if division is not None:
+            start, end = division
+        return Lexer.IllegalOperationError("Divide by zero", start, end)
+
+
+def compile_program(
+    tree, filename, constants=None, use_cache=True, optimize=True, lazy=False
+):
+    """
+    Return the compiled Program for `tree`, parsed from `filename` with the
+    given `optimize` and `lazy` settings.
+    """
+    if use_cache:
+        key = cache.source_key(filename, CACHE_VERSION)
+        # The same source compiles differently when folded or pre-parsed
+        kind = "py"
+        if optimize:
+            kind = "optimized-" + kind
+        if lazy:
+            kind = "lazy-" + kind
+        path = cache.entry_path(filename, kind)
+        program = cache.load(path, key)
+        if program is not None:
+            return program
+    program = Transpiler(constants).transpile(tree, filename)
+    if use_cache:
+        cache.store(path, key, program)
+    return program
+
+
+def run(tree, filename, constants=None, optimize=True, lazy=False):
+    try:
+        program = compile_program(
+            tree, filename, constants, optimize=optimize, lazy=lazy
+        )
+        return program.run()
+    except RecursionError:
+        return InterpreterResult().failure(too_deep(tree))
@@ -1,303 +1,43 @@
+from types import GeneratorType
+
+import closure
+import codegen
 import parser as Pr
 import lexer as Lexer
-
-
-class Bool:
-    def __init__(self, value):
-        self.value = value
-        self.set_pos()
-        self.set_context()
-
-    def set_pos(self, pos_start=None, pos_end=None):
-        self.pos_start = pos_start
-        self.pos_end = pos_end
-        return self
-
-    def set_context(self, context=None):
-        self.context = context
-        return self
-
-    def isEquall(self, other):
-        if isinstance(other, Bool):
-            return (
-                Bool(self.value == other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Can't compare bool with {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def isNotEquall(self, other):
-        if isinstance(other, Bool):
-            return (
-                Bool(self.value != other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Can't compare bool with {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def and_with(self, other):
-        if isinstance(other, Bool):
-            return (
-                Bool(self.value and other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Can't perform AND with {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def or_with(self, other):
-        if isinstance(other, Bool):
-            return (
-                Bool(self.value or other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Can't perform OR with {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-
-class InterpreterResult:
-    def __init__(self):
-        self.value = None
-        self.error = None
-
-    def register(self, res):
-        if res.error:
-            self.error = res.error
-        return res.value
-
-    def success(self, value):
-        self.value = value
-        return self
-
-    def failure(self, error):
-        self.error = error
-        return self
-
-
-class Number:
-    def __init__(self, value):
-        self.value = value
-        self.set_pos()
-        self.set_context()
-
-    def set_pos(self, pos_start=None, pos_end=None):
-        self.pos_start = pos_start
-        self.pos_end = pos_end
-        return self
-
-    def set_context(self, context=None):
-        self.context = context
-        return self
-
-    def add(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value + other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def minus(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value - other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def isLT(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value < other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def isEquall(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value == other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f" Cant compare Number with {type(other).__name__} ",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def isNotEquall(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value != other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def isGT(self, other):
-        """
-        This function is used to evaluate if the value of the current Number
-        instance is greater than the value of the other Number instance.
-
-        Parameters
-        ----------
-        other : Number
-            The other Number instance to compare with.
-
-        Returns
-        -------
-        Number, Error
-            A Number instance with the result of the comparison and an Error
-            instance if an error occurred during the comparison.
-
-        """
-        if isinstance(other, Number):
-            # Create a new Number instance with the result of the comparison.
-            # The value of the new Number instance is a boolean indicating if
-            # the value of the current Number instance is greater than the value
-            # of the other Number instance.
-            comparison_result = Number(self.value > other.value)
-
-            # Set the context of the new Number instance to the same context as
-            # the current Number instance.
-            comparison_result.set_context(self.context)
-
-            # Set the position of the new Number instance to be the same as the
-            # position of the current Number instance.
-            comparison_result.set_pos(self.pos_start, other.pos_end)
-
-            # Return the new Number instance and None (no error occurred).
-            return comparison_result, None
-
-    def mul(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value * other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def div(self, other):
-        if isinstance(other, Number):
-            if other.value == 0:
-                return None, Lexer.IllegalOperationError(
-                    "Divide by zero", self.pos_start, other.pos_end, self.context
-                )
-            return (
-                Number(self.value / other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-
-    def mod(self, other):
-        if isinstance(other, Number):
-            if other.value == 0:
-                return None, Lexer.IllegalOperationError(
-                    "Modulo by zero", self.pos_start, other.pos_end, self.context
-                )
-            return (
-                Number(self.value % other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Cannot perform modulo with Number and {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def pow(self, other):
-        if isinstance(other, Number):
-            return (
-                Number(self.value**other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Cannot perform power operation with Number and {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def floor_div(self, other):
-        if isinstance(other, Number):
-            if other.value == 0:
-                return None, Lexer.IllegalOperationError(
-                    "Floor division by zero",
-                    self.pos_start,
-                    other.pos_end,
-                    self.context,
-                )
-            return (
-                Number(self.value // other.value)
-                .set_context(self.context)
-                .set_pos(self.pos_start, other.pos_end),
-                None,
-            )
-        else:
-            return None, Lexer.IllegalOperationError(
-                f"Cannot perform floor division with Number and {type(other).__name__}",
-                self.pos_start,
-                self.pos_end,
-                self.context,
-            )
-
-    def copy(self):
-        copy = Number(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
-
-    def __repr__(self) -> str:
-        return str(self.value)
-
-
-class Interpreter:
-    def __init__(self):
+import optimizer
+import tiering
+import vm
+from values import (
+    Bool,
+    Dispatch,
+    Failure,
+    InterpreterResult,
+    Number,
+    SymbolTable,
+    bind_arguments,
+    call_targets,
+)
+
+
+class Interpreter(Dispatch):
+    def __init__(self, tiers=None):
         self.symbol_table = SymbolTable()
         self.function_list = []
+        # Literal values that ConstantNodes refer to by index
+        self.constants = optimizer.ConstantPool()
+        # Folds pre-parsed function bodies once they are parsed
+        self.optimizer = None
+        # Counts calls and loop iterations, and compiles the hot ones
+        self.tiers = tiers
+        if tiers is not None:
+            tiers.bind(self)
+
+    def run_compiled(self, code, *args):
+        """Run code compiled by the tiers on this interpreter's variables."""
+        try:
+            return InterpreterResult().success(code(self.symbol_table.symbols, *args))
+        except Failure as failure:
+            return InterpreterResult().failure(failure.error)
 
     def visitNumberNode(self, node):
         return node.value
@@ -318,25 +58,41 @@ class Interpreter:
 
     def visit_TillNode(self, node):
         res = InterpreterResult()
-        condition = res.register(self.visit(node.condition_expr))
+        tiers = self.tiers
+        if tiers is not None and tiers.code(node) is not None:
+            return self.run_compiled(tiers.code(node))
+        condition = res.register((yield node.condition_expr))
         if res.error:
             return res
         while condition.value is True:  # Assuming 0 is false, any other value is true
             for expr in node.body:
-                value = res.register(self.visit(expr))
+                value = res.register((yield expr))
                 if res.error:
                     return res
-            condition = res.register(self.visit(node.condition_expr))
+            if tiers is not None:
+                code = tiers.count(node, "till")
+                if code is not None:
+                    # Hot: the compiled loop carries on from the next check
+                    return self.run_compiled(code)
+            condition = res.register((yield node.condition_expr))
         value = None
         return res.success(value)
 
     def visit_RepeatNode(self, node):
         res = InterpreterResult()
+        tiers = self.tiers
+        if tiers is not None and tiers.code(node) is not None:
+            return self.run_compiled(tiers.code(node), node.range)
         for i in range(node.range):
             for expr in node.body:
-                value = res.register(self.visit(expr))
+                value = res.register((yield expr))
                 if res.error:
                     return res
+            if tiers is not None:
+                code = tiers.count(node, "repeat")
+                if code is not None and i + 1 < node.range:
+                    # Hot: the compiled loop runs the remaining iterations
+                    return self.run_compiled(code, node.range - i - 1)
         return res.success(value)  # type: ignore
 
     def visit_VariableFunctionNode(
@@ -346,11 +102,7 @@ class Interpreter:
         res = InterpreterResult()
         var_name = node.variable_name.value
         if isinstance(node.value_node, Pr.FunctionCallNode):
-            value = res.register(
-                self.visit_FunctionCallNode(
-                    node.value_node,
-                )
-            )
+            value = res.register((yield node.value_node))
             if res.error:
                 return res
             self.symbol_table.set(
@@ -363,10 +115,44 @@ class Interpreter:
         self,
         node,
     ):
+        """
+        Evaluate `node` without recursing on the Python stack.
 
-        method_name = f"visit_{type(node).__name__}"
-        method = getattr(self, method_name, self.no_visit_method)
-        return method(node)
+        Visit methods that need a child's value are generators: they yield
+        the child node and are resumed with its result. Suspended visits
+        wait on an explicit stack, so nesting depth is bounded by memory
+        rather than the recursion limit.
+        """
+        result = self.dispatch(node)
+        if not isinstance(result, GeneratorType):
+            return result
+
+        handlers = self.handlers
+        stack = [result]
+        value = None
+        while True:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                if not stack:
+                    return value
+                continue
+            # dispatch(), inlined: this runs once per node evaluated
+            node_type = type(child)
+            handler = handlers.get(node_type) or self.handler(node_type)
+            result = handler(self, child)
+            if isinstance(result, GeneratorType):
+                stack.append(result)
+                value = None
+            else:
+                value = result
+
+    def dispatch(self, node):
+        node_type = type(node)
+        handler = self.handlers.get(node_type) or self.handler(node_type)
+        return handler(self, node)
 
     def no_visit_method(self, node):
         raise Exception(f"No visit_{type(node).__name__} method defined")
@@ -383,36 +169,47 @@ class Interpreter:
         self,
         node,
     ):
-        return InterpreterResult().success(
-            Number(node.token.value).set_pos(node.pos_start, node.pos_end)
-        )
+        # Values are placed at the node they came from rather than at
+        # Positions; values.value_start() looks them up if an error needs them
+        return InterpreterResult().success(Number(node.token.value).set_node(node))
+
+    def visit_BoolNode(self, node):
+        return InterpreterResult().success(Bool(node.token.value).set_node(node))
+
+    def visit_ConstantNode(self, node):
+        # Pooled values are shared by every node that folded to them and
+        # carry no position; an error they cause is placed when reported
+        return InterpreterResult().success(self.constants.values[node.index])
 
     def visit_FunctionCallNode(self, node: Pr.FunctionCallNode):
         res = InterpreterResult()
         function = []
-        for func in self.function_list:
-            if func.function_name.value == node.function_name:
-                function = func.body
-                if func.variables != None:
-                    if len(node.parameters) != len(func.variables):
-                        return InterpreterResult().failure(
-                            Lexer.InvalidSyntaxError(
-                                f"'Invalid number of parameters are passed in function {node.function_name}'",
-                                node.pos_start,
-                                node.pos_end,
-                            )
-                        )
-                    for i in range(len(node.parameters)):
-                        value = self.symbol_table.get(node.parameters[i])
-                        if value:
-                            self.symbol_table.set(func.variables[i], value)
-                        else:
-                            self.symbol_table.set(func.variables[i], node.parameters[i])
+        called = None
+        for func in call_targets(node, self.function_list):
+            if func.body is None:
+                error = func.parse_body()
+                if error is not None:
+                    return InterpreterResult().failure(error)
+                if self.optimizer is not None:
+                    self.optimizer.optimize_block(func.body)
+            function = func.body
+            called = func
+            error = bind_arguments(node, func, self.symbol_table.symbols)
+            if error is not None:
+                error.start, error.end = node.pos_start, node.pos_end
+                return InterpreterResult().failure(error)
+        if called is not None and self.tiers is not None:
+            code = self.tiers.code(called) or self.tiers.count(called, "function")
+            if code is not None:
+                return self.run_compiled(code)
         value = None
         for expr in function:
-            value = res.register(self.visit(expr))
+            value = res.register((yield expr))
             if res.error:
                 return res
+            if isinstance(expr, (Pr.ReturnNode, Pr.ReturnExprNode)):
+                # A return ends the call, so nothing after it runs
+                break
 
         return res.success(value)
 
@@ -423,11 +220,7 @@ class Interpreter:
         res = InterpreterResult()
         value = None
         for statement in node.statements:
-            value = res.register(
-                self.visit(
-                    statement,
-                )
-            )
+            value = res.register((yield statement))
             if res.error:
                 return res
         return res.success(value)
@@ -438,11 +231,7 @@ class Interpreter:
     ):
         res = InterpreterResult()
         var_name = node.variable_name.value
-        value = res.register(
-            self.visit(
-                node.value_node,
-            )
-        )
+        value = res.register((yield node.value_node))
         if res.error:
             return res
         self.symbol_table.set(var_name, value)
@@ -476,11 +265,7 @@ class Interpreter:
         res = InterpreterResult()
         token = node.token
 
-        value = res.register(
-            self.visit(
-                token,
-            )
-        )
+        value = res.register((yield token))
         if res.error:
             return res
         else:
@@ -497,6 +282,9 @@ class Interpreter:
             # Directly print supported data types
             if isinstance(statement, (int, str, bool, float)):
                 print(str(statement).strip(), end=" ")
+            elif isinstance(statement, Pr.ConstantNode):
+                # Folded arguments are stored ready to print
+                print(self.constants.values[statement.index], end=" ")
             elif isinstance(statement, Pr.VariableAccessNode):
                 # Retrieve variable value
                 value = self.symbol_table.get(statement.variable_name.value)
@@ -515,9 +303,7 @@ class Interpreter:
                     print(value, end=" ")
             else:
                 # Visit the statement and handle result
-                result = self.visit(
-                    statement,
-                )
+                result = yield statement
                 if result and result.value is not None:  # Avoid printing None
                     if isinstance(result.value, Bool):
                         print(str(result.value.value).strip(), end=" ")
@@ -540,21 +326,37 @@ class Interpreter:
                 )
             )
         try:
-            value = value.copy().set_pos(node.pos_start, node.pos_end)
+            value = value.copy().set_node(node)
         except:
             value = value
         return InterpreterResult().success(value)
 
-    def visit_BinaryOperationNode(self, node):
+    def visit_UniaryOperatorNode(self, node):
         res = InterpreterResult()
-        left = res.register(
-            self.visit(
-                node.left,
+        value = res.register((yield node.node))
+        if res.error:
+            return res
+        if not isinstance(value, Number):
+            return res.failure(
+                Lexer.IllegalOperationError(
+                    f"Can't apply '{node.token.value}' to {type(value).__name__}",
+                    node.pos_start,
+                    node.pos_end,
+                )
             )
-        )
+        if node.token.type == Lexer.TT_MINUS:
+            value = Number(-value.value).set_context(value.context)
+        else:
+            # The operand may be a pooled constant shared by other nodes
+            value = value.copy()
+        return res.success(value.set_node(node))
+
+    def visit_BinaryOperationNode(self, node):
+        res = InterpreterResult()
+        left = res.register((yield node.left))
         if res.error:
             return res
-        right = res.register(self.visit(node.right))
+        right = res.register((yield node.right))
         if res.error:
             return res
 
@@ -586,7 +388,7 @@ class Interpreter:
             if not isinstance(right, Number):
                 right = Number(right)
 
-            if node.token.type == Lexer.TT_ADD:
+            if node.token.type in (Lexer.TT_ADD, Lexer.TT_PLUS):
                 result, error = left.add(right)  # type: ignore
             elif node.token.type == Lexer.TT_MINUS:
                 result, error = left.minus(right)  # type: ignore
@@ -612,42 +414,63 @@ class Interpreter:
                 )
 
         if error:
+            # A pooled operand has no position, but the left one starts
+            # where the operation does and the right one ends where it does
+            if error.start is None:
+                error.start = node.pos_start
+            if error.end is None:
+                error.end = node.pos_end
             return res.failure(error)
         else:
-            return res.success(result.set_pos(node.pos_start, node.pos_end))  # type: ignore
-
+            return res.success(result.set_node(node))  # type: ignore
 
-class SymbolTable:
-    def __init__(self):
-        self.symbols = {}
 
-    def get(self, name):
-        value = self.symbols.get(name)
-        if value == None:
-            return None
-        return value
+# Ways run() can execute a program
+ENGINES = ("tree", "closure", "vm", "python")
 
-    def set(self, name, value):
-        self.symbols[name] = value
 
-    def remove(self, name):
-        del self.symbols[name]
+def run(filename, lazy=False, optimize=True, engine="tree", tiers=None):
+    """
+    Run a program file. `engine` picks the tree walker ("tree"), the
+    closure compiler in closure.py ("closure"), the bytecode VM in vm.py
+    ("vm") or the Python code generator in codegen.py ("python"). They
+    give the same output, except that codegen.py runs some programs the
+    others reject (its docstring lists them), and the compiled engines
+    report code nested past Python's recursion limit as an error.
 
+    The tree walker compiles the functions and loops that turn hot; pass a
+    tiering.Tiering as `tiers` to set the threshold or read its stats().
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
 
-def run(filename):
-
-    interpreter = Interpreter()
-    ast, error = Pr.run(filename)
+    interpreter = Interpreter(tiering.Tiering() if tiers is None else tiers)
+    ast, error = Pr.run(filename, lazy=lazy)
     if ast is None:
         return None, "Parser returned None"
     if error is None:
+        if optimize:
+            interpreter.optimizer = optimizer.Optimizer(interpreter)
+            ast = interpreter.optimizer.optimize(ast)
+        if engine == "closure":
+            compiler = closure.Compiler(interpreter.constants, interpreter.optimizer)
+            return compiler.run(ast), error
+        if engine == "vm":
+            machine = vm.VM(interpreter.constants, interpreter.optimizer)
+            return machine.run(ast), error
+        if engine == "python":
+            result = codegen.run(
+                ast, filename, interpreter.constants, optimize=optimize, lazy=lazy
+            )
+            return result, error
         result = interpreter.visit(ast)
         return result, error
     else:
         return None, error
 
 
-result, error = run("simply.txt")
+if __name__ == "__main__":
+    result, error = run("simply.txt")
 
-if error is not None:
-    print("Error:", error)
+    if error is not None:
+        print("Error:", error)
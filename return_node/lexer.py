@@ -1,4 +1,11 @@
+import io
+import mmap
+import os
+import re
 import string
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 
 # Token types
 TT_KEYWORD = "KEYWORD"
@@ -28,6 +35,8 @@ TT_BOOL = "BOOL"
 LETTERS = string.ascii_letters
 DIGITS = "0123456789"
 LETTER_DIGITS = LETTERS + DIGITS
+CHUNK_SIZE = 64 * 1024
+PARALLEL_CHUNK_SIZE = 1024 * 1024
 
 # Keywords
 KEYWORDS = {
@@ -44,11 +53,32 @@ KEYWORDS = {
 
 
 class Token:
-    def __init__(self, type, value=None, start=None, end=None):
+    # Tokens record plain offsets; Positions are only built when asked for.
+    # Words also carry the symbol id the lexer's InternTable gave them.
+    # `seen` is only set on tokens that Lex.relex has made editable.
+    __slots__ = ("type", "value", "offset", "end_offset", "source", "symbol", "seen")
+
+    def __init__(
+        self, type, value=None, offset=None, end_offset=None, source=None, symbol=None
+    ):
         self.type = type
         self.value = value
-        self.start = start
-        self.end = end
+        self.offset = offset
+        self.end_offset = end_offset
+        self.source = source
+        self.symbol = symbol
+
+    @property
+    def start(self):
+        if self.offset is None:
+            return None
+        return Position(self.offset, self.source)
+
+    @property
+    def end(self):
+        if self.end_offset is None:
+            return None
+        return Position(self.end_offset, self.source)
 
     def matches(self, type, value):
         return self.type == type and self.value == value
@@ -57,16 +87,190 @@ class Token:
         return f"{self.value , self.type}"
 
 
+# The slots that hold a Token's offsets, which EditableToken reads through
+TOKEN_OFFSET = Token.offset
+TOKEN_END_OFFSET = Token.end_offset
+# Edits relex logs before it folds the log into the tokens' offsets, which
+# bounds how much of it a token replays when read
+REBASE_EDITS = 64
+
+
+class EditableToken(Token):
+    """
+    A token in a list that Lex.relex edits in place.
+
+    Relex logs each edit on the Source once, as the old offset from which
+    later text moved and by how much, instead of shifting every later
+    token. A token applies the edits logged since it was last read (the
+    first `seen` are already applied) the next time one of its offsets is
+    read, so tokens nobody looks at are never touched. Every REBASE_EDITS
+    edits, relex brings the whole list up to date and empties the log
+    (see rebase()).
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def adopt(cls, token):
+        """Make `token` editable, with its offsets current as of now."""
+        token.__class__ = cls
+        token.seen = len(token.source.edits)
+        return token
+
+    def catch_up(self):
+        edits = self.source.edits
+        if self.seen == len(edits):
+            return
+        offset = TOKEN_OFFSET.__get__(self)
+        end_offset = TOKEN_END_OFFSET.__get__(self)
+        for moved_from, delta in edits[self.seen :]:
+            if offset >= moved_from:
+                offset += delta
+                end_offset += delta
+        TOKEN_OFFSET.__set__(self, offset)
+        TOKEN_END_OFFSET.__set__(self, end_offset)
+        self.seen = len(edits)
+
+    @classmethod
+    def rebase(cls, tokens):
+        """
+        Apply the whole edit log to `tokens`, which must be every token
+        still in use, and empty it. Each token only looks up the combined
+        shift of the edits it has not seen, so this is one pass over the
+        list whatever the length of the log.
+        """
+        edits = tokens[-1].source.edits
+        maps = shift_maps(edits)
+        for token in tokens:
+            thresholds, shifts = maps[token.seen]
+            offset = TOKEN_OFFSET.__get__(token)
+            shift = shifts[bisect_right(thresholds, offset) - 1]
+            if shift:
+                TOKEN_OFFSET.__set__(token, offset + shift)
+                TOKEN_END_OFFSET.__set__(token, TOKEN_END_OFFSET.__get__(token) + shift)
+            token.seen = 0
+        edits.clear()
+
+    @property
+    def offset(self):
+        self.catch_up()
+        return TOKEN_OFFSET.__get__(self)
+
+    @property
+    def end_offset(self):
+        self.catch_up()
+        return TOKEN_END_OFFSET.__get__(self)
+
+
+def shift_maps(edits):
+    """
+    For each number of edits already seen, the shift the rest of `edits`
+    adds to an offset: a (thresholds, shifts) pair where an offset gets the
+    shift of the last threshold at or below it. Built from the last edit
+    back, each map from the one after it.
+    """
+    thresholds, shifts = [-1], [0]
+    maps = [(thresholds, shifts)]
+    for moved_from, delta in reversed(edits):
+        # Offsets before the edit go on through the later edits unchanged;
+        # offsets after it are moved first
+        later = bisect_right(thresholds, moved_from + delta) - 1
+        pieces = [(t, s) for t, s in zip(thresholds, shifts) if t < moved_from]
+        pieces.append((moved_from, delta + shifts[later]))
+        pieces += [
+            (t - delta, delta + s)
+            for t, s in zip(thresholds, shifts)
+            if t - delta > moved_from
+        ]
+        thresholds = [t for t, _ in pieces]
+        shifts = [s for _, s in pieces]
+        maps.append((thresholds, shifts))
+    maps.reverse()
+    return maps
+
+
+class Source:
+    """
+    A source file and its line-start table.
+
+    The table is built once, the first time a line or column is asked for,
+    so lexing never tracks lines itself. When `text` is None (streamed or
+    memory-mapped sources) the file is re-read on first use, by its
+    absolute path, so a Source loaded from the cache finds its file from
+    any working directory.
+    """
+
+    def __init__(self, filename, text=None, newline=None):
+        self.filename = filename
+        self.path = os.path.abspath(filename)
+        self._text = text
+        self.newline = newline
+        self.line_starts = None
+        # (old offset, shift) of each length-changing edit made by Lex.relex
+        self.edits = []
+
+    @property
+    def text(self):
+        if self._text is None:
+            with open(self.path, newline=self.newline) as f:
+                self._text = f.read()
+        return self._text
+
+    def __getstate__(self):
+        # Pickled sources (e.g. in cached ASTs) re-read their file on demand
+        state = self.__dict__.copy()
+        state["_text"] = None
+        state["line_starts"] = None
+        return state
+
+    def set_text(self, text):
+        self._text = text
+        self.line_starts = None
+
+    def get_line_starts(self):
+        if self.line_starts is None:
+            self.line_starts = [0]
+            self.line_starts.extend(m.end() for m in re.finditer("\n", self.text))
+        return self.line_starts
+
+    def line_col(self, offset):
+        line_starts = self.get_line_starts()
+        line = bisect_right(line_starts, offset) - 1
+        return line, offset - line_starts[line]
+
+    def line_text(self, line):
+        start = self.get_line_starts()[line]
+        end = self.text.find("\n", start)
+        return self.text[start:] if end == -1 else self.text[start:end]
+
+
 class Position:
-    def __init__(self, index, line, col, filename, text):
+    __slots__ = ("index", "source")
+
+    def __init__(self, index, source):
         self.index = index
-        self.line = line
-        self.col = col
-        self.filename = filename
-        self.text = text
+        self.source = source
+
+    @property
+    def filename(self):
+        return self.source.filename
+
+    @property
+    def text(self):
+        return self.source.text
+
+    @property
+    def line(self):
+        return self.source.line_col(self.index)[0]
+
+    @property
+    def column(self):
+        return self.source.line_col(self.index)[1]
+
+    col = column
 
     def copy(self):
-        return Position(self.index, self.line, self.col, self.filename, self.text)
+        return Position(self.index, self.source)
 
 
 class Error:
@@ -78,9 +282,10 @@ class Error:
 
     def print(self) -> str:
         result = f"{self.type}: {self.msg}\n"
-        result += f"File {self.start.filename}, line {self.start.line + 1}, column {self.start.column + 1}\n"
-        result += f"{self.start.text.splitlines()[self.start.line]}\n"
-        result += " " * self.start.column + "^"
+        line, column = self.start.source.line_col(self.start.index)
+        result += f"File {self.start.filename}, line {line + 1}, column {column + 1}\n"
+        result += f"{self.start.source.line_text(line)}\n"
+        result += " " * column + "^"
         return result
 
 
@@ -97,8 +302,9 @@ class IllegalOperationError(Error):
     def print(self) -> str:
         result = self.generate_traceback()
         result += f"{self.type}: {self.msg}\n"
-        result += f"{self.start.text.splitlines()[self.start.line]}\n"
-        result += " " * self.start.column + "^"
+        line, column = self.start.source.line_col(self.start.index)
+        result += f"{self.start.source.line_text(line)}\n"
+        result += " " * column + "^"
         return result
 
     def generate_traceback(self):
@@ -123,52 +329,71 @@ class InvalidSyntaxError(Error):
 class Lex:
     def __init__(self, text, filename):
         self.text = text
-        self.pos = Position(0, 1, 0, filename, text)
+        self.source = Source(filename, text)
+        self.symbols = InternTable()
+        self.index = -1
         self.current = None
         self.tokens = []
         self.filename = filename
         self.iterate()
 
     def iterate(self):
-        self.pos.index += 1
-        self.pos.col += 1
-        self.current = (
-            self.text[self.pos.index - 1] if self.pos.index <= len(self.text) else None
-        )
+        self.index += 1
+        self.current = self.text[self.index] if self.index < len(self.text) else None
 
     def create_token(self):
         while self.current is not None:
             if self.current in " \t":
                 self.iterate()
             elif self.current == "\n":
-                self.tokens.append(Token(TT_NEWLINE, "\n", start=self.pos))
+                self.tokens.append(
+                    Token(TT_NEWLINE, "\n", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "(":
-                self.tokens.append(Token(TT_LP, "(", start=self.pos))
+                self.tokens.append(
+                    Token(TT_LP, "(", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == ")":
-                self.tokens.append(Token(TT_RP, ")", start=self.pos))
+                self.tokens.append(
+                    Token(TT_RP, ")", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == ",":
-                self.tokens.append(Token(TT_COMMA, ",", start=self.pos))
+                self.tokens.append(
+                    Token(TT_COMMA, ",", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "+":
-                self.tokens.append(Token(TT_PLUS, "+", start=self.pos))
+                self.tokens.append(
+                    Token(TT_PLUS, "+", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "-":
-                self.tokens.append(Token(TT_MINUS, "-", start=self.pos))
+                self.tokens.append(
+                    Token(TT_MINUS, "-", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "*":
-                self.tokens.append(Token(TT_MUL, "*", start=self.pos))
+                self.tokens.append(
+                    Token(TT_MUL, "*", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "<":
-                self.tokens.append(Token(TT_LT, "<", start=self.pos))
+                self.tokens.append(
+                    Token(TT_LT, "<", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == ">":
-                self.tokens.append(Token(TT_GT, ">", start=self.pos))
+                self.tokens.append(
+                    Token(TT_GT, ">", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current == "/":
-                self.tokens.append(Token(TT_DIV, "/", start=self.pos))
+                self.tokens.append(
+                    Token(TT_DIV, "/", self.index, self.index + 1, self.source)
+                )
                 self.iterate()
             elif self.current in DIGITS:
                 self.tokens.append(self.create_number())
@@ -177,7 +402,9 @@ class Lex:
             elif self.current in LETTERS:
                 self.tokens.append(self.make_identifier())
             elif self.current == ".":
-                self.tokens.append(Token(TT_STOP, ".", start=self.pos))
+                self.tokens.append(
+                    Token(TT_STOP, ".", self.index, self.index + 1, self.source)
+                )
 
                 # Handle the dot at the end of statements
                 self.iterate()
@@ -185,40 +412,141 @@ class Lex:
                 # Skip any other characters for now
                 self.iterate()
 
-        self.tokens.append(Token(TT_EOF, TT_EOF, start=self.pos))
+        self.tokens.append(Token(TT_EOF, TT_EOF, self.index, self.index, self.source))
         return self.tokens, None
 
-    def create_string(self):
+    def relex(self, old_tokens, edit_range, new_text):
+        """
+        Re-tokenize after replacing text[start:end] with `new_text`.
 
-        string = ""
-        pos_start = self.pos.copy()
+        `edit_range` is the (start, end) pair in old offsets. Only the
+        tokens from just before the edit up to the point where the new
+        stream lines up with the old one again (same type at the same
+        shifted offset) are rescanned; later tokens are reused. `old_tokens`
+        must come from this lexer and is updated in place.
 
-        # Skip the opening quote
-        self.iterate()
+        Reused tokens are not shifted here: the edit is logged and each
+        token applies it when its offsets are next read (see EditableToken),
+        so the Python work per edit is proportional to the rescan. The first
+        call makes `old_tokens` editable, and every REBASE_EDITS edits the log
+        is folded into the offsets; both are one cheap pass over the list.
+        Rebuilding the text and splicing the list still copy the whole file,
+        but as single C-level copies.
+        """
+        if not isinstance(old_tokens[-1], EditableToken):
+            for token in old_tokens:
+                EditableToken.adopt(token)
 
-        while self.current is not None and self.current != '"':
-            string += self.current
-            self.iterate()
+        start, end = edit_range
+        text = self.text[:start] + new_text + self.text[end:]
+        delta = len(new_text) - (end - start)
+        edit_end = start + len(new_text)
 
-        # Skip the closing quote
-        if self.current == '"':
-            self.iterate()
+        # Restart one token before the first token reaching the edit, since a
+        # token that ends right where the edit begins can merge with it
+        first = bisect_left(old_tokens, start, key=lambda token: token.end_offset)
+        first = max(first - 1, 0)
+        restart = min(old_tokens[first].offset, start)
+        # "not x" lexes to two tokens sharing one offset; rescan both
+        while first > 0 and old_tokens[first - 1].offset == restart:
+            first -= 1
+
+        self.text = text
+        self.source.set_text(text)
+        scanner = TableLex(text, self.filename)
+        scanner.source = self.source
+        scanner.symbols = self.symbols
+
+        old_index = bisect_left(old_tokens, end, key=lambda token: token.offset)
+        resync = len(old_tokens)
+        fresh = []
+        for token in scanner.scan(text, index=restart):
+            if token.offset >= edit_end:
+                # The lexer keeps no state between matches, so once a token
+                # starts where an old one did, the rest of the stream agrees
+                target = token.offset - delta
+                while (
+                    old_index < len(old_tokens)
+                    and old_tokens[old_index].offset < target
+                ):
+                    old_index += 1
+                if (
+                    old_index < len(old_tokens)
+                    and old_tokens[old_index].offset == target
+                    and old_tokens[old_index].type == token.type
+                ):
+                    resync = old_index
+                    break
+            fresh.append(token)
+        else:
+            fresh.append(Token(TT_EOF, TT_EOF, len(text), len(text), self.source))
+
+        if delta:
+            # Every reused token starts at or after the end of the edit, and
+            # every token kept from before it starts before that
+            self.source.edits.append((end, delta))
+        old_tokens[first:resync] = map(EditableToken.adopt, fresh)
+        if len(self.source.edits) >= REBASE_EDITS:
+            EditableToken.rebase(old_tokens)
+        self.tokens = old_tokens
+        return old_tokens, None
+
+    def iter_tokens(self, source=None, chunk_size=CHUNK_SIZE):
+        """
+        Lazily yield tokens while reading `source` in fixed-size chunks.
+
+        `source` is any file-like object with a read() method; when omitted
+        the lexer's own text is used. Tokens straddling a chunk boundary are
+        held back until the next chunk completes them, so memory stays
+        bounded by the chunk size (plus the longest token), not the source.
+        """
+        scanner = TableLex(None, self.filename)
+        scanner.symbols = self.symbols
+        if source is None:
+            source = io.StringIO(self.text)
+            scanner.source = self.source
+        buffer = ""
+        base = 0
+        read_size = chunk_size
 
-        return Token(TT_STRING, string, pos_start, self.pos)
+        while True:
+            chunk = source.read(read_size)
+            final = not chunk
+            buffer += chunk
+            consumed = yield from scanner.scan(buffer, base, final)
+            buffer = buffer[consumed:]
+            base += consumed
+            if final:
+                break
+            # A token longer than a chunk would otherwise be rescanned once per
+            # chunk; grow the reads until it fits
+            read_size = chunk_size if consumed else read_size * 2
+
+        yield Token(TT_EOF, TT_EOF, base, base, scanner.source)
+
+    def create_string(self):
+        pos_start = self.index
+        close = STRING_BODY.match(self.text, pos_start + 1).end()
+        value = unescape(self.text[pos_start + 1 : close])
+
+        # Skip the closing quote, if the literal has one
+        self.index = close if close < len(self.text) else close - 1
+        self.iterate()
+
+        return Token(TT_STRING, value, pos_start, self.index, self.source)
 
     def create_identifier(self):
-        id_str = ""
         while self.current is not None and self.current in " \t":
             self.iterate()
+        start = self.index
         while self.current is not None and (self.current in LETTER_DIGITS + "_"):
-            id_str += self.current
             self.iterate()
-        return id_str
+        return self.text[start : self.index]
 
     def create_number(self):
         num_str = ""
         dot_count = 0
-        pos_start = self.pos.copy()
+        pos_start = self.index
         while self.current is not None and (
             self.current.isdigit() or self.current == "."
         ):
@@ -230,36 +558,41 @@ class Lex:
             self.iterate()
 
         if dot_count == 0:
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
+            return Token(TT_INT, int(num_str), pos_start, self.index, self.source)
         else:
-            return Token(TT_DOUBLE, float(num_str), pos_start, self.pos)
+            return Token(TT_DOUBLE, float(num_str), pos_start, self.index, self.source)
 
     def make_identifier(self):
-        id_str = ""
-        pos_start = self.pos.copy()
+        pos_start = self.index
         id_str = self.create_identifier()
-        if id_str == "equals":
-            return Token(TT_EQUAL, TT_EQUAL, pos_start, self.pos)
-        elif id_str == "true":
-            return Token(TT_BOOL, True, pos_start, self.pos)
-        elif id_str == "false":
-            return Token(TT_BOOL, False, pos_start, self.pos)
-
-        elif id_str == "not":
+        if id_str == "not":
+            symbol = self.symbols.lookup(id_str)[2]
             id_str = self.create_identifier()
             if id_str == "equals":
-                return Token(TT_NOT_EQUAL, TT_NOT_EQUAL, pos_start, self.pos)
+                return Token(
+                    TT_NOT_EQUAL, TT_NOT_EQUAL, pos_start, self.index, self.source
+                )
             else:
-                self.tokens.append(Token(TT_IDENTIFIER, "not", pos_start, self.pos))
-                return Token(TT_IDENTIFIER, id_str, pos_start, self.pos)
-        elif id_str in KEYWORDS:
-            return Token(TT_KEYWORD, id_str, pos_start, self.pos)
-        else:
-            return Token(TT_IDENTIFIER, id_str, pos_start, self.pos)
+                self.tokens.append(
+                    Token(
+                        TT_IDENTIFIER, "not", pos_start, self.index, self.source, symbol
+                    )
+                )
+                symbol = self.symbols.lookup(id_str)[2]
+                return Token(
+                    TT_IDENTIFIER,
+                    self.symbols.names[symbol],
+                    pos_start,
+                    self.index,
+                    self.source,
+                    symbol,
+                )
+        type, value, symbol = self.symbols.lookup(id_str)
+        return Token(type, value, pos_start, self.index, self.source, symbol)
 
     def make_number(self):
         num_str = ""
-        pos_start = self.pos.copy()
+        pos_start = self.index
         dot_count = 0
 
         while self.current is not None and (self.current in DIGITS + "."):
@@ -271,15 +604,534 @@ class Lex:
             self.iterate()
 
         if dot_count == 0:
-            return Token(TT_NUMBER, int(num_str), pos_start, self.pos)
+            return Token(TT_NUMBER, int(num_str), pos_start, self.index, self.source)
         else:
-            return Token(TT_NUMBER, float(num_str), pos_start, self.pos)
+            return Token(TT_NUMBER, float(num_str), pos_start, self.index, self.source)
 
 
-def generate(filename):
+# Single-character tokens, shared by the table-driven engine
+SINGLE_CHARS = {
+    "\n": TT_NEWLINE,
+    "(": TT_LP,
+    ")": TT_RP,
+    ",": TT_COMMA,
+    "+": TT_PLUS,
+    "-": TT_MINUS,
+    "*": TT_MUL,
+    "<": TT_LT,
+    ">": TT_GT,
+    "/": TT_DIV,
+    ".": TT_STOP,
+}
+
+# Words the lexer turns into something other than a plain identifier
+WORDS = {
+    "equals": (TT_EQUAL, TT_EQUAL),
+    "true": (TT_BOOL, True),
+    "false": (TT_BOOL, False),
+}
+WORDS.update((word, (TT_KEYWORD, word)) for word in KEYWORDS)
+
+
+class InternTable:
+    """
+    Assigns every distinct word a small integer symbol id.
+
+    Reserved words are seeded first, so a single dict probe both
+    recognises keywords and interns identifiers. Identifier tokens share
+    the stored name, so repeated names cost no extra string memory.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.names = []
+        for word, (type, value) in WORDS.items():
+            self.add(word, type, value)
+        # "not" is only ever an identifier, but give it a fixed id up front
+        self.add("not", TT_IDENTIFIER, "not")
+
+    def add(self, word, type, value):
+        entry = (type, value, len(self.names))
+        self.entries[word] = entry
+        self.names.append(word)
+        return entry
+
+    def lookup(self, word):
+        entry = self.entries.get(word)
+        if entry is None:
+            entry = self.add(word, TT_IDENTIFIER, word)
+        return entry
+
+
+# A string literal's body: plain runs, with each backslash taking the
+# character after it along, up to the closing quote or the end of the text
+STRING_BODY = re.compile(r'[^"\\]*(?:\\[\s\S]?[^"\\]*)*')
+ESCAPES = {'"': '"', "n": "\n", "t": "\t", "\\": "\\"}
+
+
+def unescape(body):
+    """Replace the escapes in a string literal's body with what they stand for."""
+    index = body.find("\\")
+    if index == -1:
+        return body
+    parts = []
+    start = 0
+    while index != -1:
+        parts.append(body[start:index])
+        char = body[index + 1 : index + 2]
+        # Unknown escapes are kept as written
+        parts.append(ESCAPES.get(char, "\\" + char))
+        start = index + 2
+        index = body.find("\\", start)
+    parts.append(body[start:])
+    return "".join(parts)
+
+
+# One alternative per token class, so every match consumes a whole run.
+# Anything the classic lexer would skip character by character is a SKIP run.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<SKIP>[^\n(),+\-*<>/.0-9"A-Za-z]+)
+    | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)
+    | (?P<STRING>"(?P<BODY>[^"\\]*(?:\\[\s\S]?[^"\\]*)*)"?)
+    | (?P<NOT>not(?![A-Za-z0-9_])[ \t]*(?P<NEGATED>[A-Za-z0-9_]*))
+    | (?P<WORD>[A-Za-z][A-Za-z0-9_]*)
+    | (?P<SINGLE>.|\n)
+    """,
+    re.VERBOSE,
+)
+
+
+class TableLex:
+    """
+    Table-driven lexer engine.
+
+    Produces the same token stream as Lex, but consumes a whole run
+    (whitespace, identifier, number, string) per step using a compiled
+    master regex instead of walking the source one character at a time.
+    """
+
+    def __init__(self, text, filename):
+        self.text = text
+        self.filename = filename
+        self.source = Source(filename, text)
+        self.symbols = InternTable()
+        self.tokens = []
+
+    def create_token(self):
+        self.tokens.extend(self.tokenize())
+        return self.tokens, None
+
+    def tokenize(self):
+        yield from self.scan(self.text)
+        length = len(self.text)
+        yield Token(TT_EOF, TT_EOF, length, length, self.source)
+
+    def scan(self, text, base=0, final=True, index=0):
+        """
+        Yield the tokens found in `text` from `index` on, where the first
+        character of `text` sits at offset `base` of the source.
+
+        Unless `final` is set, scanning stops before any match that touches
+        the end of `text`, since more input could still extend it. The
+        generator returns the index in `text` where it stopped.
+        """
+        source = self.source
+        entries = self.symbols.entries
+        lookup = self.symbols.lookup
+        match = TOKEN_PATTERN.match
+        length = len(text)
+
+        while index < length:
+            m = match(text, index)
+            kind = m.lastgroup
+            end = m.end()
+            if end == length and not final:
+                break
+            start = base + index
+            stop = base + end
+
+            if kind == "SINGLE":
+                char = m.group()
+                yield Token(SINGLE_CHARS[char], char, start, stop, source)
+            elif kind == "NUMBER":
+                num_str = m.group()
+                if "." in num_str:
+                    value, type = float(num_str), TT_DOUBLE
+                else:
+                    value, type = int(num_str), TT_INT
+                yield Token(type, value, start, stop, source)
+            elif kind == "STRING":
+                value = unescape(m.group("BODY"))
+                yield Token(TT_STRING, value, start, stop, source)
+            elif kind == "WORD":
+                word = m.group()
+                type, value, symbol = entries.get(word) or lookup(word)
+                yield Token(type, value, start, stop, source, symbol)
+            elif kind == "NOT":
+                negated = m.group("NEGATED")
+                if negated == "equals":
+                    yield Token(TT_NOT_EQUAL, TT_NOT_EQUAL, start, stop, source)
+                else:
+                    yield from self.not_tokens(negated, start, stop)
+
+            index = end
+
+        return index
+
+    def not_tokens(self, negated, start, end):
+        # "not" followed by anything but "equals" lexes as two identifiers
+        not_symbol = self.symbols.lookup("not")[2]
+        symbol = self.symbols.lookup(negated)[2]
+        name = self.symbols.names[symbol]
+        yield Token(TT_IDENTIFIER, "not", start, end, self.source, not_symbol)
+        yield Token(TT_IDENTIFIER, name, start, end, self.source, symbol)
+
+
+# Byte classes for the memory-mapped engine, indexed by the raw byte value
+BC_SKIP, BC_SINGLE, BC_DIGIT, BC_QUOTE, BC_LETTER = range(5)
+BYTE_CLASSES = bytearray(256)
+for char in SINGLE_CHARS:
+    BYTE_CLASSES[ord(char)] = BC_SINGLE
+for char in DIGITS:
+    BYTE_CLASSES[ord(char)] = BC_DIGIT
+for char in LETTERS:
+    BYTE_CLASSES[ord(char)] = BC_LETTER
+BYTE_CLASSES[ord('"')] = BC_QUOTE
+BYTE_CLASSES = bytes(BYTE_CLASSES)
+
+SINGLE_BYTES = {ord(char): (type, char) for char, type in SINGLE_CHARS.items()}
+NON_ASCII = re.compile(rb"[\x80-\xff]")
+SKIP_BYTES = re.compile(rb'[^\n(),+\-*<>/.0-9"A-Za-z]+')
+STRING_BYTES = re.compile(STRING_BODY.pattern.encode("ascii"))
+NUMBER_BYTES = re.compile(rb"[0-9]+(?:\.[0-9]*)?")
+WORD_BYTES = re.compile(rb"[A-Za-z0-9_]*")
+NOT_TAIL = re.compile(rb"[ \t]*([A-Za-z0-9_]*)")
+
+
+class ByteLex(TableLex):
+    """
+    Lexer engine over a bytes-like ASCII buffer such as an mmap.
+
+    Dispatches on a 256-entry byte-class table and scans runs with bytes
+    regexes and find(), decoding only identifier and string slices, so the
+    source is never decoded as a whole.
+    """
+
+    def __init__(self, buffer, filename):
+        super().__init__(buffer, filename)
+        # The buffer is unmapped once lexing finishes, so errors re-read the
+        # file, untranslated so that offsets still match the raw bytes
+        self.source = Source(filename, newline="")
+
+    def create_token(self):
+        buffer = self.text
+        tokens = self.tokens
+        append = tokens.append
+        source = self.source
+        lookup = self.symbols.lookup
+        # Words seen before are found by their raw bytes without decoding
+        words = {}
+        classes = BYTE_CLASSES
+        index = 0
+        length = len(buffer)
+
+        while index < length:
+            byte = buffer[index]
+            kind = classes[byte]
+
+            if kind == BC_SKIP:
+                index = SKIP_BYTES.match(buffer, index).end()
+            elif kind == BC_SINGLE:
+                type, char = SINGLE_BYTES[byte]
+                append(Token(type, char, index, index + 1, source))
+                index += 1
+            elif kind == BC_DIGIT:
+                end = NUMBER_BYTES.match(buffer, index).end()
+                num_bytes = buffer[index:end]
+                if b"." in num_bytes:
+                    value, type = float(num_bytes), TT_DOUBLE
+                else:
+                    value, type = int(num_bytes), TT_INT
+                append(Token(type, value, index, end, source))
+                index = end
+            elif kind == BC_QUOTE:
+                close = STRING_BYTES.match(buffer, index + 1).end()
+                end = close + 1 if close < length else close
+                value = unescape(buffer[index + 1 : close].decode("ascii"))
+                append(Token(TT_STRING, value, index, end, source))
+                index = end
+            else:
+                end = WORD_BYTES.match(buffer, index).end()
+                word = buffer[index:end]
+                if word == b"not":
+                    m = NOT_TAIL.match(buffer, end)
+                    end = m.end()
+                    negated = m.group(1).decode("ascii")
+                    if negated == "equals":
+                        append(Token(TT_NOT_EQUAL, TT_NOT_EQUAL, index, end, source))
+                    else:
+                        tokens.extend(self.not_tokens(negated, index, end))
+                else:
+                    entry = words.get(word)
+                    if entry is None:
+                        entry = words[word] = lookup(word.decode("ascii"))
+                    type, value, symbol = entry
+                    append(Token(type, value, index, end, source, symbol))
+                index = end
+
+        append(Token(TT_EOF, TT_EOF, length, length, source))
+        return tokens, None
+
+
+# Compact type codes for TokenBuffer
+TOKEN_TYPES = [
+    TT_KEYWORD,
+    TT_STRING,
+    TT_LP,
+    TT_RP,
+    TT_EOF,
+    TT_COMMA,
+    TT_NEWLINE,
+    TT_ADD,
+    TT_GT,
+    TT_LT,
+    TT_PLUS,
+    TT_MINUS,
+    TT_MUL,
+    TT_STOP,
+    TT_DIV,
+    TT_INT,
+    TT_DOUBLE,
+    TT_NUMBER,
+    TT_IDENTIFIER,
+    TT_EQUAL,
+    TT_NOT_EQUAL,
+    TT_BOOL,
+]
+TYPE_CODES = {type: code for code, type in enumerate(TOKEN_TYPES)}
+
+
+class TokenBuffer:
+    """
+    Struct-of-arrays token storage.
+
+    Keeps one type code byte and two offsets per token in typed arrays,
+    plus a side list of values, instead of a Token and two Positions per
+    token. Indexing or iterating yields TokenView objects, so anything
+    written against Token (such as Parser) keeps working.
+    """
+
+    def __init__(self, source=None):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        # -1 marks tokens without a symbol id
+        self.symbols = array("i")
+        self.values = []
+
+    @classmethod
+    def from_tokens(cls, tokens):
+        buffer = cls()
+        for token in tokens:
+            buffer.append(token)
+        return buffer
+
+    def append(self, token):
+        if self.source is None:
+            self.source = token.source
+        self.types.append(TYPE_CODES[token.type])
+        self.starts.append(token.offset)
+        self.ends.append(token.end_offset)
+        self.symbols.append(-1 if token.symbol is None else token.symbol)
+        self.values.append(token.value)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
+
+
+class TokenView:
+    """Read-only Token lookalike over one row of a TokenBuffer."""
+
+    __slots__ = ("buffer", "index")
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self):
+        return TOKEN_TYPES[self.buffer.types[self.index]]
+
+    @property
+    def value(self):
+        return self.buffer.values[self.index]
+
+    @property
+    def symbol(self):
+        symbol = self.buffer.symbols[self.index]
+        return None if symbol < 0 else symbol
+
+    @property
+    def start(self):
+        return Position(self.buffer.starts[self.index], self.buffer.source)
+
+    @property
+    def end(self):
+        return Position(self.buffer.ends[self.index], self.buffer.source)
+
+    def matches(self, type, value):
+        return self.type == type and self.value == value
+
+    def __repr__(self) -> str:
+        return f"{self.value , self.type}"
+
+
+ENGINES = {
+    "classic": Lex,
+    "table": TableLex,
+}
+
+
+def generate(filename, engine="classic", mapped=False, compact=False, workers=None):
+    if workers is not None:
+        with open(filename) as f:
+            text = f.read()
+        return generate_parallel(text, filename, workers), None
+
+    if mapped:
+        tokens = generate_mapped(filename)
+        if tokens is not None:
+            if compact:
+                tokens = TokenBuffer.from_tokens(tokens)
+            return tokens, None
+
     with open(filename) as f:
         text = f.read()
-    lexer = Lex(text, filename)
+    if compact:
+        tokens = TableLex(text, filename).tokenize()
+        return TokenBuffer.from_tokens(tokens), None
+    lexer = ENGINES[engine](text, filename)
     tokens, error = lexer.create_token()
     # print(f"Tokens: {tokens}")
     return tokens, error
+
+
+def generate_stream(filename, chunk_size=CHUNK_SIZE):
+    with open(filename) as f:
+        yield from Lex("", filename).iter_tokens(f, chunk_size)
+
+
+def generate_mapped(filename):
+    """
+    Lex `filename` through a read-only memory map with ByteLex.
+
+    Returns None when the file is empty, not pure ASCII or contains a
+    carriage return, in which case the caller should fall back to the
+    decoded-text engines: reading text translates "\r" and "\r\n" line
+    endings to "\n", which changes both the tokens and their offsets.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if NON_ASCII.search(buffer) or buffer.find(b"\r") != -1:
+                return None
+            tokens, _ = ByteLex(buffer, filename).create_token()
+    return tokens
+
+
+def split_statements(text, parts):
+    """
+    Return the offsets at which `text` can be cut into about `parts`
+    pieces. Cuts are made just after a newline that is not inside a
+    string literal, where the lexer carries no state from one side to the
+    other.
+    """
+    size = len(text) // parts
+    points = [0]
+    scanned = 0  # everything before this offset is known to be outside strings
+    target = size
+
+    while target < len(text):
+        cut = text.find("\n", target)
+        if cut == -1:
+            break
+        while True:
+            quote = text.find('"', scanned, cut)
+            if quote == -1:
+                break
+            # Skip the literal the same way the lexer would
+            scanned = TOKEN_PATTERN.match(text, quote).end()
+            if scanned > cut:
+                cut = text.find("\n", scanned)
+                if cut == -1:
+                    return points
+        scanned = cut + 1
+        points.append(scanned)
+        target = scanned + size
+
+    return points
+
+
+def lex_chunk(job):
+    """Worker for generate_parallel: lex one chunk into a TokenBuffer."""
+    chunk, base, filename = job
+    scanner = TableLex(chunk, filename)
+    buffer = TokenBuffer.from_tokens(scanner.scan(chunk, base))
+    # The parent owns the real Source and renumbers the symbol ids
+    buffer.source = None
+    return buffer, scanner.symbols.names
+
+
+def generate_parallel(text, filename, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+    """
+    Lex `text` in a process pool and return a TokenBuffer identical to
+    what the sequential engines produce.
+
+    The text is cut at newlines outside string literals, each piece is
+    lexed with its offsets already shifted by where it starts, and the
+    per-chunk symbol ids are renumbered through one InternTable in chunk
+    order, which reproduces the first-occurrence numbering of a single
+    pass. Sources shorter than two chunks are lexed in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    parts = min(workers * 4, len(text) // chunk_size)
+    points = split_statements(text, parts) if parts > 1 else [0]
+    points.append(len(text))
+    jobs = [
+        (text[start:end], start, filename) for start, end in zip(points, points[1:])
+    ]
+
+    result = TokenBuffer(Source(filename, text))
+    symbols = InternTable()
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            chunks = list(pool.map(lex_chunk, jobs))
+    else:
+        chunks = [lex_chunk(job) for job in jobs]
+
+    for buffer, names in chunks:
+        remap = [symbols.lookup(name)[2] for name in names]
+        # Index -1 (no symbol) must map to itself
+        remap.append(-1)
+        result.types.extend(buffer.types)
+        result.starts.extend(buffer.starts)
+        result.ends.extend(buffer.ends)
+        result.symbols.extend(map(remap.__getitem__, buffer.symbols))
+        result.values.extend(buffer.values)
+
+    result.append(Token(TT_EOF, TT_EOF, len(text), len(text), result.source))
+    return result
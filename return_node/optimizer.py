@@ -0,0 +1,350 @@
+"""
+Optimization pass for SimplyLang.
+
+Runs over the resolved AST once, between parsing and interpretation. Number
+literals and operators whose operands are all constant are evaluated here,
+once, and replaced by a ConstantNode that refers to the result by its index
+in the program's ConstantPool. Runs of constant show(...) arguments are
+collapsed into a single pre-rendered string. The interpreter then answers a
+ConstantNode with the pooled value itself, so loops do no work for their
+literals.
+
+Constant expressions are evaluated by the interpreter itself, so folding
+agrees with running the code; anything that fails at runtime, such as a
+division by zero, is left in place to fail when it is reached.
+
+Dead code elimination needs no interpreter and runs right after name
+resolution, before the AST is cached: it cuts statements that follow a
+return in a function body, drops loops whose condition is made of literals
+and is never true, and drops functions that are never called.
+"""
+
+import lexer
+import parser as Pr
+import values
+
+
+class ConstantPool:
+    """Literal values of one program, each stored once."""
+
+    def __init__(self):
+        self.values = []
+        self.indexes = {}
+
+    def add(self, value):
+        """Intern `value` and return its index."""
+        raw = getattr(value, "value", value)
+        # 1, 1.0 and True compare equal but print differently, and so do
+        # 0.0 and -0.0
+        key = (type(value), type(raw), repr(raw))
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = len(self.values)
+            if hasattr(value, "set_pos"):
+                # Shared by every node that folds to it, so placed at none
+                value.set_pos()
+            self.values.append(value)
+        return index
+
+    def __len__(self):
+        return len(self.values)
+
+
+class Optimizer:
+    def __init__(self, interpreter):
+        # Constant expressions are evaluated by this interpreter, and their
+        # results are pooled where it looks ConstantNodes up
+        self.interpreter = interpreter
+        self.constants = interpreter.constants
+
+    def optimize(self, tree):
+        """Fold the whole program in place and return it."""
+        self.optimize_block(tree.statements)
+        return tree
+
+    def optimize_block(self, statements):
+        """
+        Fold a statement list in place. Nested bodies are walked with an
+        explicit stack, so deep nesting does not grow the Python stack.
+        """
+        stack = [statements]
+        while stack:
+            statements = stack.pop()
+            for i, statement in enumerate(statements):
+                if isinstance(statement, Pr.TillNode):
+                    statement.condition_expr = self.fold(statement.condition_expr)
+                    stack.append(statement.body)
+                elif isinstance(statement, Pr.RepeatNode):
+                    stack.append(statement.body)
+                elif isinstance(statement, Pr.FunctionNode):
+                    # Pre-parsed bodies are folded when they are first parsed
+                    if statement.body is not None:
+                        stack.append(statement.body)
+                elif isinstance(statement, Pr.StatementsNode):
+                    stack.append(statement.statements)
+                elif isinstance(statement, (Pr.VariableNode, Pr.VariableFunctionNode)):
+                    statement.value_node = self.fold(statement.value_node)
+                elif isinstance(statement, Pr.ReturnExprNode):
+                    statement.token = self.fold(statement.token)
+                elif isinstance(statement, Pr.ShowNode):
+                    statement.body = self.collapse(statement)
+                else:
+                    statements[i] = self.fold(statement)
+        return statements
+
+    def fold(self, node):
+        """Return `node` with its constant subexpressions folded."""
+        if isinstance(node, Pr.NumberNode):
+            return self.constant(node)
+        if isinstance(node, Pr.UniaryOperatorNode):
+            node.node = self.fold(node.node)
+            if isinstance(node.node, Pr.ConstantNode):
+                return self.constant(node)
+        elif isinstance(node, Pr.BinaryOperationNode):
+            node.left = self.fold(node.left)
+            node.right = self.fold(node.right)
+            if isinstance(node.left, Pr.ConstantNode) and isinstance(
+                node.right, Pr.ConstantNode
+            ):
+                return self.constant(node)
+        return node
+
+    def constant(self, node):
+        """Evaluate `node` now and pool its value, unless that fails."""
+        result = self.interpreter.visit(node)
+        if result is None or result.error is not None or result.value is None:
+            return node
+        return Pr.ConstantNode(self.constants.add(result.value), node)
+
+    def collapse(self, node):
+        """
+        Fold the arguments of a show(...) and merge each run of constant
+        ones into a single pooled string, printed exactly as the run was.
+        """
+        body = []
+        run = []
+        for item in node.body:
+            if isinstance(item, str):
+                run.append(item.strip())
+                continue
+            item = self.fold(item)
+            if isinstance(item, Pr.ConstantNode):
+                run.append(str(self.constants.values[item.index]))
+                continue
+            if run:
+                body.append(self.text(run, node))
+                run = []
+            body.append(item)
+        if run:
+            body.append(self.text(run, node))
+        return body
+
+    def text(self, run, node):
+        # show() separates its arguments with single spaces
+        return Pr.ConstantNode(self.constants.add(" ".join(run)), node)
+
+
+class DeadCodeEliminator:
+    """
+    Remove code that can never run: statements after a return at the top
+    of a function body, loops whose condition is never true, and functions
+    that nothing calls.
+
+    Calls are followed from the top-level statements through the bodies
+    of the functions they reach. A pre-parsed body has no nodes to follow
+    yet, so every function named anywhere in its tokens counts as called.
+    """
+
+    def __init__(self):
+        self.removed = 0
+        # Every parsed FunctionNode, by name
+        self.functions: dict[str, list[Pr.FunctionNode]] = {}
+
+    def eliminate(self, tree):
+        """Prune `tree` in place and return how many nodes were removed."""
+        self.cut_after_returns(tree)
+        # Before reachable(), so calls made only from dead loops do not count
+        self.cut_dead_loops(tree)
+        self.drop_functions(tree, self.reachable(tree))
+        return self.removed
+
+    def cut_after_returns(self, tree):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Pr.FunctionNode):
+                self.functions.setdefault(node.function_name.value, []).append(node)
+                body = node.body or ()
+                for i, statement in enumerate(body):
+                    if isinstance(statement, (Pr.ReturnNode, Pr.ReturnExprNode)):
+                        self.removed += sum(map(count_nodes, body[i + 1 :]))
+                        del body[i + 1 :]
+                        break
+            stack.extend(children(node))
+
+    def cut_dead_loops(self, tree):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            statements = block_of(node)
+            if statements is None:
+                continue
+            kept = []
+            for i, statement in enumerate(statements):
+                # A loop that can never run is dropped, unless it is the last
+                # statement and so gives its block's value
+                if (
+                    isinstance(statement, Pr.TillNode)
+                    and i + 1 < len(statements)
+                    and never_true(statement.condition_expr)
+                ):
+                    self.removed += count_nodes(statement)
+                else:
+                    kept.append(statement)
+                    stack.append(statement)
+            statements[:] = kept
+
+    def reachable(self, tree):
+        """Return the ids of every function that may be called."""
+        reached = set()
+        stack = [tree]
+        calls = []
+        while stack or calls:
+            if calls:
+                function = calls.pop()
+                if id(function) in reached:
+                    continue
+                reached.add(id(function))
+                if function.body is not None:
+                    stack.extend(function.body)
+                    continue
+                for token in function.tokens:
+                    if token.type == lexer.TT_IDENTIFIER:
+                        calls.extend(self.functions.get(token.value, ()))
+                continue
+
+            node = stack.pop()
+            # A definition only matters once something calls it
+            if isinstance(node, Pr.FunctionNode):
+                continue
+            binding = getattr(node, "binding", None)
+            if binding is not None and binding.kind == "function":
+                calls.append(binding.node)
+            stack.extend(children(node))
+        return reached
+
+    def drop_functions(self, tree, reached):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            statements = block_of(node)
+            if statements is None:
+                continue
+            kept = []
+            for statement in statements:
+                if (
+                    isinstance(statement, Pr.FunctionNode)
+                    and id(statement) not in reached
+                ):
+                    self.removed += count_nodes(statement)
+                else:
+                    kept.append(statement)
+                    stack.append(statement)
+            statements[:] = kept
+
+
+def block_of(node):
+    """Return the statement list of a block node, or None for other nodes."""
+    if isinstance(node, Pr.StatementsNode):
+        return node.statements
+    if isinstance(node, (Pr.TillNode, Pr.RepeatNode, Pr.FunctionNode)):
+        # Pre-parsed bodies are not parsed yet
+        return node.body or []
+    return None
+
+
+def never_true(condition):
+    # Loops only run while their condition is exactly True
+    value = literal_value(condition)
+    return value is not None and value.value is not True
+
+
+def literal_value(node):
+    """
+    Evaluate an expression made only of literals, as the interpreter
+    would. Returns None if it reads anything else or fails.
+    """
+    results = []
+    stack = [(node, False)]
+    while stack:
+        node, operands_done = stack.pop()
+        if isinstance(node, Pr.NumberNode):
+            results.append(values.Number(node.token.value))
+        elif isinstance(node, Pr.BoolNode):
+            results.append(values.Bool(node.token.value))
+        elif isinstance(node, Pr.UniaryOperatorNode):
+            if not operands_done:
+                stack += [(node, True), (node.node, False)]
+                continue
+            value = results.pop()
+            if not isinstance(value, values.Number):
+                return None
+            if node.token.type == lexer.TT_MINUS:
+                value = values.Number(-value.value)
+            results.append(value)
+        elif isinstance(node, Pr.BinaryOperationNode):
+            if not operands_done:
+                stack += [(node, True), (node.right, False), (node.left, False)]
+                continue
+            right = results.pop()
+            left = results.pop()
+            try:
+                results.append(values.binary(node.token, left, right, None, None))
+            except values.Failure:
+                return None
+        else:
+            return None
+    return results[0]
+
+
+def children(node):
+    """Return the nodes directly under `node`."""
+    if isinstance(node, Pr.StatementsNode):
+        return node.statements
+    if isinstance(node, Pr.FunctionNode):
+        # Pre-parsed bodies are not parsed yet
+        return node.body or ()
+    if isinstance(node, Pr.TillNode):
+        return [node.condition_expr, *node.body]
+    if isinstance(node, (Pr.RepeatNode, Pr.ShowNode)):
+        return node.body
+    if isinstance(node, (Pr.VariableNode, Pr.VariableFunctionNode)):
+        return (node.value_node,)
+    if isinstance(node, Pr.ReturnExprNode):
+        return (node.token,)
+    if isinstance(node, Pr.BinaryOperationNode):
+        return (node.left, node.right)
+    if isinstance(node, Pr.UniaryOperatorNode):
+        return (node.node,)
+    return ()
+
+
+def count_nodes(node):
+    """Count the AST nodes in the tree under `node`, including it."""
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        # Tokens and raw show() strings are not nodes
+        if hasattr(node, "pos_start"):
+            count += 1
+        stack.extend(children(node))
+    return count
+
+
+def optimize(tree, interpreter):
+    return Optimizer(interpreter).optimize(tree)
+
+
+def eliminate_dead_code(tree):
+    return DeadCodeEliminator().eliminate(tree)
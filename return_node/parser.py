@@ -1,179 +1,536 @@
-from typing import Any
+from array import array
+from collections import deque
+from typing import Any, Iterable, Iterator
+import cache
 import lexer
+import optimizer
 import parser as Pr
+import resolver
+
+# Cached ASTs are only reused by the exact lexer, parser, resolver and
+# dead code eliminator that built them
+CACHE_VERSION = cache.toolchain_version(
+    lexer.__file__, __file__, resolver.__file__, optimizer.__file__
+)
+
+
+# Nodes are slotted and keep only the tokens they were built from; positions
+# are derived from those tokens on demand instead of being copied per node
+
+
+def start_of(node):
+    """Start position of a node, or of a bare token standing in for one."""
+    # A function starts at its first statement; walk down nested functions
+    # in a loop rather than recursing through each one's pos_start
+    while isinstance(node, FunctionNode) and node.body:
+        node = node.body[0]
+    if isinstance(node, FunctionNode):
+        return node.function_name.start
+    start = getattr(node, "pos_start", None)
+    if start is None:
+        return getattr(node, "start", None)
+    return start
+
+
+def end_of(node):
+    # Blocks end at their last statement, so deep nesting is walked the
+    # same way
+    while isinstance(node, (RepeatNode, FunctionNode, TillNode)) and node.body:
+        node = node.body[-1]
+    if isinstance(node, FunctionNode):
+        return node.function_name.end
+    if isinstance(node, RepeatNode):
+        return node.variable.end
+    if isinstance(node, TillNode):
+        node = node.condition_expr
+    end = getattr(node, "pos_end", None)
+    if end is None:
+        return getattr(node, "end", None)
+    return end
 
 
 class ShowNode:
+    __slots__ = ("body", "keyword")
+
     def __init__(self, body, position_var):
         self.body = body
-        self.pos_start = position_var.start
-        self.pos_end = position_var.end
+        self.keyword = position_var
+
+    @property
+    def pos_start(self):
+        return self.keyword.start
+
+    @property
+    def pos_end(self):
+        return self.keyword.end
+
+    def __repr__(self) -> str:
+        return f"(show {self.body})"
 
 
 class ReturnExprNode:
+    __slots__ = ("token", "pos_token")
+
     def __init__(self, token, pos_token):
         self.token = token
-        self.pos_start = pos_token.start
-        self.pos_end = pos_token.end
+        self.pos_token = pos_token
+
+    @property
+    def pos_start(self):
+        return self.pos_token.start
+
+    @property
+    def pos_end(self):
+        return self.pos_token.end
+
+    def __repr__(self) -> str:
+        return f"(return {self.token})"
 
 
 class ReturnNode:
+    __slots__ = ("token", "binding")
+
     def __init__(self, token):
         self.token = token
-        self.pos_start = self.token.start
-        self.pos_end = self.token.end
+        self.binding = None
+
+    @property
+    def pos_start(self):
+        return self.token.start
+
+    @property
+    def pos_end(self):
+        return self.token.end
+
+    def __repr__(self) -> str:
+        return f"(return {self.token})"
 
 
 class VariableFunctionNode:
+    __slots__ = ("variable_name", "value_node")
+
     def __init__(self, varible_name, value_node):
         self.variable_name = varible_name
         self.value_node = value_node
 
-        self.pos_start = self.variable_name.start
-        self.pos_end = self.variable_name.end
+    @property
+    def pos_start(self):
+        return self.variable_name.start
+
+    @property
+    def pos_end(self):
+        return self.variable_name.end
+
+    def __repr__(self) -> str:
+        return f"({self.variable_name.value} is {self.value_node})"
 
 
 class RepeatNode:
+    __slots__ = ("range", "body", "variable")
+
     def __init__(self, variable, body):
         self.range = variable.value
         self.body = body
-        self.pos_start = variable.start
-        self.pos_end = self.body[len(self.body) - 1].pos_end
+        self.variable = variable
+
+    @property
+    def pos_start(self):
+        return self.variable.start
+
+    @property
+    def pos_end(self):
+        return end_of(self)
+
+    def __repr__(self) -> str:
+        return f"(repeat {self.range} times {self.body})"
 
 
 class FunctionNode:
-    def __init__(self, name, body, variables=None):
+    __slots__ = ("function_name", "body", "parameters", "variables", "tokens", "scopes")
+
+    def __init__(self, name, body, parameters, tokens=None):
         self.function_name = name
+        # A pre-parsed function has no body yet, only its tokens
+        self.body = body
+        # Parameter name tokens, for the resolver, and the names themselves
+        self.parameters = parameters
+        self.variables = [token.value for token in parameters]
+        self.tokens = tokens
+        # Scope chain the body resolves against, kept by the resolver
+        self.scopes = None
+
+    @property
+    def pos_start(self):
+        return start_of(self)
+
+    @property
+    def pos_end(self):
+        return end_of(self)
+
+    def parse_body(self):
+        """
+        Parse and resolve a pre-parsed body the first time it is needed and
+        keep it on the node. Returns the error that stopped it, or None.
+        """
+        if self.body is not None:
+            return None
+        try:
+            body = Parser(self.tokens).function_body()
+        except ParseError as e:
+            return e.error
+        error = resolver.Resolver(self.scopes).resolve_function(body, self.parameters)
+        if error is not None:
+            return error
         self.body = body
-        self.variables = variables
-        self.pos_start = self.body[0].pos_start
-        self.pos_end = self.body[len(self.body) - 1].pos_end
+        self.tokens = self.scopes = None
+        return None
 
     def __repr__(self) -> str:
         return f"({self.body})"
 
 
 class TillNode:
+    __slots__ = ("condition_expr", "body")
+
     def __init__(self, condition_expr, body):
         self.condition_expr = condition_expr
         self.body = body
-        # Handle position attributes safely
-        self.pos_start = getattr(
-            self.condition_expr,
-            "pos_start",
-            getattr(self.condition_expr, "start", None),
-        )
-        if self.body and hasattr(self.body[-1], "pos_end"):
-            self.pos_end = self.body[-1].pos_end
-        elif self.body and hasattr(self.body[-1], "end"):
-            self.pos_end = self.body[-1].end
-        else:
-            self.pos_end = getattr(
-                self.condition_expr,
-                "pos_end",
-                getattr(self.condition_expr, "end", None),
-            )
+
+    @property
+    def pos_start(self):
+        return start_of(self.condition_expr)
+
+    @property
+    def pos_end(self):
+        return end_of(self)
 
     def __repr__(self) -> str:
         return f"(till {self.condition_expr} do {self.body})"
 
 
 class NumberNode:
+    __slots__ = ("token",)
+
     def __init__(self, token):
         self.token = token
-        self.pos_start = self.token.start
-        self.pos_end = self.token.end
+
+    @property
+    def pos_start(self):
+        return self.token.start
+
+    @property
+    def pos_end(self):
+        return self.token.end
 
     def __repr__(self) -> str:
         return f"{self.token}"
 
 
+class BoolNode:
+    __slots__ = ("token",)
+
+    def __init__(self, token):
+        self.token = token
+
+    @property
+    def pos_start(self):
+        return self.token.start
+
+    @property
+    def pos_end(self):
+        return self.token.end
+
+    def __repr__(self) -> str:
+        return f"{self.token}"
+
+
+class ConstantNode:
+    __slots__ = ("index", "node")
+
+    def __init__(self, index, node):
+        # Slot in the program's constant pool, and the node it replaced
+        self.index = index
+        self.node = node
+
+    @property
+    def pos_start(self):
+        return start_of(self.node)
+
+    @property
+    def pos_end(self):
+        return end_of(self.node)
+
+    def __repr__(self) -> str:
+        return f"{self.node}"
+
+
 class VariableNode:
+    __slots__ = ("variable_name", "value_node")
+
     def __init__(self, varible_name, value_node):
         self.variable_name = varible_name
         self.value_node = value_node
-        self.pos_start = self.variable_name.start
-        # Handle different types of value_node (token vs node)
-        if hasattr(value_node, "end"):
-            self.pos_end = value_node.end
-        elif hasattr(value_node, "pos_end"):
-            self.pos_end = value_node.pos_end
-        else:
-            self.pos_end = self.variable_name.end
+
+    @property
+    def pos_start(self):
+        return self.variable_name.start
+
+    @property
+    def pos_end(self):
+        # value_node is either a token or a node
+        return end_of(self.value_node) or self.variable_name.end
+
+    def __repr__(self) -> str:
+        return f"({self.variable_name.value} is {self.value_node})"
 
 
 class VariableAccessNode:
+    __slots__ = ("variable_name", "binding")
+
     def __init__(self, varible_name_token):
         self.variable_name = varible_name_token
-        self.pos_start = self.variable_name.start
-        self.pos_end = self.variable_name.end
+        self.binding = None
+
+    @property
+    def pos_start(self):
+        return self.variable_name.start
+
+    @property
+    def pos_end(self):
+        return self.variable_name.end
+
+    def __repr__(self) -> str:
+        return f"{self.variable_name}"
 
 
 class UniaryOperatorNode:
+    __slots__ = ("token", "node")
+
     def __init__(self, op_token, node):
         self.token = op_token
         self.node = node
 
+    @property
+    def pos_start(self):
+        return self.token.start
+
+    @property
+    def pos_end(self):
+        # String operands are bare tokens rather than nodes
+        return end_of(self.node)
+
     def __repr__(self) -> str:
         return f"({self.token} {self.node})"
 
 
 class FunctionCallNode:
+    __slots__ = ("function_name", "function", "parameters", "binding")
+
     def __init__(self, function_name, function, parameters):
         self.function_name = function_name
+        self.function = function
         self.parameters = parameters
-        self.pos_start = function.start
-        self.pos_end = function.end
+        self.binding = None
+
+    @property
+    def pos_start(self):
+        return self.function.start
+
+    @property
+    def pos_end(self):
+        return self.function.end
 
     def __repr__(self) -> str:
         return f"({self.function_name})"
 
 
 class BinaryOperationNode:
+    __slots__ = ("left", "token", "right")
+
     def __init__(self, left, op, right):
 
         self.left = left
         self.token = op
         self.right = right
-        self.pos_start = self.left.pos_start
-        self.pos_end = self.right.pos_end
+
+    @property
+    def pos_start(self):
+        # String operands are bare tokens rather than nodes
+        return start_of(self.left)
+
+    @property
+    def pos_end(self):
+        return end_of(self.right)
 
     def __repr__(self) -> str:
         return f"({self.left} {self.token.value} {self.right})"
 
 
 class StatementsNode:
+    __slots__ = ("statements", "removed")
+
     def __init__(self, statements):
         self.statements = statements
+        # Nodes dead code elimination cut from the program, kept with it
+        # so a cached tree still reports them
+        self.removed = 0
+
+    def __repr__(self) -> str:
+        return f"{self.statements}"
+
+
+NODE_TYPES = (
+    ShowNode,
+    ReturnExprNode,
+    ReturnNode,
+    VariableFunctionNode,
+    RepeatNode,
+    FunctionNode,
+    TillNode,
+    NumberNode,
+    BoolNode,
+    ConstantNode,
+    VariableNode,
+    VariableAccessNode,
+    UniaryOperatorNode,
+    FunctionCallNode,
+    BinaryOperationNode,
+    StatementsNode,
+)
+KIND_CODES = {node_type: code for code, node_type in enumerate(NODE_TYPES)}
+
+# What an arena field holds, in its low bits; the rest is the payload
+FIELD_NONE, FIELD_NODE, FIELD_TOKEN, FIELD_LIST, FIELD_INT, FIELD_OBJECT = range(6)
+FIELD_BITS = 3
+
+
+class NodeArena:
+    """
+    A parsed tree stored as rows of typed arrays instead of node objects.
+
+    Each node is a kind code and the offset of its fields, one per slot of
+    its class. A field holds a tag and a payload: a child row, the index of
+    a token in the TokenBuffer the tree was parsed from, the offset of a
+    list (its length, then its items), or a small int. Anything else goes
+    to a side list. The engines walk node objects, so this is a storage
+    form: field() reads one slot in place and tree() rebuilds the objects.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.kinds = array("B")
+        self.firsts = array("I")
+        self.fields = array("q")
+        self.objects = []
+
+    @classmethod
+    def from_tree(cls, tree, tokens):
+        """Store `tree`, parsed from the TokenBuffer `tokens`."""
+        arena = cls(tokens)
+        pending = [(None, tree)]
+        # Fields are reserved first and filled as their values come off
+        # the stack, so nesting depth costs no recursion
+        while pending:
+            index, value = pending.pop()
+            field = arena.encode(value, pending)
+            if index is not None:
+                arena.fields[index] = field
+        return arena
+
+    def encode(self, value, pending):
+        fields = self.fields
+        if value is None:
+            return FIELD_NONE
+        kind = KIND_CODES.get(type(value))
+        if kind is not None:
+            row = len(self.kinds)
+            self.kinds.append(kind)
+            self.firsts.append(len(fields))
+            slots = NODE_TYPES[kind].__slots__
+            pending.extend(
+                (len(fields) + offset, getattr(value, slot))
+                for offset, slot in enumerate(slots)
+            )
+            fields.extend([FIELD_NONE] * len(slots))
+            return row << FIELD_BITS | FIELD_NODE
+        if isinstance(value, lexer.TokenView) and value.buffer is self.tokens:
+            return value.index << FIELD_BITS | FIELD_TOKEN
+        if type(value) is list:
+            offset = len(fields)
+            fields.append(len(value))
+            pending.extend((offset + 1 + i, item) for i, item in enumerate(value))
+            fields.extend([FIELD_NONE] * len(value))
+            return offset << FIELD_BITS | FIELD_LIST
+        if type(value) is int and 0 <= value < 1 << 59:
+            return value << FIELD_BITS | FIELD_INT
+        self.objects.append(value)
+        return (len(self.objects) - 1) << FIELD_BITS | FIELD_OBJECT
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def kind(self, row):
+        return NODE_TYPES[self.kinds[row]]
+
+    def field(self, row, name):
+        """
+        One slot of the node in `row`. Child nodes come back as their rows,
+        so nothing is built beyond the value asked for.
+        """
+        slots = NODE_TYPES[self.kinds[row]].__slots__
+        return self.decode(self.fields[self.firsts[row] + slots.index(name)], None)
+
+    def decode(self, field, nodes):
+        tag = field & ((1 << FIELD_BITS) - 1)
+        payload = field >> FIELD_BITS
+        if tag == FIELD_NODE:
+            return payload if nodes is None else nodes[payload]
+        if tag == FIELD_TOKEN:
+            return self.tokens[payload]
+        if tag == FIELD_LIST:
+            fields = self.fields
+            return [
+                self.decode(fields[index], nodes)
+                for index in range(payload + 1, payload + 1 + fields[payload])
+            ]
+        if tag == FIELD_INT:
+            return payload
+        if tag == FIELD_OBJECT:
+            return self.objects[payload]
+        return None
+
+    def tree(self):
+        """Rebuild the node objects and return the root."""
+        nodes = [NODE_TYPES[kind].__new__(NODE_TYPES[kind]) for kind in self.kinds]
+        fields = self.fields
+        for node, first in zip(nodes, self.firsts):
+            for offset, slot in enumerate(type(node).__slots__):
+                setattr(node, slot, self.decode(fields[first + offset], nodes))
+        return nodes[0]
 
 
 class ParserResult:
+    """What Parser.parse() returns: the tree, or the error that stopped it."""
+
     def __init__(self):
         self.error = None
         self.node = None
-        self.advance_count = 0
-
-    def register_advance(self):
-        self.advance_count += 1
-
-    def register(self, res):
-        if res != None:
-            try:
-                self.advance_count += res.advance_count
-                if res.error:
-                    self.error = res.error
-                return res.node
-            except:
-                return res
 
     def success(self, node):
         self.node = node
         return self
 
     def failure(self, error):
-        if not self.error or self.advance_count == 0:
-            self.error = error
-            return self
+        self.error = error
+        return self
+
+
+class ParseError(Exception):
+    """Raised anywhere inside the parser to abandon the parse with `error`."""
+
+    def __init__(self, error):
+        super().__init__(error.msg)
+        self.error = error
 
 
 class Error:
@@ -185,9 +542,10 @@ class Error:
 
     def print(self) -> str:
         result = f"{self.type}: {self.msg}\n"
-        result += f"File {self.start.filename}, line {self.start.line + 1}, column {self.start.column + 1}\n"
-        result += f"{self.start.text.splitlines()[self.start.line]}\n"
-        result += " " * self.start.column + "^"
+        line, column = self.start.source.line_col(self.start.index)
+        result += f"File {self.start.filename}, line {line + 1}, column {column + 1}\n"
+        result += f"{self.start.source.line_text(line)}\n"
+        result += " " * column + "^"
         return result
 
 
@@ -204,8 +562,9 @@ class IllegalOperationError(Error):
     def print(self) -> str:
         result = self.generate_traceback()
         result += f"{self.type}: {self.msg}\n"
-        result += f"{self.start.text.splitlines()[self.start.line]}\n"
-        result += " " * self.start.column + "^"
+        line, column = self.start.source.line_col(self.start.index)
+        result += f"{self.start.source.line_text(line)}\n"
+        result += " " * column + "^"
         return result
 
     def generate_traceback(self):
@@ -227,104 +586,191 @@ class InvalidSyntaxError(Error):
         super().__init__(error_msg, "Illegal syntax", start, end)
 
 
+# Binding power of each infix operator; higher binds tighter. All of them
+# are left-associative.
+BINDING_POWERS = {
+    lexer.TT_EQUAL: 10,
+    lexer.TT_NOT_EQUAL: 10,
+    lexer.TT_LT: 20,
+    lexer.TT_GT: 20,
+    lexer.TT_PLUS: 30,
+    lexer.TT_ADD: 30,
+    lexer.TT_MINUS: 30,
+    lexer.TT_MUL: 40,
+    lexer.TT_DIV: 40,
+}
+# Unary plus and minus bind tighter than any infix operator
+PREFIX_OPERATORS = (lexer.TT_PLUS, lexer.TT_ADD, lexer.TT_MINUS)
+PREFIX_BINDING_POWER = 50
+# Tokens that can begin an expression inside show(...)
+EXPRESSION_STARTS = (
+    lexer.TT_IDENTIFIER,
+    lexer.TT_INT,
+    lexer.TT_DOUBLE,
+    lexer.TT_BOOL,
+    lexer.TT_LP,
+) + PREFIX_OPERATORS
+# Keywords that open a block closed by '.'
+BLOCK_OPENERS = ("does", "do", "times")
+
+
+class Block:
+    """A block statement whose header is parsed and whose body is still open."""
+
+    __slots__ = ("build", "body", "trace")
+
+    def __init__(self, build, trace=False):
+        self.build = build
+        self.body = []
+        self.trace = trace
+
+    def add(self, statement):
+        self.body.append(statement)
+        if self.trace:
+            print(f"Adding statement: {statement}")
+
+    def close(self):
+        return self.build(self.body)
+
+
 class Parser:
-    def __init__(self, tokens: list[lexer.Token]):
-        self.tokens: list[lexer.Token] = tokens
+    def __init__(self, tokens: Iterable[lexer.Token], lazy=False):
+        # Tokens are pulled on demand, so `tokens` may be a lazy stream such
+        # as lexer.generate_stream(); only the lookahead is kept in memory
+        self.tokens: Iterator[lexer.Token] = iter(tokens)
+        self.lookahead: deque[lexer.Token | None] = deque()
         self.current_token: lexer.Token | None = None
-        self.index: int = -1
-        self.functionNames = []
+        # Errors past the end of the tokens point at the last one consumed
+        self.previous_token: lexer.Token | None = None
         self.is_class = False
-        self.variables: list[str] = []
+        # Only pre-parse function bodies; see FunctionNode.parse_body()
+        self.lazy = lazy
         self.advance()
 
     def advance(self):
-        self.index += 1
-        self.current_token = (
-            self.tokens[self.index] if self.index < len(self.tokens) else None
-        )
+        if self.current_token is not None:
+            self.previous_token = self.current_token
+        if self.lookahead:
+            self.current_token = self.lookahead.popleft()
+        else:
+            self.current_token = next(self.tokens, None)
+
+    def peek(self, offset=1):
+        while len(self.lookahead) < offset:
+            self.lookahead.append(next(self.tokens, None))
+        return self.lookahead[offset - 1]
+
+    def syntax_error(self, msg, token=None):
+        token = token or self.current_token or self.previous_token
+        return ParseError(lexer.InvalidSyntaxError(msg, token.start, token.end))
 
     def parse(self):
         res = ParserResult()
         statements = []
 
-        while self.current_token != None and self.current_token.type != lexer.TT_EOF:
-            if self.current_token.type == lexer.TT_NEWLINE:
-                res.register_advance()
-                self.advance()
-                continue
+        try:
+            while (
+                self.current_token != None and self.current_token.type != lexer.TT_EOF
+            ):
+                if self.current_token.type == lexer.TT_NEWLINE:
+                    self.advance()
+                    continue
 
-            stmt = res.register(self.expr())
-            if res.error:
-                return res
-            statements.append(stmt)
+                statements.append(self.expr())
 
-            if self.current_token != None and self.current_token.type not in (
-                lexer.TT_NEWLINE,
-                lexer.TT_EOF,
-            ):
-                self.advance()
+                if self.current_token != None and self.current_token.type not in (
+                    lexer.TT_NEWLINE,
+                    lexer.TT_EOF,
+                ):
+                    self.advance()
+        except ParseError as e:
+            return res.failure(e.error)
         return res.success(StatementsNode(statements))
 
-    def factor(self):
-        result = ParserResult()
+    def expression(self, min_power=0):
+        """Parse an expression whose operators all bind tighter than `min_power`."""
+        left = self.prefix()
+
+        while self.current_token is not None:
+            op = self.current_token
+            power = BINDING_POWERS.get(op.type)
+            if power is None or power <= min_power:
+                break
+            self.advance()
+            right = self.expression(power)
+            left = BinaryOperationNode(left, op, right)
+        return left
+
+    def prefix(self):
         token = self.current_token
+        if token is None:
+            raise self.syntax_error("Expected an expression")
 
-        if token != None:
-            if token.type in (lexer.TT_ADD, lexer.TT_MINUS):
-                result.register_advance()
-                self.advance()
-                factor = result.register(self.factor())
-                if result.error:
-                    return result
-                return result.success(UniaryOperatorNode(token, factor))
+        if token.type in PREFIX_OPERATORS:
+            self.advance()
+            return UniaryOperatorNode(token, self.expression(PREFIX_BINDING_POWER))
+        if token.type == lexer.TT_LP:
+            self.advance()
+            node = self.expression()
+            if self.current_token is None or self.current_token.type != lexer.TT_RP:
+                raise self.syntax_error("Expected ')'", self.current_token or token)
+            self.advance()
+            return node
+        if token.type == lexer.TT_STRING:
+            self.advance()
+            return token
+        if token.type in (lexer.TT_INT, lexer.TT_DOUBLE):
+            self.advance()
+            return NumberNode(token)
+        if token.type == lexer.TT_BOOL:
+            self.advance()
+            return BoolNode(token)
+        if token.type == lexer.TT_IDENTIFIER:
+            self.advance()
+            return VariableAccessNode(token)
 
-            elif token.type in (lexer.TT_GT, lexer.TT_LT):
+        raise self.syntax_error("Expected an expression")
 
-                result.register_advance()
-                self.advance()
-                factor = result.register(self.factor())
-                if result.error:
-                    return result
-                return result.success(UniaryOperatorNode(token, factor))
-            if token.type == lexer.TT_STRING:
-                result.register_advance()
-                self.advance()
-                return result.success(token)
-            elif token.type in (lexer.TT_INT, lexer.TT_DOUBLE):
-                result.register_advance()
-                self.advance()
-                return result.success(NumberNode(token))
-            elif token.type == lexer.TT_IDENTIFIER:
-                result.register_advance()
+    def expr(self, seen=False):
+        """Parse one statement, including every block nested inside it."""
+        node = self.statement(seen)
+        if isinstance(node, Block):
+            return self.close_blocks(node)
+        return node
+
+    def close_blocks(self, block):
+        """
+        Parse the body of `block` up to its closing '.'. Nested blocks are
+        kept on an explicit stack rather than parsed recursively, so the
+        nesting depth is bounded only by memory.
+        """
+        stack = [block]
+        while True:
+            block = stack[-1]
+            self.skip_newlines()
+            token = self.current_token
+            if token is None or token.type == lexer.TT_EOF:
+                raise self.syntax_error("Expected '.'")
+
+            if token.type == lexer.TT_STOP:
                 self.advance()
-                return result.success(VariableAccessNode(token))
-        return None
+                stack.pop()
+                node = block.close()
+                if not stack:
+                    return node
+                stack[-1].add(node)
+                continue
 
-    def bin_operation(self, function, ops):
-        res = ParserResult()
-        left = res.register(function())
-        if res.error:
-            return res
-        while self.current_token is not None and self.current_token.type in ops:
-            token = self.current_token
-            res.register_advance()
-            self.advance()
-            right = res.register(function())
-            if res.error:
-                return res
-            left = BinaryOperationNode(left, token, right)
-        return res.success(left)
-
-    def term(self):
-        return (
-            self.factor()
-        )  # Simplified since we only need to handle strings    def skip_newlines(self, res):
-        # Helper method to skip over newlines
+            node = self.statement()
+            if isinstance(node, Block):
+                stack.append(node)
+            else:
+                block.add(node)
 
-    def expr(self, seen=False):
-        res = ParserResult()
+    def statement(self, seen=False):
+        """Parse one statement; a block statement comes back as an open Block."""
         if self.current_token is None:
-            return res.failure("Expected an expression")
+            raise self.syntax_error("Expected an expression")
         temp = self.current_token
 
         if (
@@ -339,7 +785,7 @@ class Parser:
                 lexer.TT_DOUBLE,
                 lexer.TT_STRING,
             ):
-                return res.failure(
+                raise ParseError(
                     lexer.InvalidSyntaxError(
                         "Unexpected Identifier",
                         self.current_token.start,
@@ -347,79 +793,53 @@ class Parser:
                     )
                 )
             pos_token = self.current_token
-            if self.tokens[self.index + 1].type == lexer.TT_NEWLINE:
+            if self.peek().type == lexer.TT_NEWLINE:
                 value = self.current_token
-                res.register_advance()
                 self.advance()
-                return res.success(ReturnNode(value))
+                return ReturnNode(value)
             else:
-                value = res.register(self.expr())
-                if res.error:
-                    return res
-                res.register_advance()
+                value = self.expr()
                 self.advance()
-                return res.success(ReturnExprNode(value, pos_token))
+                return ReturnExprNode(value, pos_token)
 
         if not seen and self.current_token.type == lexer.TT_IDENTIFIER:
             # Store the variable name token
             variable_token = self.current_token
 
-            res.register_advance()
             self.advance()
             if self.current_token.type == lexer.TT_LP:
 
                 parameters = []
-                if temp.value not in self.functionNames:
-                    return res.failure(
-                        lexer.InvalidSyntaxError(
-                            f"Function Name {temp.value} not defined",
-                            temp.start,
-                            temp.end,
-                        )
-                    )
                 self.advance()
                 while self.current_token.type != lexer.TT_RP:
                     if self.current_token.type == lexer.TT_NEWLINE:
-                        res.failure(
+                        raise ParseError(
                             lexer.InvalidSyntaxError("Expected )", temp.start, temp.end)
                         )
-                    if self.current_token.type == lexer.TT_IDENTIFIER:
-                        if self.current_token.value not in self.variables:
-                            return res.failure(
-                                lexer.InvalidSyntaxError(
-                                    f"Variable  Name {temp.value} not defined",
-                                    temp.start,
-                                    temp.end,
-                                )
-                            )
-
-                    parameters.append(self.current_token.value)
+                    parameters.append(self.current_token)
 
                     self.advance()
 
-                    self.skip_commas(res)
+                    self.skip_commas()
 
                 self.advance()
-                res.register_advance()
 
-                return res.success(FunctionCallNode(temp.value, temp, parameters))
+                return FunctionCallNode(temp.value, temp, parameters)
 
             if self.current_token.value == "takes":
                 self.advance()
-                variables = []
+                parameters = []
 
                 while self.current_token.value != "does":
                     if self.current_token.type != lexer.TT_IDENTIFIER:
-                        return res.failure(
+                        raise ParseError(
                             lexer.InvalidSyntaxError(
                                 f"Expected Identifier not {self.current_token.type}",
                                 self.current_token.start,
                                 self.current_token.end,
                             )
                         )
-                    variable = self.current_token.value
-                    variables.append(variable)
-                    self.variables.append(variable)
+                    parameters.append(self.current_token)
 
                     self.advance()
 
@@ -427,39 +847,19 @@ class Parser:
                         self.advance()
 
                 if self.current_token.value == "does":
-                    if temp.value in self.functionNames:
-                        return res.failure(
-                            lexer.InvalidSyntaxError(
-                                f"Function Name {temp.value} already defined",
-                                self.current_token.start,
-                                self.current_token.end,
-                            )
-                        )
                     name = temp
-                    res.register_advance()
-                    self.advance()
-                    then_expr = []
-                    while self.current_token.type != lexer.TT_STOP:
-                        self.skip_newlines(res)
-                        expr = res.register(self.expr())
-                        if res.error:
-                            return res
-                        then_expr.append(expr)
-                        self.skip_newlines(res)
-                    res.register_advance()  # Consume the STOP token
                     self.advance()
-
-                    self.functionNames.append(name.value)
-                    return res.success(FunctionNode(name, then_expr, variables))
+                    if self.lazy:
+                        return FunctionNode(name, None, parameters, self.skip_block())
+                    return Block(lambda body: FunctionNode(name, body, parameters))
 
             # Check if next token is 'is' keyword
             if (
                 self.current_token.type != lexer.TT_KEYWORD
                 and self.current_token.value != "is"
             ):
-                return res.failure("Expected 'is' keyword after identifier")
+                raise self.syntax_error("Expected 'is' keyword after identifier")
 
-            res.register_advance()
             self.advance()
 
             # Handle the expression (either a direct value or a complex expression)
@@ -469,38 +869,25 @@ class Parser:
             ):
                 # Direct value assignment
                 expression = self.current_token
-                res.register_advance()
                 self.advance()
 
-                # Store variable in our tracking list
-                if expression.value is not None:
-                    self.variables.append(str(variable_token.value))
-
-                return res.success(VariableNode(variable_token, expression))
+                return VariableNode(variable_token, expression)
             else:
                 # Complex expression
-                expression = res.register(self.expr(True))
-                if res.error:
-                    return res
-                # Store variable in our tracking list
-                if variable_token.value is not None:
-                    self.variables.append(str(variable_token.value))
+                expression = self.expr(True)
 
-                return res.success(VariableNode(variable_token, expression))
+                return VariableNode(variable_token, expression)
 
         if (
             self.current_token.type == lexer.TT_KEYWORD
             and self.current_token.value == "till"
         ):
-            res.register_advance()
             self.advance()
 
-            condition_expression = res.register(self.expr(True))
-            if res.error:
-                return res
+            condition_expression = self.expr(True)
 
             if not self.current_token.matches(lexer.TT_KEYWORD, "do"):
-                return res.failure(
+                raise ParseError(
                     lexer.InvalidSyntaxError(
                         "Expected 'do'",
                         self.current_token.start,
@@ -508,48 +895,18 @@ class Parser:
                     )
                 )
 
-            res.register_advance()
-            self.advance()
-
-            self.skip_newlines(res)
-
-            then_expr = []
-            while self.current_token.type != lexer.TT_EOF:
-                if self.current_token.value == ".":
-                    break
-
-                stmt = res.register(self.expr(False))
-                if res.error:
-                    return res
-                then_expr.append(stmt)
-
-                self.skip_newlines(res)
-
-            if (
-                self.current_token.type != lexer.TT_STOP
-                or self.current_token.value != "."
-            ):
-                return res.failure(
-                    lexer.InvalidSyntaxError(
-                        "Expected '.'", self.current_token.start, self.current_token.end
-                    )
-                )
-
-            res.register_advance()
             self.advance()
 
-            return res.success(TillNode(condition_expression, then_expr))
+            return Block(lambda body: TillNode(condition_expression, body))
         if (
             self.current_token.type == lexer.TT_KEYWORD
             and self.current_token.value == "show"
         ):
             position_var = self.current_token
 
-            res.register_advance()
             self.advance()
             if self.current_token.type != lexer.TT_LP:
-                return res.failure("Expected '('")
-            res.register_advance()
+                raise self.syntax_error("Expected '('")
             self.advance()
             body = []
 
@@ -558,14 +915,11 @@ class Parser:
                 data = None
                 if self.current_token.type == lexer.TT_STRING:
                     data = self.current_token.value
-                    res.register_advance()
                     self.advance()
                     body.append(data)
 
-                if self.current_token.type == lexer.TT_IDENTIFIER:
-                    expr = res.register(self.expr(True))
-                    if res.error:
-                        return res.error
+                if self.current_token.type in EXPRESSION_STARTS:
+                    expr = self.expr(True)
                     data = expr
                     body.append(data)
 
@@ -573,74 +927,50 @@ class Parser:
                     self.current_token.type != lexer.TT_RP
                     and self.current_token.type != lexer.TT_COMMA
                 ):
-                    return res.failure("Expected ','")
+                    raise self.syntax_error("Expected ','")
 
                 if self.current_token.type != lexer.TT_RP:
                     self.advance()
 
                 if self.current_token.type == lexer.TT_NEWLINE:
-                    return res.failure("Expected ')'")
-            res.register_advance()
+                    raise self.syntax_error("Expected ')'")
             self.advance()
-            return res.success(ShowNode(body, position_var))
+            return ShowNode(body, position_var)
 
         if self.current_token.type == lexer.TT_IDENTIFIER:
             variable = temp
             function_name = self.current_token
-            if self.tokens[self.index + 1].type == lexer.TT_LP:
+            if self.peek().type == lexer.TT_LP:
                 self.advance()
                 parameters = []
-
-                if function_name.value not in self.functionNames:
-                    return res.failure(
-                        lexer.InvalidSyntaxError(
-                            f"-- Function Name {function_name.value} not defined",
-                            function_name.start,
-                            function_name.end,
-                        )
-                    )
                 self.advance()
                 while self.current_token.type != lexer.TT_RP:
                     if self.current_token.type == lexer.TT_NEWLINE:
-                        res.failure(
+                        raise ParseError(
                             lexer.InvalidSyntaxError(
                                 "Expected )", function_name.start, function_name.end
                             )
                         )
 
-                    if self.current_token.type == lexer.TT_IDENTIFIER:
-                        if self.current_token.value not in self.variables:
-                            return res.failure(
-                                lexer.InvalidSyntaxError(
-                                    f"Variable Name {function_name.value} not defined",
-                                    function_name.start,
-                                    function_name.end,
-                                )
-                            )
-
-                    parameters.append(self.current_token.value)
+                    parameters.append(self.current_token)
 
                     self.advance()
 
-                    self.skip_commas(res)
+                    self.skip_commas()
 
                 self.advance()
-                res.register_advance()
 
-                self.variables.append(variable.value)  # type: ignore
                 if self.is_class == True:
                     self.is_class = False
-                    return res.success(
-                        FunctionCallNode(function_name.value, function_name, parameters)
+                    return FunctionCallNode(
+                        function_name.value, function_name, parameters
                     )
                 else:
-                    return res.success(
-                        VariableFunctionNode(
-                            variable,
-                            FunctionCallNode(
-                                function_name.value, function_name, parameters
-                            ),
-                        )
+                    return VariableFunctionNode(
+                        variable,
+                        FunctionCallNode(
+                            function_name.value, function_name, parameters
+                        ),
                     )
 
         if (
@@ -648,15 +978,13 @@ class Parser:
             and self.current_token.value == "repeat"
         ):
             print("Found repeat")
-            res.register_advance()
             self.advance()
 
             variable = self.current_token
-            res.register_advance()
             self.advance()
 
             if not self.current_token.matches(lexer.TT_KEYWORD, "times"):
-                return res.failure(
+                raise ParseError(
                     lexer.InvalidSyntaxError(
                         "Expected 'times'",
                         self.current_token.start,
@@ -664,120 +992,149 @@ class Parser:
                     )
                 )
 
-            res.register_advance()
             self.advance()
 
-            self.skip_newlines(res)
-
-            then_expr = []
-            while self.current_token.type != lexer.TT_EOF:
-                if self.current_token.value == ".":
-                    break
-
-                stmt = res.register(self.expr())
-                if res.error:
-                    return res
-                then_expr.append(stmt)
-                print(f"Adding statement: {stmt}")
-                self.skip_newlines(res)
-
-            if (
-                self.current_token.type != lexer.TT_STOP
-                or self.current_token.value != "."
-            ):
-                return res.failure(
-                    lexer.InvalidSyntaxError(
-                        "Expected '.'", self.current_token.start, self.current_token.end
-                    )
-                )
-
-            res.register_advance()
+            # Statements added to a repeat block are traced as they are parsed
+            return Block(lambda body: RepeatNode(variable, body), trace=True)
+        return self.expression()
+
+    def function_body(self):
+        return self.close_blocks(Block(lambda body: body))
+
+    def skip_block(self):
+        """
+        Collect the tokens of a block up to and including the '.' that
+        closes it, without parsing them. Nested blocks are matched by
+        counting the keywords that open them.
+        """
+        tokens = []
+        depth = 0
+        while True:
+            token = self.current_token
+            if token is None or token.type == lexer.TT_EOF:
+                raise self.syntax_error("Expected '.'")
+            tokens.append(token)
             self.advance()
-
-            return res.success(RepeatNode(variable, then_expr))
-        return self.bin_operation(
-            self.term,
-            (
-                lexer.TT_ADD,
-                lexer.TT_MINUS,
-                lexer.TT_LT,
-                lexer.TT_GT,
-            ),
+            if token.type == lexer.TT_STOP:
+                if depth == 0:
+                    break
+                depth -= 1
+            elif token.type == lexer.TT_KEYWORD and token.value in BLOCK_OPENERS:
+                depth += 1
+        # Parsing stops here even if the body turns out to be malformed, and
+        # reports running out of tokens just after the closing '.'
+        # (TokenView has no raw offsets, so go through the end Position)
+        end = token.end
+        tokens.append(
+            lexer.Token(lexer.TT_EOF, lexer.TT_EOF, end.index, end.index, end.source)
         )
+        return tokens
 
-    def skip_newlines(self, res=ParserResult()):
+    def skip_newlines(self):
         while (
             self.current_token != None and self.current_token.type == lexer.TT_NEWLINE
         ):
-            res.register_advance()
             self.advance()
 
-    def skip_commas(self, res):
+    def skip_commas(self):
         while self.current_token != None and self.current_token.type == lexer.TT_COMMA:
-            res.register_advance()
             self.advance()
 
 
 def print_ast(node, indent=""):
     """
-    Recursively print the AST in a hierarchical, readable format.
+    Print the AST in a hierarchical, readable format.
 
     Args:
-    node: The current AST node
-    indent: The current indentation level (string of spaces)
+    node: The root AST node
+    indent: The indentation of the root (string of spaces)
+
+    Pending nodes are kept on an explicit stack, so deeply nested trees
+    print without recursion.
     """
-    # Print the current node's type and any relevant attributes
-    node_type = type(node).__name__
-    print(f"{indent}{node_type}", end="")
-
-    if hasattr(node, "value"):
-        print(f": {node.value}", end="")
-    elif hasattr(node, "token"):
-        print(f": {node.token.type} '{node.token.value}'", end="")
-    elif hasattr(node, "variable_name"):
-        print(f": {node.variable_name}", end="")
-    elif hasattr(node, "function_name"):
-        print(f": {node.function_name}", end="")
-    elif hasattr(node, "class_name"):
-        print(f": {node.class_name}", end="")
-
-    print()  # New line
-
-    # Recursively print child nodes
-    new_indent = indent + "  "
-    if hasattr(node, "statements"):
-        for stmt in node.statements:
-            print_ast(stmt, new_indent)
-    elif hasattr(node, "body"):
-        for item in node.body:
-            print_ast(item, new_indent)
-    elif hasattr(node, "left"):
-        print_ast(node.left, new_indent)
-        print_ast(node.right, new_indent)
-    elif hasattr(node, "condition_expr"):
-        print(f"{new_indent}Condition:")
-        print_ast(node.condition_expr, new_indent + "  ")
-        print(f"{new_indent}Then:")
-        for stmt in node.then_expr:
-            print_ast(stmt, new_indent + "  ")
-        if hasattr(node, "otherwise_expr") and node.otherwise_expr:
-            print(f"{new_indent}Otherwise:")
-            for stmt in node.otherwise_expr:
-                print_ast(stmt, new_indent + "  ")
-    elif hasattr(node, "value_node"):
-        print_ast(node.value_node, new_indent)
-
-
-def run(filename):
-
-    tokens, error = lexer.generate(filename)
+    # Each entry is a (node, indent) pair, or a heading line to print as is
+    stack = [(node, indent)]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, str):
+            print(entry)
+            continue
+        node, indent = entry
+
+        # Print the current node's type and any relevant attributes
+        node_type = type(node).__name__
+        print(f"{indent}{node_type}", end="")
+
+        if hasattr(node, "value"):
+            print(f": {node.value}", end="")
+        elif hasattr(node, "token"):
+            print(f": {node.token.type} '{node.token.value}'", end="")
+        elif hasattr(node, "variable_name"):
+            print(f": {node.variable_name}", end="")
+        elif hasattr(node, "function_name"):
+            print(f": {node.function_name}", end="")
+        elif hasattr(node, "class_name"):
+            print(f": {node.class_name}", end="")
+
+        print()  # New line
+
+        # Queue the child nodes, last first so they print in order
+        new_indent = indent + "  "
+        children = []
+        if hasattr(node, "statements"):
+            children = [(stmt, new_indent) for stmt in node.statements]
+        elif hasattr(node, "body"):
+            # Pre-parsed function bodies are not parsed yet
+            children = [(item, new_indent) for item in node.body or ()]
+        elif hasattr(node, "left"):
+            children = [(node.left, new_indent), (node.right, new_indent)]
+        elif hasattr(node, "condition_expr"):
+            children.append(f"{new_indent}Condition:")
+            children.append((node.condition_expr, new_indent + "  "))
+            children.append(f"{new_indent}Then:")
+            children += [(stmt, new_indent + "  ") for stmt in node.then_expr]
+            if hasattr(node, "otherwise_expr") and node.otherwise_expr:
+                children.append(f"{new_indent}Otherwise:")
+                children += [(stmt, new_indent + "  ") for stmt in node.otherwise_expr]
+        elif hasattr(node, "value_node"):
+            children = [(node.value_node, new_indent)]
+        elif hasattr(node, "node"):
+            children = [(node.node, new_indent)]
+        stack.extend(reversed(children))
+
+
+def run(
+    filename, stream=False, compact=False, use_cache=True, workers=None, lazy=False
+):
+
+    if use_cache:
+        key = cache.source_key(filename, CACHE_VERSION)
+        path = cache.entry_path(filename, "lazy-ast" if lazy else "ast")
+        node = cache.load(path, key)
+        if node is not None:
+            print_ast(node)
+            return node, None
+
+    if stream:
+        tokens, error = lexer.generate_stream(filename), None
+    else:
+        tokens, error = lexer.generate(filename, compact=compact, workers=workers)
     if error == None:
-        parser = Parser(tokens)
+        parser = Parser(tokens, lazy)
         ast: ParserResult | None = parser.parse()
         if ast is None:
             return None, "Invalid syntax"
+        if ast.error is None:
+            error = resolver.resolve(ast.node)
+            if error is None:
+                ast.node.removed = optimizer.eliminate_dead_code(ast.node)
+        # Print the tree that gets cached, so a cache hit prints the same
         print_ast(ast.node)
+        if error is not None:
+            return None, error
 
+        if use_cache and ast.error is None:
+            cache.store(path, key, ast.node)
         return ast.node, ast.error
     else:
         return None, error.print()
@@ -0,0 +1,216 @@
+"""
+Name resolution for SimplyLang.
+
+Runs over the parsed AST once, after parsing, and checks every name against
+a chain of scopes: the program is the outermost scope and each function body
+opens a new one holding its parameters. Functions are hoisted, so a call may
+appear before the definition it refers to, and function bodies are resolved
+only once their enclosing scope is complete, so they can see every name it
+defines; a pre-parsed body keeps that scope chain and is resolved when it
+is first parsed. Each VariableAccessNode, ReturnNode and FunctionCallNode is
+annotated with the Binding its name resolved to.
+
+Scopes are keyed on the symbol id the lexer's InternTable gave each name's
+token, so resolving compares small integers rather than name strings.
+"""
+
+from collections import deque
+
+import lexer
+import parser as Pr
+
+
+class Binding:
+    def __init__(self, name, kind, node=None, depth=0):
+        self.name = name
+        self.kind = kind  # "function", "variable" or "parameter"
+        self.node = node
+        self.depth = depth
+
+    def __repr__(self) -> str:
+        return f"Binding({self.name!r}, {self.kind}, depth={self.depth})"
+
+
+class Resolver:
+    def __init__(self, scopes=None):
+        self.scopes: list[dict[int, Binding]] = list(scopes or ())
+        # Functions defined in each open scope, queued when it closes
+        self.functions: list[list[Pr.FunctionNode]] = []
+        # Function bodies waiting to be resolved, each with its scope chain
+        self.pending: deque[tuple[Pr.FunctionNode, list]] = deque()
+
+    def resolve(self, tree):
+        """Resolve a whole program; return the first name error, or None."""
+        try:
+            self.resolve_block(tree.statements)
+            self.resolve_pending()
+        except Pr.ParseError as e:
+            return e.error
+        return None
+
+    def resolve_function(self, body, parameters):
+        """
+        Resolve a pre-parsed function body once it has been parsed.
+        `parameters` are the parameter name tokens.
+        """
+        try:
+            self.resolve_block(body, parameters)
+            self.resolve_pending()
+        except Pr.ParseError as e:
+            return e.error
+        return None
+
+    def resolve_block(self, statements, parameters=()):
+        depth = len(self.scopes)
+        scope = {
+            token.symbol: Binding(token.value, "parameter", depth=depth)
+            for token in parameters
+        }
+        self.scopes.append(scope)
+        self.functions.append([])
+
+        for statement in statements:
+            if isinstance(statement, Pr.FunctionNode):
+                self.declare_function(scope, statement, depth)
+        # Loop bodies share the enclosing scope and are walked with an
+        # explicit stack, so deep nesting does not grow the Python stack
+        stack = list(reversed(statements))
+        while stack:
+            statement = stack.pop()
+            if isinstance(statement, Pr.TillNode):
+                self.visit(statement.condition_expr)
+                stack.extend(reversed(statement.body))
+            elif isinstance(statement, Pr.RepeatNode):
+                stack.extend(reversed(statement.body))
+            else:
+                self.visit(statement)
+        # Bodies see the whole enclosing scope, including later assignments
+        for function in self.functions.pop():
+            if function.body is None:
+                # Pre-parsed: resolved against this chain when first called
+                function.scopes = list(self.scopes)
+            else:
+                self.pending.append((function, list(self.scopes)))
+
+        self.scopes.pop()
+
+    def resolve_pending(self):
+        while self.pending:
+            function, self.scopes = self.pending.popleft()
+            self.resolve_block(function.body, function.parameters)
+
+    def declare_function(self, scope, node, depth):
+        name = node.function_name
+        binding = scope.get(name.symbol)
+        if binding is not None and binding.kind == "function":
+            raise Pr.ParseError(
+                lexer.InvalidSyntaxError(
+                    f"Function Name {name.value} already defined", name.start, name.end
+                )
+            )
+        scope[name.symbol] = Binding(name.value, "function", node, depth)
+
+    def declare(self, token, node):
+        scope = self.scopes[-1]
+        if token.symbol not in scope:
+            scope[token.symbol] = Binding(
+                token.value, "variable", node, len(self.scopes) - 1
+            )
+
+    def lookup(self, token):
+        symbol = token.symbol
+        for scope in reversed(self.scopes):
+            binding = scope.get(symbol)
+            if binding is not None:
+                return binding
+        return None
+
+    def lookup_or_fail(self, token):
+        binding = self.lookup(token)
+        if binding is None:
+            raise Pr.ParseError(
+                lexer.InvalidSyntaxError(
+                    f"Variable Name {token.value} not defined", token.start, token.end
+                )
+            )
+        return binding
+
+    def visit(self, node):
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        # Literals (bare tokens, raw strings, numbers) bind no names
+        if method is not None:
+            method(node)
+
+    def visit_StatementsNode(self, node):
+        self.resolve_block(node.statements)
+
+    def visit_FunctionNode(self, node):
+        scope = self.scopes[-1]
+        binding = scope.get(node.function_name.symbol)
+        # Functions nested in a loop body are not hoisted
+        if binding is None or binding.node is not node:
+            self.declare_function(scope, node, len(self.scopes) - 1)
+        self.functions[-1].append(node)
+
+    def visit_VariableNode(self, node):
+        self.visit(node.value_node)
+        self.declare(node.variable_name, node)
+
+    def visit_VariableFunctionNode(self, node):
+        self.visit(node.value_node)
+        # The parser names these after the function they call, and the
+        # enclosing VariableNode declares the real target; declaring the
+        # callee here would shadow the function for later calls
+        binding = self.lookup(node.variable_name)
+        if binding is None or binding.kind != "function":
+            self.declare(node.variable_name, node)
+
+    def visit_VariableAccessNode(self, node):
+        node.binding = self.lookup_or_fail(node.variable_name)
+
+    def visit_FunctionCallNode(self, node):
+        binding = self.lookup(node.function)
+        if binding is None or binding.kind != "function":
+            raise Pr.ParseError(
+                lexer.InvalidSyntaxError(
+                    f"Function Name {node.function_name} not defined",
+                    node.pos_start,
+                    node.pos_end,
+                )
+            )
+        node.binding = binding
+        for token in node.parameters:
+            if token.type == lexer.TT_IDENTIFIER:
+                self.lookup_or_fail(token)
+
+    def visit_ReturnNode(self, node):
+        token = node.token
+        if token.type == lexer.TT_IDENTIFIER:
+            node.binding = self.lookup_or_fail(token)
+
+    def visit_ReturnExprNode(self, node):
+        self.visit(node.token)
+
+    def visit_ShowNode(self, node):
+        for item in node.body:
+            self.visit(item)
+
+    def visit_BinaryOperationNode(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UniaryOperatorNode(self, node):
+        self.visit(node.node)
+
+    def visit_TillNode(self, node):
+        self.visit(node.condition_expr)
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_RepeatNode(self, node):
+        for statement in node.body:
+            self.visit(statement)
+
+
+def resolve(tree):
+    return Resolver().resolve(tree)
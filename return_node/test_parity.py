@@ -0,0 +1,603 @@
+"""
+Parity checks between the SimplyLang engines, run over every stage's
+simply.txt: each alternative must produce exactly what the original does.
+
+Run with `python -m pytest` from this directory.
+"""
+
+import contextlib
+import glob
+import io
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+import benchmark
+import cache
+import codegen
+import interpreter
+import lexer
+import parser as Pr
+import resolver
+import tiering
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = sorted(glob.glob(os.path.join(HERE, "..", "*", "simply.txt")))
+
+
+def stage_name(filename):
+    return os.path.basename(os.path.dirname(filename))
+
+
+def fields(tokens):
+    """Type, value and position of each token."""
+    return [
+        (token.type, token.value, token.start.index, token.end.index)
+        for token in tokens
+    ]
+
+
+def classic_tokens(filename):
+    tokens, error = lexer.generate(filename, engine="classic")
+    assert error is None
+    return fields(tokens)
+
+
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_table_lexer(filename):
+    tokens, error = lexer.generate(filename, engine="table")
+    assert error is None
+    assert fields(tokens) == classic_tokens(filename)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, lexer.CHUNK_SIZE])
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_streamed_tokens(filename, chunk_size):
+    # Small chunks make tokens straddle chunk boundaries
+    with open(filename) as f:
+        tokens = list(lexer.Lex("", filename).iter_tokens(f, chunk_size))
+    assert fields(tokens) == classic_tokens(filename)
+
+
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_mapped_tokens(filename):
+    tokens = lexer.generate_mapped(filename)
+    assert tokens is not None
+    assert fields(tokens) == classic_tokens(filename)
+
+
+@pytest.mark.parametrize("newline", ["\r", "\r\n"])
+def test_mapped_line_endings(tmp_path, newline):
+    # Text mode reads both endings as "\n"; the mapped path must agree
+    filename = tmp_path / "simply.txt"
+    filename.write_bytes(f"x is 1 .{newline}show(x) .{newline}".encode("ascii"))
+    tokens, error = lexer.generate(str(filename), mapped=True)
+    assert error is None
+    assert fields(tokens) == classic_tokens(filename)
+
+
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_parallel_tokens(filename):
+    with open(filename) as f:
+        text = f.read()
+    # Tiny chunks make even these files split across the pool
+    tokens = lexer.generate_parallel(text, filename, workers=2, chunk_size=16)
+    assert fields(tokens) == classic_tokens(filename)
+
+
+# Every escape, an unknown one kept as written, and an unterminated string
+# whose escaped quote must not close it
+ESCAPE_TEXT = (
+    'show("a\\nb", "c\\td", "say \\"hi\\"", "back\\\\slash", "odd\\q") .\n'
+    'show("open\\" .\n'
+)
+ESCAPE_STRINGS = ["a\nb", "c\td", 'say "hi"', "back\\slash", "odd\\q", 'open" .\n']
+
+
+@pytest.mark.parametrize("engine", ["classic", "table", "stream", "mapped", "parallel"])
+def test_string_escapes(tmp_path, engine):
+    filename = tmp_path / "simply.txt"
+    filename.write_text(ESCAPE_TEXT)
+    if engine == "stream":
+        tokens = list(lexer.generate_stream(str(filename), chunk_size=3))
+    elif engine == "mapped":
+        tokens = lexer.generate_mapped(str(filename))
+    elif engine == "parallel":
+        tokens = lexer.generate_parallel(ESCAPE_TEXT, str(filename), workers=2, chunk_size=16)
+    else:
+        tokens, error = lexer.generate(str(filename), engine=engine)
+        assert error is None
+    strings = [token.value for token in tokens if token.type == lexer.TT_STRING]
+    assert strings == ESCAPE_STRINGS
+    assert tokens[-1].type == lexer.TT_EOF
+
+
+def test_resolve_parallel_symbols():
+    # Scopes are keyed on symbol ids, which the chunks renumber to agree
+    text = "alpha is 1 .\nbeta is alpha + 1 .\nshow(alpha, beta) .\n" * 4
+    tokens = lexer.generate_parallel(text, "simply.txt", workers=2, chunk_size=16)
+    tree = Pr.Parser(tokens).parse()
+    assert tree.error is None
+    assert resolver.resolve(tree.node) is None
+    access = tree.node.statements[-1].body[1]
+    assert access.binding.name == "beta"
+    assert access.binding.node is tree.node.statements[1]
+
+
+COMMENTS = benchmark.load_lexer(os.path.join(HERE, "..", "comments"))
+COMMENT_CASES = {
+    "line": ("show(1) // show(2)\nshow(3)", ["show", "(", 1, ")", "\n", "show", "(", 3, ")"]),
+    "line at end": ("show(1) // no newline", ["show", "(", 1, ")"]),
+    "block": ("show(1 /* a\n b */ + 2)", ["show", "(", 1, "+", 2, ")"]),
+    "unterminated block": ("show(1) /* show(2)\nshow(3)", ["show", "(", 1, ")"]),
+    "in string": ('show("a // b /* c */")', ["show", "(", "a // b /* c */", ")"]),
+    "division": ("show(6 / 2)", ["show", "(", 6, "/", 2, ")"]),
+}
+
+
+@pytest.mark.parametrize("name", COMMENT_CASES)
+def test_comments(name):
+    text, expected = COMMENT_CASES[name]
+    tokens, error = COMMENTS.Lex(text, "simply.txt").create_token()
+    assert error is None
+    assert [token.value for token in tokens] == expected + [COMMENTS.TT_EOF]
+
+
+# Snippets typed into a file to exercise relex, including ones that merge
+# with or split the tokens around them
+EDITS = ["", "x", " ", "\n", '"', "12", "1.5", ".", "not ", "equals", "show(", ")"]
+
+
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_relex(filename):
+    with open(filename) as f:
+        text = f.read()
+    rng = random.Random(filename)
+    scanner = lexer.Lex(text, filename)
+    tokens, error = scanner.create_token()
+    for _ in range(50):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.randrange(4))
+        new_text = rng.choice(EDITS)
+        tokens, error = scanner.relex(tokens, (start, end), new_text)
+        text = text[:start] + new_text + text[end:]
+        expected, _ = lexer.Lex(text, filename).create_token()
+        assert error is None
+        assert fields(tokens) == fields(expected)
+
+
+def test_long_edit_session():
+    # The log is folded into the offsets every REBASE_EDITS edits, including
+    # for tokens left unread across several rebases
+    filename = STAGES[-1]
+    with open(filename) as f:
+        text = f.read()
+    rng = random.Random(0)
+    scanner = lexer.Lex(text, filename)
+    tokens, error = scanner.create_token()
+    for step in range(1, 301):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.randrange(4))
+        new_text = rng.choice(EDITS)
+        tokens, error = scanner.relex(tokens, (start, end), new_text)
+        text = text[:start] + new_text + text[end:]
+        assert len(scanner.source.edits) < lexer.REBASE_EDITS
+        if step % 75 == 0:
+            expected, _ = lexer.Lex(text, filename).create_token()
+            assert fields(tokens) == fields(expected)
+
+
+def test_relex_leaves_later_tokens():
+    # An edit only logs the shift; tokens after it catch up when read
+    text = "x is 1 .\n" * 100
+    scanner = lexer.Lex(text, "simply.txt")
+    tokens, _ = scanner.create_token()
+    tokens, _ = scanner.relex(tokens, (0, 0), "y is 2 .\n")
+    last = tokens[-1]
+    assert last.seen == 0
+    assert last.offset == len(text) + len("y is 2 .\n")
+    assert last.seen == 1
+
+
+# Expressions and their trees, fully parenthesised. The parser before the
+# Pratt rewrite agrees on the '-' chains and nested unary minus; it parsed
+# none of the others into one expression.
+PRECEDENCE = {
+    "2 + 3 * 4": "(2 + (3 * 4))",
+    "2 * 3 + 4": "((2 * 3) + 4)",
+    "8 - 3 - 2": "((8 - 3) - 2)",
+    "8 / 4 / 2": "((8 / 4) / 2)",
+    "-2 * 3": "((- 2) * 3)",
+    "- -2": "(- (- 2))",
+    "1 + 2 < 4": "((1 + 2) < 4)",
+    "4 > 1 - 2": "(4 > (1 - 2))",
+    "1 + 2 equals 3": "((1 + 2) equals 3)",
+    "1 not equals 2 - 1": "(1 not equals (2 - 1))",
+    "1 < 2 equals 3 > 4": "((1 < 2) equals (3 > 4))",
+    "(2 + 3) * 4": "((2 + 3) * 4)",
+    "1 - (2 - 3)": "(1 - (2 - 3))",
+}
+OPERATOR_NAMES = {lexer.TT_EQUAL: "equals", lexer.TT_NOT_EQUAL: "not equals"}
+
+
+def shape(node):
+    """Write an expression tree out with every operation parenthesised."""
+    if isinstance(node, Pr.BinaryOperationNode):
+        op = OPERATOR_NAMES.get(node.token.type, node.token.value)
+        return f"({shape(node.left)} {op} {shape(node.right)})"
+    if isinstance(node, Pr.UniaryOperatorNode):
+        return f"({node.token.value} {shape(node.node)})"
+    return str(node.token.value)
+
+
+@pytest.mark.parametrize("expression", PRECEDENCE)
+def test_precedence(tmp_path, expression):
+    tokens, error = lexer.Lex(f"show({expression}) .\n", "simply.txt").create_token()
+    tree = Pr.Parser(tokens).parse()
+    assert tree.error is None
+    [show] = tree.node.statements
+    assert shape(show.body[0]) == PRECEDENCE[expression]
+    # Python groups these operators the same way
+    text = expression.replace("not equals", "!=").replace("equals", "==")
+    result, error, output = run_program(tmp_path, f"show({expression}) .\n")
+    assert error is None and result.error is None
+    assert output.endswith(f"{eval(text)} \n")
+
+
+def run_program(tmp_path, text, **options):
+    """Run `text` as a program file, returning its result and the output it showed."""
+    filename = tmp_path / "simply.txt"
+    filename.write_text(text)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result, error = interpreter.run(str(filename), **options)
+    return result, error, output.getvalue()
+
+
+def test_boolean_literals(tmp_path):
+    text = "x is true .\nshow(x equals false, true, 1 equals true) .\n"
+    result, error, output = run_program(tmp_path, text)
+    assert error is None and result.error is None
+    assert output.endswith("False True True \n")
+
+
+def test_repeated_call_in_assignment(tmp_path):
+    # Assigning a call's result must not hide the function from later calls
+    text = (
+        "inc takes n does\n    return n\n.\n"
+        "twice takes v does\n    a is inc(v)\n    b is inc(v)\n    return b\n.\n"
+        "x is 1 .\ny is twice(x) .\nshow(y) .\n"
+    )
+    result, error, output = run_program(tmp_path, text)
+    assert error is None and result.error is None
+    assert output.endswith("1 \n")
+
+
+def nested_tills(depth):
+    """A program whose till loops nest `depth` deep."""
+    return (
+        "i is 0 .\n"
+        + "".join("    " * d + "till i < 1 do\n" for d in range(depth))
+        + "    " * depth
+        + "i is 1\n"
+        + "".join("    " * d + ".\n" for d in reversed(range(depth)))
+        + "show(i) .\n"
+    )
+
+
+def test_deep_block_positions(tmp_path):
+    # Block positions come from their innermost statements, however deep
+    depth = 1500
+    text = nested_tills(depth)
+    filename = tmp_path / "simply.txt"
+    filename.write_text(text)
+    tokens, error = lexer.generate(str(filename))
+    assert error is None
+    tree = Pr.Parser(tokens).parse()
+    assert tree.error is None
+    till = tree.node.statements[1]
+    assert Pr.start_of(till).line == 1
+    assert Pr.end_of(till).line == depth + 1
+
+
+def test_error_past_last_token(tmp_path):
+    # A stream that ends without EOF still reports where parsing stopped
+    filename = tmp_path / "simply.txt"
+    filename.write_text("show(1 +")
+    tokens, error = lexer.generate(str(filename))
+    tree = Pr.Parser(tokens[:-1]).parse()
+    assert tree.error.msg == "Expected an expression"
+    assert tree.error.print().endswith("show(1 +\n       ^")
+
+
+def test_malformed_lazy_body(tmp_path):
+    # The return takes the body's '.', so parsing runs out of tokens
+    text = "g takes a does\n    return 1 + a .\nx is 1 .\ny is g(x) .\n"
+    result, error, output = run_program(tmp_path, text, lazy=True)
+    assert error is None
+    assert result.error.msg == "Expected '.'"
+    assert result.error.print().endswith("    return 1 + a .\n                  ^")
+
+
+@pytest.mark.parametrize("options", [{"compact": True}, {"workers": 2}], ids=str)
+def test_lazy_body_token_views(tmp_path, options):
+    # Pre-parsed bodies end in a sentinel built from TokenView rows too
+    text = "g takes a does\n    b is a + 1\n    return b\n.\nx is 1 .\nshow(g(x)) .\n"
+    filename = tmp_path / "simply.txt"
+    filename.write_text(text)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tree, error = Pr.run(str(filename), lazy=True, use_cache=False, **options)
+        assert error is None
+        result = interpreter.Interpreter().visit(tree)
+    assert result.error is None
+    assert output.getvalue().endswith("2 \n")
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure"])
+def test_constant_positions(tmp_path, engine):
+    # Folded literals share a pooled value but keep their own positions
+    text = "x is 0 .\ny is 1 .\nz is 1 / x .\n"
+    result, error, output = run_program(tmp_path, text, engine=engine)
+    assert error is None
+    assert result.error.start.line == 2
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure"])
+def test_pooled_operand_positions(tmp_path, engine):
+    # Pooled values carry no position; the operation places their error
+    text = "x is 1 .\nz is x / 0 .\n"
+    result, error, output = run_program(tmp_path, text, engine=engine)
+    assert error is None
+    assert result.error.start.index == text.index("x /")
+    assert result.error.end.index == text.index(" .\n", 9)
+
+
+def test_error_positions_are_positions(tmp_path):
+    # Values keep the node they came from apart from their Positions
+    text = "x is 1 .\ny is 0 .\nz is x / y .\n"
+    result, error, output = run_program(tmp_path, text)
+    assert isinstance(result.error.start, lexer.Position)
+    assert isinstance(result.error.end, lexer.Position)
+    assert result.error.start.index == text.index("x /")
+
+
+def test_constant_results_are_fresh():
+    # A caller may fill in the result it gets; the next use must not see it
+    walker = interpreter.Interpreter()
+    node = Pr.ConstantNode(walker.constants.add(interpreter.Number(3)), None)
+    first = walker.visit(node)
+    first.failure(lexer.IllegalOperationError("Divide by zero", None, None))
+    second = walker.visit(node)
+    assert second.error is None
+    assert second.value is first.value
+
+
+class DoublingInterpreter(interpreter.Interpreter):
+    def visit_NumberNode(self, node):
+        return interpreter.InterpreterResult().success(
+            interpreter.Number(node.token.value * 2)
+        )
+
+
+def test_handler_override():
+    # The base class filling its table first must not hide the override
+    tokens, error = lexer.Lex("x is 1 + 2 .\n", "simply.txt").create_token()
+    tree = Pr.Parser(tokens).parse().node
+    walkers = [(interpreter.Interpreter(), 3), (DoublingInterpreter(), 6)]
+    for walker, expected in walkers:
+        assert walker.visit(tree).error is None
+        assert walker.symbol_table.get("x").value == expected
+    base = interpreter.Interpreter.handlers[Pr.NumberNode]
+    assert DoublingInterpreter.handlers[Pr.NumberNode] is not base
+
+
+def test_unknown_node():
+    class UnknownNode:
+        pass
+
+    with pytest.raises(Exception, match="No visit_UnknownNode method defined"):
+        interpreter.Interpreter().visit(UnknownNode())
+
+
+def test_negative_zero_constant(tmp_path):
+    text = "show(-4 * 0.0, 0.0) .\n"
+    result, error, output = run_program(tmp_path, text)
+    assert error is None and result.error is None
+    assert output.endswith("-0.0 0.0 \n")
+
+
+def test_dead_code_count(tmp_path):
+    text = "f takes n does\n    return n\n    show(n)\n.\nx is 1 .\ny is f(x) .\n"
+    filename = tmp_path / "simply.txt"
+    filename.write_text(text)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree, error = Pr.run(str(filename))
+        cached, error = Pr.run(str(filename))
+    assert error is None
+    assert tree.removed > 0
+    assert cached.removed == tree.removed
+
+
+def test_dead_loop_count(tmp_path):
+    # Loops that never run are cut before caching and counted with the rest
+    text = (
+        "x is 1 .\ntill 1 > 2 do\n    show(x)\n.\n"
+        "till -x < 0 do\n    x is x - 1\n.\nshow(x) .\n"
+    )
+    filename = tmp_path / "simply.txt"
+    filename.write_text(text)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tree, error = Pr.run(str(filename))
+        cached, error = Pr.run(str(filename))
+    assert error is None
+    assert tree.removed == 6
+    for loaded in (tree, cached):
+        assert [type(node) for node in loaded.statements] == [
+            Pr.VariableNode,
+            Pr.TillNode,
+            Pr.ShowNode,
+        ]
+        assert loaded.removed == 6
+
+
+@pytest.mark.parametrize("engine", ["tree", "python"])
+def test_cached_source_path(tmp_path, monkeypatch, engine):
+    # A cached tree or program re-reads its source for errors, from any
+    # directory
+    directory = tmp_path / "sub"
+    directory.mkdir()
+    (directory / "simply.txt").write_text("x is 0 .\ny is 1 / x .\n")
+    printed = []
+    for cwd, filename in ((directory, "simply.txt"), (tmp_path, "sub/simply.txt")):
+        monkeypatch.chdir(cwd)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result, error = interpreter.run(filename, engine=engine)
+        printed.append(result.error.print())
+    assert printed[0] == printed[1]
+
+
+def outcome(result, error, output):
+    """What a run printed and how it failed."""
+    if error is not None and not isinstance(error, str):
+        error = error.print()
+    failure = result.error.print() if result and result.error else None
+    return output, error, failure
+
+
+def engine_outcome(tmp_path, text, **options):
+    # A fresh parse each time, as parsing prints more than a cache hit
+    shutil.rmtree(tmp_path / cache.CACHE_DIR, ignore_errors=True)
+    try:
+        return outcome(*run_program(tmp_path, text, **options))
+    except Exception as e:
+        # Some stages stop the tree walker with an exception; so must the rest
+        return repr(e)
+
+
+@pytest.mark.parametrize("engine", ["closure", "vm", "python"])
+@pytest.mark.parametrize("filename", STAGES, ids=stage_name)
+def test_engine_output(tmp_path, filename, engine):
+    with open(filename) as f:
+        text = f.read()
+    expected = engine_outcome(tmp_path, text)
+    assert engine_outcome(tmp_path, text, engine=engine) == expected
+
+
+@pytest.mark.parametrize("engine", ["closure", "vm", "python"])
+def test_bool_variable_output(tmp_path, engine):
+    # Shown through a variable, a Bool prints its value, not its repr
+    text = "x is true .\nshow(x) .\n"
+    expected = engine_outcome(tmp_path, text)
+    assert expected[0].endswith("True \n")
+    assert engine_outcome(tmp_path, text, engine=engine) == expected
+
+
+@pytest.mark.parametrize("engine", ["closure", "vm", "python"])
+def test_call_arguments(tmp_path, engine):
+    # Arguments bind by name or literal, and a wrong count fails at the call
+    text = (
+        "add takes a, b does\n    c is a + b\n    return c\n.\n"
+        "x is 2 .\ny is add(x, 3) .\nshow(y) .\nz is add(x) .\n"
+    )
+    expected = engine_outcome(tmp_path, text)
+    assert "5 \n" in expected[0]
+    assert "Invalid number of parameters" in expected[2]
+    assert engine_outcome(tmp_path, text, engine=engine) == expected
+
+
+def test_tree_walker_nesting(tmp_path):
+    # The tree walker keeps its own stack, so depth is not bounded by
+    # Python's recursion limit
+    depth = sys.getrecursionlimit() + 500
+    result, error, output = run_program(tmp_path, nested_tills(depth), engine="tree")
+    assert error is None and result.error is None
+    assert output.endswith("1 \n")
+
+
+@pytest.mark.parametrize("engine", ["closure", "python"])
+def test_deep_nesting(tmp_path, monkeypatch, engine):
+    # Compiled engines recurse per level, but report that as an error.
+    # Generated Python only calls down once per outlined loop, so outline
+    # every one to go as deep without a much larger program.
+    monkeypatch.setattr(codegen, "MAX_DEPTH", 1)
+    result, error, output = run_program(tmp_path, nested_tills(1500), engine=engine)
+    assert error is None
+    assert result.error.msg == "Code is nested too deeply for this engine"
+
+
+# Programs whose loops and functions run past the tiering threshold; the
+# last two fail after their code has been compiled
+TIERED_PROGRAMS = {
+    "till": (
+        "i is 0 .\nt is 0 .\ntill i < 1500 do\n    i is i + 1\n"
+        "    t is t + i * 2\n.\nshow(i, t) .\n"
+    ),
+    "repeat": "t is 0 .\nrepeat 1500 times\n    t is t + 3\n.\nshow(t) .\n",
+    "function": (
+        "step takes n does\n    m is n + 1\n    return m\n.\n"
+        "i is 0 .\ntill i < 1500 do\n    i is step(i)\n.\nshow(i) .\n"
+    ),
+    "till error": (
+        "i is 0 .\nd is 1200 .\ntill i < 1500 do\n    i is i + 1\n"
+        "    d is d - 1\n    q is 100 / d\n.\nshow(i) .\n"
+    ),
+    "function error": (
+        "inverse takes n does\n    r is 1 / n\n    return r\n.\n"
+        "i is 1200 .\ntill i > 0 - 10 do\n    i is i - 1\n"
+        "    v is inverse(i)\n.\nshow(i) .\n"
+    ),
+}
+
+
+@pytest.mark.parametrize("threshold", [tiering.DEFAULT_THRESHOLD, 3])
+@pytest.mark.parametrize("name", list(TIERED_PROGRAMS))
+def test_tiered_output(tmp_path, name, threshold):
+    text = TIERED_PROGRAMS[name]
+    untiered = tiering.Tiering(None)
+    expected = engine_outcome(tmp_path, text, tiers=untiered)
+    tiers = tiering.Tiering(threshold)
+    assert engine_outcome(tmp_path, text, tiers=tiers) == expected
+    # The code did switch tiers partway through
+    assert tiers.transitions
+    assert tiers.transitions[0].tier == "compiled"
+
+
+def test_tiered_error_position(tmp_path):
+    text = TIERED_PROGRAMS["function error"]
+    results = []
+    for tiers in (tiering.Tiering(None), tiering.Tiering()):
+        result, error, output = run_program(tmp_path, text, tiers=tiers)
+        assert error is None
+        results.append(result.error)
+    untiered, tiered = results
+    assert tiered.msg == untiered.msg == "Divide by zero"
+    assert tiered.start.index == untiered.start.index == text.index("1 / n")
+    assert tiered.end.index == untiered.end.index
+
+
+@pytest.mark.parametrize("name", list(TIERED_PROGRAMS))
+def test_node_arena(tmp_path, name):
+    filename = tmp_path / "simply.txt"
+    filename.write_text(TIERED_PROGRAMS[name])
+    tokens, error = lexer.generate(str(filename), compact=True)
+    tree = Pr.Parser(tokens).parse().node
+    arena = Pr.NodeArena.from_tree(tree, tokens)
+    assert repr(arena.tree()) == repr(tree)
+    statements = arena.field(0, "statements")
+    assert [arena.kind(row) for row in statements] == list(map(type, tree.statements))
+
+
+def test_python_cache_settings(tmp_path):
+    # Folded and unfolded programs are cached apart
+    text = "show(-4 * 0.0, 0.0) .\n"
+    for optimize in (True, False, True):
+        result, error, output = run_program(
+            tmp_path, text, engine="python", optimize=optimize
+        )
+        assert output.endswith("-0.0 0.0 \n")
+    entries = os.listdir(tmp_path / cache.CACHE_DIR)
+    assert {"simply.txt.py", "simply.txt.optimized-py"} <= set(entries)
@@ -0,0 +1,162 @@
+"""
+Tiered execution for the SimplyLang tree walker.
+
+The interpreter counts every call of each function and every iteration of
+each till and repeat loop. Code starts out interpreted; once a counter
+reaches the threshold, that function or loop is compiled by the closure
+compiler in closure.py and the compiled form runs from then on. A loop
+that turns hot is compiled between two iterations and the compiled loop
+picks up where the interpreted one stopped.
+
+Compiled code works on the interpreter's own symbol table, so both tiers
+see the same variables. Code that is never hot is never compiled.
+Functions called from compiled code run compiled too, and are no longer
+counted.
+"""
+
+import time
+
+import closure
+import parser as Pr
+
+# Calls or iterations after which a function or loop is compiled
+DEFAULT_THRESHOLD = 1000
+
+
+class Counter:
+    """
+    Tier of one function or loop, and how many times it ran while it was
+    interpreted.
+    """
+
+    __slots__ = ("node", "kind", "count", "tier", "code", "seconds")
+
+    def __init__(self, node, kind):
+        self.node = node
+        self.kind = kind  # "function", "till" or "repeat"
+        self.count = 0
+        self.tier = "interpreted"  # then "compiled", or "uncompilable"
+        self.code = None
+        # Time spent compiling it
+        self.seconds = 0.0
+
+    @property
+    def name(self):
+        if self.kind == "function":
+            return self.node.function_name.value
+        return self.kind
+
+    @property
+    def line(self):
+        node = self.node.function_name if self.kind == "function" else self.node
+        start = Pr.start_of(node)
+        return None if start is None else start.line + 1
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "line": self.line,
+            "count": self.count,
+            "tier": self.tier,
+            "compile_seconds": self.seconds,
+        }
+
+    def __repr__(self) -> str:
+        return f"Counter({self.kind} {self.name!r}, count={self.count}, {self.tier})"
+
+
+class Tiering:
+    """
+    Counters and compiled code for one interpreter. A threshold of None
+    keeps counting without ever compiling.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.interpreter = None
+        self.compiler = None
+        # Counters by node id, in the order the nodes first ran
+        self.counters = {}
+        # Counters in the order their nodes were compiled
+        self.transitions = []
+
+    def bind(self, interpreter):
+        self.interpreter = interpreter
+
+    def code(self, node):
+        """Compiled code for `node`, or None while it is interpreted."""
+        counter = self.counters.get(id(node))
+        return None if counter is None else counter.code
+
+    def count(self, node, kind):
+        """
+        Count one call or iteration of `node`. Returns its compiled code
+        once the count reaches the threshold, and None before then.
+        """
+        counter = self.counters.get(id(node))
+        if counter is None:
+            counter = self.counters[id(node)] = Counter(node, kind)
+        counter.count += 1
+        if (
+            counter.tier == "interpreted"
+            and self.threshold is not None
+            and counter.count >= self.threshold
+        ):
+            self.promote(counter)
+        return counter.code
+
+    def promote(self, counter):
+        """Compile a hot function or loop and record the transition."""
+        if self.compiler is None:
+            interpreter = self.interpreter
+            self.compiler = closure.Compiler(
+                interpreter.constants, interpreter.optimizer
+            )
+            # Compiled code defines and calls functions in the same program
+            self.compiler.symbol_table = interpreter.symbol_table
+            self.compiler.function_list = interpreter.function_list
+        start = time.perf_counter()
+        try:
+            counter.code = self.compile(counter)
+        except RecursionError:
+            # Too deeply nested for closures; it stays interpreted
+            counter.tier = "uncompilable"
+        else:
+            counter.tier = "compiled"
+        counter.seconds = time.perf_counter() - start
+        self.transitions.append(counter)
+
+    def compile(self, counter):
+        node = counter.node
+        if counter.kind == "function":
+            body = self.compiler.function_body(node)
+
+            def call(env):
+                value = None
+                for statement in body:
+                    value = statement(env)
+                return value
+
+            return call
+        if counter.kind == "till":
+            # The loop checks its condition before each iteration, so it can
+            # take over between any two
+            return self.compiler.compile(node)
+        body = self.compiler.compile_block(node.body)
+
+        def repeat(env, times):
+            for _ in range(times):
+                for statement in body:
+                    value = statement(env)
+            return value  # type: ignore
+
+        return repeat
+
+    def stats(self):
+        """Counters of every function and loop that ran, and the tier changes."""
+        return {
+            "threshold": self.threshold,
+            "counters": [counter.as_dict() for counter in self.counters.values()],
+            "transitions": [counter.as_dict() for counter in self.transitions],
+        }
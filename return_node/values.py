@@ -0,0 +1,518 @@
+"""
+Runtime values shared by the SimplyLang execution engines, and the helpers
+the compiled engines use to operate on them.
+"""
+
+import operator
+
+import lexer as Lexer
+import parser as Pr
+
+
+def value_start(value):
+    """
+    Where `value` starts. The tree walker places values at their node
+    instead of at Positions, so the Position is only looked up here.
+    """
+    node = value.node
+    return value.pos_start if node is None else node.pos_start
+
+
+def value_end(value):
+    """Where `value` ends; see value_start()."""
+    node = value.node
+    return value.pos_end if node is None else node.pos_end
+
+
+class Bool:
+    def __init__(self, value):
+        self.value = value
+        self.set_pos()
+        self.set_context()
+
+    def set_pos(self, pos_start=None, pos_end=None):
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        self.node = None
+        return self
+
+    def set_node(self, node):
+        """Place the value at `node`, whose positions are only read for errors."""
+        self.node = node
+        return self
+
+    def set_context(self, context=None):
+        self.context = context
+        return self
+
+    def copy(self):
+        copy = Bool(self.value)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.node = self.node
+        copy.set_context(self.context)
+        return copy
+
+    def __repr__(self) -> str:
+        return str(self.value)
+
+    def isEquall(self, other):
+        if isinstance(other, Bool):
+            return (
+                Bool(self.value == other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Can't compare bool with {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def isNotEquall(self, other):
+        if isinstance(other, Bool):
+            return (
+                Bool(self.value != other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Can't compare bool with {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def and_with(self, other):
+        if isinstance(other, Bool):
+            return (
+                Bool(self.value and other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Can't perform AND with {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def or_with(self, other):
+        if isinstance(other, Bool):
+            return (
+                Bool(self.value or other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Can't perform OR with {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+
+class InterpreterResult:
+    def __init__(self):
+        self.value = None
+        self.error = None
+
+    def register(self, res):
+        if res.error:
+            self.error = res.error
+        return res.value
+
+    def success(self, value):
+        self.value = value
+        return self
+
+    def failure(self, error):
+        self.error = error
+        return self
+
+
+class Number:
+    def __init__(self, value):
+        self.value = value
+        self.set_pos()
+        self.set_context()
+
+    def set_pos(self, pos_start=None, pos_end=None):
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+        self.node = None
+        return self
+
+    def set_node(self, node):
+        """Place the value at `node`, whose positions are only read for errors."""
+        self.node = node
+        return self
+
+    def set_context(self, context=None):
+        self.context = context
+        return self
+
+    def add(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value + other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def minus(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value - other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def isLT(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value < other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def isEquall(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value == other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f" Cant compare Number with {type(other).__name__} ",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def isNotEquall(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value != other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def isGT(self, other):
+        """
+        This function is used to evaluate if the value of the current Number
+        instance is greater than the value of the other Number instance.
+
+        Parameters
+        ----------
+        other : Number
+            The other Number instance to compare with.
+
+        Returns
+        -------
+        Number, Error
+            A Number instance with the result of the comparison and an Error
+            instance if an error occurred during the comparison.
+
+        """
+        if isinstance(other, Number):
+            # Create a new Number instance with the result of the comparison.
+            # The value of the new Number instance is a boolean indicating if
+            # the value of the current Number instance is greater than the value
+            # of the other Number instance.
+            comparison_result = Number(self.value > other.value)
+
+            # Set the context of the new Number instance to the same context as
+            # the current Number instance.
+            comparison_result.set_context(self.context)
+
+            # Set the position of the new Number instance to be the same as the
+            # position of the current Number instance.
+            comparison_result.set_pos(self.pos_start, other.pos_end)
+
+            # Return the new Number instance and None (no error occurred).
+            return comparison_result, None
+
+    def mul(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value * other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def div(self, other):
+        if isinstance(other, Number):
+            if other.value == 0:
+                return None, Lexer.IllegalOperationError(
+                    "Divide by zero", value_start(self), value_end(other), self.context
+                )
+            return (
+                Number(self.value / other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+
+    def mod(self, other):
+        if isinstance(other, Number):
+            if other.value == 0:
+                return None, Lexer.IllegalOperationError(
+                    "Modulo by zero", value_start(self), value_end(other), self.context
+                )
+            return (
+                Number(self.value % other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Cannot perform modulo with Number and {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def pow(self, other):
+        if isinstance(other, Number):
+            return (
+                Number(self.value**other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Cannot perform power operation with Number and {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def floor_div(self, other):
+        if isinstance(other, Number):
+            if other.value == 0:
+                return None, Lexer.IllegalOperationError(
+                    "Floor division by zero",
+                    value_start(self),
+                    value_end(other),
+                    self.context,
+                )
+            return (
+                Number(self.value // other.value)
+                .set_context(self.context)
+                .set_pos(self.pos_start, other.pos_end),
+                None,
+            )
+        else:
+            return None, Lexer.IllegalOperationError(
+                f"Cannot perform floor division with Number and {type(other).__name__}",
+                value_start(self),
+                value_end(self),
+                self.context,
+            )
+
+    def copy(self):
+        copy = Number(self.value)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.node = self.node
+        copy.set_context(self.context)
+        return copy
+
+    def __repr__(self) -> str:
+        return str(self.value)
+
+
+class SymbolTable:
+    def __init__(self):
+        self.symbols = {}
+
+    def get(self, name):
+        value = self.symbols.get(name)
+        if value == None:
+            return None
+        return value
+
+    def set(self, name, value):
+        self.symbols[name] = value
+
+    def remove(self, name):
+        del self.symbols[name]
+
+
+class Failure(Exception):
+    """A runtime error raised out of compiled code."""
+
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+class Dispatch:
+    """
+    Mixin giving an engine a table of its handler methods by node class.
+    Handlers are named `prefix` plus the node class name, and `fallback`
+    handles classes without one; each is looked up by name only once.
+    """
+
+    prefix = "visit_"
+    fallback = "no_visit_method"
+    handlers: dict = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # A subclass may override handlers, so it needs its own table
+        cls.handlers = {}
+
+    def handler(self, node_type):
+        """Find the handler for `node_type` and remember it."""
+        cls = type(self)
+        handler = getattr(cls, cls.prefix + node_type.__name__, None)
+        if handler is None:
+            handler = getattr(cls, cls.fallback)
+        cls.handlers[node_type] = handler
+        return handler
+
+
+def call_targets(node, function_list):
+    """
+    The definitions a call runs, in order. The resolver links each call to
+    its definition, even one made before the definition runs; an unlinked
+    call looks through the functions defined so far.
+    """
+    binding = node.binding
+    functions = [binding.node] if binding is not None else function_list
+    return [f for f in functions if f.function_name.value == node.function_name]
+
+
+def arity_error(node, function):
+    """
+    The error for calling `function` with the wrong number of arguments, or
+    None. It has no position yet; the engine places it at the call.
+    """
+    if function.variables is None or len(node.parameters) == len(function.variables):
+        return None
+    return Lexer.InvalidSyntaxError(
+        f"'Invalid number of parameters are passed in function {node.function_name}'",
+        None,
+        None,
+    )
+
+
+def bind_arguments(node, function, env):
+    """
+    Bind a call's arguments to `function`'s parameters in the variables
+    `env`, or return arity_error() without binding any. An argument is the
+    value of the variable it names, or else the name or literal itself.
+    """
+    error = arity_error(node, function)
+    if error is not None or function.variables is None:
+        return error
+    for token, variable in zip(node.parameters, function.variables):
+        argument = token.value
+        value = env.get(argument)
+        env[variable] = value if value else argument
+    return None
+
+
+def too_deep(tree):
+    """
+    The error a compiled engine returns when the program nests deeper than
+    Python's recursion limit lets it compile or run.
+    """
+    statements = tree.statements
+    return Lexer.IllegalOperationError(
+        "Code is nested too deeply for this engine",
+        Pr.start_of(statements[0]),
+        Pr.end_of(statements[-1]),
+    )
+
+
+# Operators on two Numbers that cannot fail, as functions of their values
+NUMBER_OPERATIONS = {
+    Lexer.TT_ADD: operator.add,
+    Lexer.TT_PLUS: operator.add,
+    Lexer.TT_MINUS: operator.sub,
+    Lexer.TT_MUL: operator.mul,
+    Lexer.TT_LT: operator.lt,
+    Lexer.TT_GT: operator.gt,
+    Lexer.TT_EQUAL: operator.eq,
+    Lexer.TT_NOT_EQUAL: operator.ne,
+}
+
+
+def binary(token, left, right, start, end):
+    """Apply a binary operator exactly as Interpreter.visit_BinaryOperationNode does."""
+    if isinstance(left, Bool) or isinstance(right, Bool):
+        # Convert both operands to Bool if needed
+        if not isinstance(left, Bool):
+            left = Bool(bool(left.value if isinstance(left, Number) else left))
+        if not isinstance(right, Bool):
+            right = Bool(bool(right.value if isinstance(right, Number) else right))
+
+        if token.type == Lexer.TT_EQUAL:
+            result, error = left.isEquall(right)
+        elif token.type == Lexer.TT_NOT_EQUAL:
+            result, error = left.isNotEquall(right)
+        else:
+            raise Failure(
+                Lexer.InvalidSyntaxError(
+                    f"Invalid operator '{token.value}' for boolean values",
+                    token.start,
+                    token.end,
+                )
+            )
+    else:
+        if not isinstance(left, Number):
+            left = Number(left)
+        if not isinstance(right, Number):
+            right = Number(right)
+
+        if token.type in (Lexer.TT_ADD, Lexer.TT_PLUS):
+            result, error = left.add(right)  # type: ignore
+        elif token.type == Lexer.TT_MINUS:
+            result, error = left.minus(right)  # type: ignore
+        elif token.type == Lexer.TT_MUL:
+            result, error = left.mul(right)  # type: ignore
+        elif token.type == Lexer.TT_DIV:
+            result, error = left.div(right)  # type: ignore
+        elif token.type == Lexer.TT_LT:
+            result, error = left.isLT(right)  # type: ignore
+        elif token.type == Lexer.TT_GT:
+            result, error = left.isGT(right)  # type: ignore
+        elif token.type == Lexer.TT_EQUAL:
+            result, error = left.isEquall(right)
+        elif token.type == Lexer.TT_NOT_EQUAL:
+            result, error = left.isNotEquall(right)  # type: ignore
+        else:
+            raise Failure(
+                Lexer.InvalidSyntaxError(
+                    f"Invalid operator '{token.value}'", token.start, token.end
+                )
+            )
+
+    if error:
+        # Pooled constants carry no position; an operand without one starts
+        # or ends the operation
+        if error.start is None:
+            error.start = start
+        if error.end is None:
+            error.end = end
+        raise Failure(error)
+    return result.set_pos(start, end)  # type: ignore
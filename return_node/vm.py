@@ -0,0 +1,531 @@
+"""
+Bytecode compiler and virtual machine for SimplyLang.
+
+The Assembler turns an AST into Code: one opcode per instruction in an
+array('B'), its operand in a parallel array('H') (widened to 'I' for very
+large programs), and a constant pool the operands index into. Jumps name
+instruction indexes, so till and repeat loops are a conditional jump back
+to their condition, and a return jumps out of its function body. Each
+function body is assembled into its own Code the first time it is called.
+
+The VM runs Code in a single dispatch loop over an operand stack, with an
+explicit stack of call frames. Values carry no source positions; instead
+each instruction has an entry in the Code's line table, and errors raised
+while running an instruction are given its position, so runtime errors
+still point at the line and column that caused them.
+
+Output, results and error messages match the tree walker in
+interpreter.py.
+"""
+
+from array import array
+from types import GeneratorType
+
+import lexer as Lexer
+import parser as Pr
+from values import (
+    NUMBER_OPERATIONS,
+    Bool,
+    Dispatch,
+    Failure,
+    InterpreterResult,
+    Number,
+    SymbolTable,
+    binary,
+    bind_arguments,
+    call_targets,
+)
+
+# Opcodes
+CONST = 0  # push constants[arg]
+LOAD = 1  # push the variable constants[arg]; undefined if falsy
+STORE = 2  # set the variable constants[arg] to the top of the stack
+POP = 3
+BINARY = 4  # constants[arg] is (fast operation or None, operator token)
+UNARY = 5  # constants[arg] is the operator token
+JUMP = 6
+JUMP_IF_NOT_TRUE = 7  # pop a condition; jump unless its value is True
+REPEAT = 8  # push the iteration count constants[arg]
+LOOP = 9  # count down the count on top, or pop it and jump to arg
+STORE_RESULT = 10  # pop a value into the slot below a repeat's count
+PRINT = 11  # print constants[arg] as a show() argument
+SHOW_NAME = 12  # print the variable constants[arg] as a show() argument
+SHOW_VALUE = 13  # pop and print a computed show() argument
+NEWLINE = 14  # end a show(): print a newline and push "success"
+TRY = 15  # until END_TRY, a runtime error jumps to arg instead
+END_TRY = 16
+CALL = 17  # constants[arg] is the FunctionCallNode
+RETURN = 18  # return the top of the stack to the caller
+DEFINE = 19  # record the FunctionNode constants[arg] as defined
+LOAD_RETURN = 20  # push the variable constants[arg]; undefined if None
+CHECK_DEFINED = 21  # fail if the top is None; constants[arg] is the node
+UNKNOWN = 22  # fail on a node constants[arg] that cannot be run
+
+OPCODE_NAMES = [
+    "CONST",
+    "LOAD",
+    "STORE",
+    "POP",
+    "BINARY",
+    "UNARY",
+    "JUMP",
+    "JUMP_IF_NOT_TRUE",
+    "REPEAT",
+    "LOOP",
+    "STORE_RESULT",
+    "PRINT",
+    "SHOW_NAME",
+    "SHOW_VALUE",
+    "NEWLINE",
+    "TRY",
+    "END_TRY",
+    "CALL",
+    "RETURN",
+    "DEFINE",
+    "LOAD_RETURN",
+    "CHECK_DEFINED",
+    "UNKNOWN",
+]
+
+# Line table entry for an instruction with no source position
+NO_POSITION = 0xFFFFFFFF
+
+
+class Code:
+    """An assembled program or function body."""
+
+    __slots__ = ("ops", "args", "constants", "starts", "ends", "source")
+
+    def __init__(self, ops, args, constants, starts, ends, source):
+        self.ops = ops
+        self.args = args
+        self.constants = constants
+        # Line table: the source span of each instruction, as offsets
+        self.starts = starts
+        self.ends = ends
+        self.source = source
+
+    def __len__(self):
+        return len(self.ops)
+
+    def span(self, pc):
+        """Return the (start, end) Positions of instruction `pc`."""
+        return self.position(self.starts[pc]), self.position(self.ends[pc])
+
+    def position(self, offset):
+        if offset == NO_POSITION:
+            return None
+        return Lexer.Position(offset, self.source)
+
+
+class Assembler(Dispatch):
+    prefix = "assemble_"
+    fallback = "assemble_unknown"
+
+    def __init__(self, constants=None):
+        # Values the optimizer folded ConstantNodes into
+        self.pool = constants
+        self.ops = []
+        self.args = []
+        self.starts = []
+        self.ends = []
+        self.source = None
+        self.constants = []
+        # Constant indexes by identity, so each object is stored once
+        self.indexes = {}
+
+    def assemble_program(self, tree):
+        self.assemble(tree)
+        self.emit(RETURN)
+        return self.finish()
+
+    def assemble_function(self, statements):
+        """Assemble a function body, up to and including its first return."""
+        body = []
+        for statement in statements:
+            body.append(statement)
+            if isinstance(statement, (Pr.ReturnNode, Pr.ReturnExprNode)):
+                break
+        self.drive(self.block(body))
+        self.emit(RETURN)
+        return self.finish()
+
+    def finish(self):
+        # Operands stay 16-bit unless the program is too large for them
+        typecode = "H" if max(self.args, default=0) <= 0xFFFF else "I"
+        return Code(
+            array("B", self.ops),
+            array(typecode, self.args),
+            self.constants,
+            array("I", self.starts),
+            array("I", self.ends),
+            self.source,
+        )
+
+    def constant(self, value):
+        index = self.indexes.get(id(value))
+        if index is None:
+            index = self.indexes[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def emit(self, op, arg=0, node=None):
+        """Append an instruction and return its index."""
+        start = end = None
+        if node is not None:
+            start, end = Pr.start_of(node), Pr.end_of(node)
+        if start is not None and self.source is None:
+            self.source = start.source
+        self.ops.append(op)
+        self.args.append(arg)
+        self.starts.append(NO_POSITION if start is None else start.index)
+        self.ends.append(NO_POSITION if end is None else end.index)
+        return len(self.ops) - 1
+
+    def patch(self, index, target=None):
+        """Point the jump at `index` to `target`, or to the next instruction."""
+        self.args[index] = len(self.ops) if target is None else target
+
+    def assemble(self, node):
+        """
+        Assemble `node`. Handlers for blocks are generators that yield each
+        statement in the block to have it assembled, and nested blocks wait
+        on an explicit stack, so nesting depth is not limited by the
+        recursion limit.
+        """
+        self.drive(self.dispatch(node))
+
+    def drive(self, steps):
+        if not isinstance(steps, GeneratorType):
+            return
+        stack = [steps]
+        while stack:
+            try:
+                statement = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            steps = self.dispatch(statement)
+            if isinstance(steps, GeneratorType):
+                stack.append(steps)
+
+    def dispatch(self, node):
+        node_type = type(node)
+        handler = self.handlers.get(node_type) or self.handler(node_type)
+        return handler(self, node)
+
+    def block(self, statements):
+        """Assemble statements, leaving the last one's value on the stack."""
+        if not statements:
+            self.emit(CONST, self.constant(None))
+            return
+        for statement in statements[:-1]:
+            yield statement
+            self.emit(POP)
+        yield statements[-1]
+
+    def assemble_unknown(self, node):
+        # UNKNOWN raises when executed, so unreached nodes are harmless
+        self.emit(UNKNOWN, self.constant(node))
+
+    def assemble_StatementsNode(self, node):
+        yield from self.block(node.statements)
+
+    def assemble_ConstantNode(self, node):
+        self.emit(CONST, self.constant(self.pool.values[node.index]))
+
+    def assemble_NumberNode(self, node):
+        # VM values are never modified, so one Number serves every run
+        self.emit(CONST, self.constant(Number(node.token.value)))
+
+    def assemble_BoolNode(self, node):
+        self.emit(CONST, self.constant(Bool(node.token.value)))
+
+    def assemble_VariableNode(self, node):
+        self.assemble(node.value_node)
+        self.emit(STORE, self.constant(node.variable_name.value))
+
+    assemble_VariableFunctionNode = assemble_VariableNode
+
+    def assemble_VariableAccessNode(self, node):
+        self.emit(LOAD, self.constant(node.variable_name.value), node)
+
+    def assemble_FunctionNode(self, node):
+        self.emit(DEFINE, self.constant(node))
+
+    def assemble_FunctionCallNode(self, node):
+        self.emit(CALL, self.constant(node), node)
+
+    def assemble_ReturnNode(self, node):
+        token = node.token
+        if token.type == Lexer.TT_IDENTIFIER:
+            self.emit(LOAD_RETURN, self.constant(token.value), node)
+        else:
+            self.emit(CONST, self.constant(token))
+
+    def assemble_ReturnExprNode(self, node):
+        self.assemble(node.token)
+        self.emit(CHECK_DEFINED, self.constant(node), node)
+
+    def assemble_ShowNode(self, node):
+        for item in node.body:
+            if isinstance(item, (int, str, bool, float)):
+                self.emit(PRINT, self.constant(str(item).strip()))
+            elif isinstance(item, Pr.ConstantNode):
+                self.emit(PRINT, self.constant(self.pool.values[item.index]))
+            elif isinstance(item, Pr.VariableAccessNode):
+                self.emit(SHOW_NAME, self.constant(item.variable_name.value), node)
+            else:
+                # Like the tree walker, an argument that fails prints nothing
+                handler = self.emit(TRY)
+                self.assemble(item)
+                self.emit(END_TRY)
+                self.emit(SHOW_VALUE)
+                self.patch(handler)
+        self.emit(NEWLINE)
+
+    def assemble_UniaryOperatorNode(self, node):
+        self.assemble(node.node)
+        self.emit(UNARY, self.constant(node.token), node)
+
+    def assemble_BinaryOperationNode(self, node):
+        self.assemble(node.left)
+        self.assemble(node.right)
+        operation = (NUMBER_OPERATIONS.get(node.token.type), node.token)
+        self.emit(BINARY, self.constant(operation), node)
+
+    def assemble_TillNode(self, node):
+        condition = len(self.ops)
+        self.assemble(node.condition_expr)
+        exit = self.emit(JUMP_IF_NOT_TRUE, 0, node.condition_expr)
+        for statement in node.body:
+            yield statement
+            self.emit(POP)
+        self.emit(JUMP, condition)
+        self.patch(exit)
+        self.emit(CONST, self.constant(None))
+
+    def assemble_RepeatNode(self, node):
+        # The loop's value is its last statement's, kept below the count
+        self.emit(CONST, self.constant(None))
+        self.emit(REPEAT, self.constant(node.range))
+        loop = self.emit(LOOP)
+        if node.body:
+            for statement in node.body[:-1]:
+                yield statement
+                self.emit(POP)
+            yield node.body[-1]
+            self.emit(STORE_RESULT)
+        self.emit(JUMP, loop)
+        self.patch(loop)
+
+
+class VM:
+    def __init__(self, constants=None, optimizer=None):
+        self.symbol_table = SymbolTable()
+        self.function_list = []
+        # Pool the optimizer folded constants into
+        self.constants = constants
+        # Folds pre-parsed function bodies once they are parsed
+        self.optimizer = optimizer
+        # Assembled bodies of the functions called so far
+        self.bodies = {}
+
+    def run(self, tree):
+        """Assemble and run `tree`, returning an InterpreterResult."""
+        return self.execute(Assembler(self.constants).assemble_program(tree))
+
+    def function_body(self, function):
+        """Assemble `function`'s body on its first call, parsing it if needed."""
+        code = self.bodies.get(function)
+        if code is None:
+            if function.body is None:
+                error = function.parse_body()
+                if error is not None:
+                    raise Failure(error)
+                if self.optimizer is not None:
+                    self.optimizer.optimize_block(function.body)
+            code = Assembler(self.constants).assemble_function(function.body)
+            self.bodies[function] = code
+        return code
+
+    def call(self, node, env, code, pc):
+        """Bind a call's arguments and return the Code of its body, if any."""
+        body = None
+        for function in call_targets(node, self.function_list):
+            body = self.function_body(function)
+            error = bind_arguments(node, function, env)
+            if error is not None:
+                error.start, error.end = code.span(pc)
+                raise Failure(error)
+        return body
+
+    def execute(self, code):
+        env = self.symbol_table.symbols
+        stack = []
+        # Suspended callers, as (code, pc) pairs
+        frames = []
+        # Active TRY blocks, as (handler pc, stack depth, frame depth)
+        handlers = []
+        ops, args, constants = code.ops, code.args, code.constants
+        pc = 0
+        while True:
+            try:
+                while True:
+                    op = ops[pc]
+                    arg = args[pc]
+                    pc += 1
+                    if op == CONST:
+                        stack.append(constants[arg])
+                    elif op == LOAD:
+                        value = env.get(constants[arg])
+                        if not value:
+                            self.undefined(constants[arg], code, pc)
+                        stack.append(value)
+                    elif op == BINARY:
+                        right = stack.pop()
+                        left = stack[-1]
+                        operate, token = constants[arg]
+                        # Two plain Numbers never fail
+                        if (
+                            operate is not None
+                            and type(left) is Number
+                            and type(right) is Number
+                        ):
+                            result = Number(operate(left.value, right.value))
+                            result.context = left.context
+                        else:
+                            start, end = code.span(pc - 1)
+                            result = binary(token, left, right, start, end)
+                        stack[-1] = result
+                    elif op == STORE:
+                        env[constants[arg]] = stack[-1]
+                    elif op == POP:
+                        stack.pop()
+                    elif op == JUMP_IF_NOT_TRUE:
+                        if stack.pop().value is not True:
+                            pc = arg
+                    elif op == JUMP:
+                        pc = arg
+                    elif op == LOOP:
+                        if stack[-1]:
+                            stack[-1] -= 1
+                        else:
+                            stack.pop()
+                            pc = arg
+                    elif op == STORE_RESULT:
+                        stack[-2] = stack.pop()
+                    elif op == REPEAT:
+                        stack.append(constants[arg])
+                    elif op == CALL:
+                        body = self.call(constants[arg], env, code, pc - 1)
+                        if body is None:
+                            stack.append(None)
+                        else:
+                            frames.append((code, pc))
+                            code = body
+                            ops, args, constants = code.ops, code.args, code.constants
+                            pc = 0
+                    elif op == RETURN:
+                        if not frames:
+                            return InterpreterResult().success(stack.pop())
+                        code, pc = frames.pop()
+                        ops, args, constants = code.ops, code.args, code.constants
+                    elif op == PRINT:
+                        print(constants[arg], end=" ")
+                    elif op == SHOW_NAME:
+                        value = env.get(constants[arg])
+                        if value is None:
+                            self.undefined(constants[arg], code, pc)
+                        if isinstance(value, list):
+                            print(" ".join(map(str, value)), end=" ")
+                        else:
+                            print(value, end=" ")
+                    elif op == SHOW_VALUE:
+                        value = stack.pop()
+                        if value is not None:
+                            if isinstance(value, Bool):
+                                print(str(value.value).strip(), end=" ")
+                            else:
+                                print(value, end=" ")
+                    elif op == NEWLINE:
+                        print()
+                        stack.append("success")
+                    elif op == TRY:
+                        handlers.append((arg, len(stack), len(frames)))
+                    elif op == END_TRY:
+                        handlers.pop()
+                    elif op == UNARY:
+                        stack[-1] = self.unary(constants[arg], stack[-1], code, pc)
+                    elif op == DEFINE:
+                        self.function_list.append(constants[arg])
+                        stack.append(None)
+                    elif op == LOAD_RETURN:
+                        value = env.get(constants[arg])
+                        if value is None:
+                            self.undefined(constants[arg], code, pc)
+                        stack.append(value)
+                    elif op == CHECK_DEFINED:
+                        if stack[-1] is None:
+                            node = constants[arg]
+                            start, end = code.span(pc - 1)
+                            raise Failure(
+                                Lexer.InvalidSyntaxError(
+                                    f"'{node.token.value}' is not defined", start, end
+                                )
+                            )
+                    elif op == UNKNOWN:
+                        node = constants[arg]
+                        raise Exception(
+                            f"No visit_{type(node).__name__} method defined"
+                        )
+                    else:
+                        raise ValueError(f"Bad opcode {op} at {pc - 1}")
+            except Failure as failure:
+                error = failure.error
+                if error.start is None or isinstance(
+                    error, Lexer.IllegalOperationError
+                ):
+                    # Errors from operating on values would point wherever
+                    # the values came from; point at the operation instead
+                    error.start, error.end = code.span(pc - 1)
+                if not handlers:
+                    return InterpreterResult().failure(error)
+                pc, depth, frame_depth = handlers.pop()
+                del stack[depth:]
+                if frame_depth < len(frames):
+                    code = frames[frame_depth][0]
+                    del frames[frame_depth:]
+                    ops, args, constants = code.ops, code.args, code.constants
+
+    def undefined(self, name, code, pc):
+        start, end = code.span(pc - 1)
+        raise Failure(Lexer.InvalidSyntaxError(f"'{name}' is not defined", start, end))
+
+    def unary(self, token, value, code, pc):
+        if not isinstance(value, Number):
+            start, end = code.span(pc - 1)
+            raise Failure(
+                Lexer.IllegalOperationError(
+                    f"Can't apply '{token.value}' to {type(value).__name__}",
+                    start,
+                    end,
+                )
+            )
+        if token.type == Lexer.TT_MINUS:
+            return Number(-value.value).set_context(value.context)
+        return value
+
+
+def disassemble(code):
+    """Return a readable listing of `code`, one instruction per line."""
+    lines = []
+    for pc, (op, arg) in enumerate(zip(code.ops, code.args)):
+        line = f"{pc:>5} {OPCODE_NAMES[op]:<16} {arg}"
+        if op in (CONST, LOAD, STORE, PRINT, SHOW_NAME, LOAD_RETURN, REPEAT):
+            line += f" ({code.constants[arg]!r})"
+        start = code.position(code.starts[pc])
+        if start is not None:
+            line += f"  @{start.line + 1}:{start.column + 1}"
+        lines.append(line)
+    return "\n".join(lines)